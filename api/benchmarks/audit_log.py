@@ -0,0 +1,103 @@
+"""
+Per-request overhead of the access log: a minimal ASGI app called directly (no network), bare and wrapped in
+`AccessLogMiddleware` with the log disabled and enabled, against a middleware that calls the standard `logging` module
+with a file handler on the request path. The writer thread runs during the measurement, so its serialization and
+writes compete with the requests for the GIL as they would in a worker.
+
+Then a burst of records much larger than the queue shows how many are dropped rather than waited for.
+
+Usage (from the api directory): python -m benchmarks.audit_log [-n REQUESTS] [--burst RECORDS]
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+SCOPE = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+    "path": "/api/v1/auth", "raw_path": b"/api/v1/auth", "query_string": b"", "root_path": "", "headers": [],
+    "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+}
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+class LoggingMiddleware:
+    """The naive alternative: a `logging` call (formatting and a file write) per request."""
+
+    def __init__(self, app, logger: logging.Logger):
+        self.app = app
+        self.logger = logger
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        await self.app(scope, receive, send)
+        self.logger.info(json.dumps({
+            "event": "access", "method": scope["method"], "path": scope["path"],
+            "ms": round((time.perf_counter() - started) * 1000, 3), "client": scope["client"][0],
+        }))
+
+async def measure(app, n: int) -> tuple[float, float]:
+    """Wall-clock and CPU time per request, in microseconds."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(100):
+        await app(dict(SCOPE), receive, send)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(n):
+        await app(dict(SCOPE), receive, send)
+    return (time.perf_counter() - started) / n * 1e6, (time.process_time() - cpu_started) / n * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=100000, help="requests per case")
+    parser.add_argument("--burst", type=int, default=200000, help="records recorded at once into a 10000 record queue")
+    args = parser.parse_args()
+    from app.audit import AccessLogMiddleware, AuditLog
+
+    with tempfile.TemporaryDirectory() as tmp:
+        handler = logging.FileHandler(os.path.join(tmp, "logging.log"))
+        naive_logger = logging.getLogger("benchmark.access")
+        naive_logger.addHandler(handler)
+        naive_logger.setLevel(logging.INFO)
+        naive_logger.propagate = False
+        enabled = AuditLog(os.path.join(tmp, "audit.jsonl"), queue_size=10 * args.n)
+        enabled.start()
+        cases = {
+            "bare app": endpoint,
+            "access log disabled": AccessLogMiddleware(endpoint, AuditLog(None)),
+            "access log enabled": AccessLogMiddleware(endpoint, enabled),
+            "logging.FileHandler": LoggingMiddleware(endpoint, naive_logger),
+        }
+        print(f"{'case':<22} {'us/request':>11} {'cpu us/request':>15}")
+        for name, app in cases.items():
+            wall, cpu = asyncio.run(measure(app, args.n))
+            print(f"{name:<22} {wall:>11.2f} {cpu:>15.2f}")
+        started = time.perf_counter()
+        enabled.stop()
+        stats = enabled.stats()
+        print(f"\nwriter: {stats['written']} records in {stats['batches']} batches, "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms to drain the rest on stop")
+
+        burst = AuditLog(os.path.join(tmp, "burst.jsonl"), queue_size=10000)
+        burst.start()
+        started = time.perf_counter()
+        for i in range(args.burst):
+            burst.record("access", i=i)
+        elapsed = time.perf_counter() - started
+        burst.stop()
+        stats = burst.stats()
+        print(f"burst: {args.burst} records in {elapsed * 1000:.1f} ms ({elapsed / args.burst * 1e9:.0f} ns each), "
+              f"{stats['written']} written, {stats['dropped']} dropped")
+        handler.close()
+
+if __name__ == "__main__":
+    main()
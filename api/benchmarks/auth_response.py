@@ -0,0 +1,106 @@
+"""
+Measure the response bytes and CPU time per `/auth` request: the previous handler (a dict serialized by FastAPI's
+default encoder) against the current one with the standard-library and orjson response classes, and a revalidation
+answered with 304 Not Modified.
+
+The routes are called directly as ASGI apps (no middleware, no network) with AUTH_TRUST_JWT_CLAIMS=true, so the
+database is not involved and the numbers isolate routing, the user dependency and serialization.
+
+Usage (from the api directory): python -m benchmarks.auth_response [-n REQUESTS]
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+def prepare_environment() -> None:
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret-0123456789")
+    os.environ["AUTH_TRUST_JWT_CLAIMS"] = "true"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+async def call(app, headers: list[tuple[bytes, bytes]]) -> tuple[int, dict[bytes, bytes], int]:
+    """One GET /api/v1/auth; returns the status, the response headers and the size of the headers and body."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/v1/auth", "raw_path": b"/api/v1/auth", "query_string": b"", "root_path": "",
+        "headers": headers, "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    status, size, response_headers = 0, 0, {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status, size, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = dict(message["headers"])
+            size += sum(len(name) + len(value) + 4 for name, value in message["headers"])
+        else:
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, response_headers, size
+
+async def measure(app, headers: list[tuple[bytes, bytes]], n: int) -> tuple[int, int, float]:
+    await call(app, headers)
+    started = time.process_time()
+    for _ in range(n):
+        status, _, size = await call(app, headers)
+    return status, size, (time.process_time() - started) / n
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5000, help="requests per case")
+    args = parser.parse_args()
+    prepare_environment()
+    from fastapi import Depends, FastAPI
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    import app.auth as auth
+    from app.responses import json_response_class
+    from app.tokens import configure_jwt, encode_token
+    from app.users import UserSnapshot
+
+    configure_jwt()
+    token = encode_token({"sub": str(uuid.uuid4()), "email": "bench@example.com", "name": "Bench User",
+                          "is_admin": False, "exp": int(time.time()) + 3600})
+    authorization = (b"authorization", f"Bearer {token}".encode())
+
+    previous = FastAPI()
+
+    @previous.get("/api/v1/auth")
+    async def get_authenticated_user(user: UserSnapshot = Depends(auth.current_user)):
+        return {
+            "id": str(user.id),
+            "email": user.email,
+            "name": user.name,
+            "last_login": user.last_login.isoformat() if user.last_login else None,
+            "is_active": user.is_active,
+            "is_admin": user.is_admin,
+        }
+
+    current = FastAPI()
+    current.include_router(auth.auth_router, prefix="/api/v1")
+    classes = {"json": JSONResponse}
+    if json_response_class("auto") is ORJSONResponse:
+        classes["orjson"] = ORJSONResponse
+
+    async def run() -> None:
+        cases = [("previous handler", previous, JSONResponse, [authorization])]
+        cases += [(f"etag, {name}", current, cls, [authorization]) for name, cls in classes.items()]
+        default = auth.DefaultJSONResponse
+        for name, app, cls, headers in cases:
+            auth.DefaultJSONResponse = cls
+            status, size, cpu = await measure(app, headers, args.n)
+            print(f"{name:<20} {status} {size:>5} bytes {cpu * 1e6:>8.1f} us CPU/request")
+        auth.DefaultJSONResponse = default
+        _, response_headers, _ = await call(current, [authorization])
+        not_modified = [authorization, (b"if-none-match", response_headers[b"etag"])]
+        status, size, cpu = await measure(current, not_modified, args.n)
+        print(f"{'etag, not modified':<20} {status} {size:>5} bytes {cpu * 1e6:>8.1f} us CPU/request")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cold start of a server process: time to first request, and the latency of a new worker's first requests.
+
+Each run starts a fresh server with one worker and measures:
+
+- ready: from spawning the process to the first successful readiness probe
+- first_auth / first_healthcheck: the first `/auth` (valid token) and healthcheck requests after that
+- warm_auth: the median of the following `/auth` requests
+
+for plain `uvicorn app:my_app`, and for `app.server` without and with warm-up (WARMUP). Each request uses a new
+connection, as a load balancer spreading requests over workers would.
+
+Usage (from the api directory): python -m benchmarks.coldstart [-n RUNS] [--warm-requests N] [--database-url URL]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+import http.client
+from benchmarks.load import _free_port, prepare_environment
+
+def create_token() -> str:
+    """A token of a user in the database, so that `/auth` answers 200."""
+    from app.auth import create_jwt
+    from app.db import dispose_engines, get_engine, get_session
+    from app.migrations import ensure_schema
+    from app.users import find_or_create_user
+    ensure_schema(get_engine())
+    with get_session(get_engine()) as session:
+        token = create_jwt(find_or_create_user(session, "bench-coldstart@example.com", "Bench Coldstart"))
+    dispose_engines()
+    return token
+
+def server_commands(port: int) -> dict[str, tuple[list[str], dict[str, str]]]:
+    uvicorn = [sys.executable, "-m", "uvicorn", "app:my_app", "--port", str(port), "--no-access-log"]
+    serve = [sys.executable, "-m", "app.server", "--workers", "1", "--port", str(port), "--no-access-log"]
+    return {
+        "uvicorn": (uvicorn, {"WARMUP": "false"}),
+        "serve": (serve, {"WARMUP": "false"}),
+        "serve+warmup": (serve, {"WARMUP": "true"}),
+    }
+
+def request(port: int, path: str, headers: dict[str, str] | None = None) -> tuple[int, float]:
+    """GET `path` on a new connection; returns the status and the latency in seconds."""
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    finally:
+        connection.close()
+
+def wait_ready(port: int, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if request(port, "/api/v1/health/ready")[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError("server not ready in time")
+
+def run_once(command: list[str], env: dict[str, str], port: int, token: str, warm_requests: int) -> dict[str, float]:
+    auth = {"Authorization": f"Bearer {token}"}
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port, process)
+        result = {"ready": time.perf_counter() - started}
+        status, result["first_auth"] = request(port, "/api/v1/auth", auth)
+        assert status == 200, status
+        result["first_healthcheck"] = request(port, "/api/v1/healthcheck")[1]
+        result["warm_auth"] = statistics.median(request(port, "/api/v1/auth", auth)[1] for _ in range(warm_requests))
+        return result
+    finally:
+        process.terminate()
+        process.wait()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5, help="number of runs per server")
+    parser.add_argument("--warm-requests", type=int, default=20, help="requests measured after the first ones")
+    parser.add_argument("--database-url", help="database to use (default: a temporary SQLite file)")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_environment(args.database_url or f"sqlite:///{tmp}/coldstart.db")
+        os.environ["DRAIN_SECONDS"] = "0"
+        token = create_token()
+        port = _free_port()
+        results = {}
+        for name, (command, extra_env) in server_commands(port).items():
+            env = {**os.environ, **extra_env}
+            results[name] = [run_once(command, env, port, token, args.warm_requests) for _ in range(args.n)]
+    print(f"{'server':<14} {'metric':<18} {'median ms':>10} {'max ms':>8}")
+    for name, runs in results.items():
+        for metric in runs[0]:
+            values = [run[metric] * 1000 for run in runs]
+            print(f"{name:<14} {metric:<18} {statistics.median(values):>10.2f} {max(values):>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Encode and decode throughput of each JWT backend and algorithm (without the verified-token cache).
+
+Usage (from the api directory): python -m benchmarks.jwt_backends [-n ITERATIONS]
+"""
+import argparse
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from app.tokens import CODECS, load_jwt_config
+
+CLAIMS = {"sub": "5f1d7a8e-3b9c-4a52-9d2e-1f6a7b8c9d0e", "email": "bench@example.com", "name": "Bench User",
+          "is_admin": False}
+
+def write_key(directory: Path, name: str, key) -> str:
+    path = directory / f"{name}.pem"
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                       serialization.NoEncryption()))
+    return str(path)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5000, help="iterations per case")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        key_files = {
+            "RS256": write_key(Path(tmp), "rsa", rsa.generate_private_key(public_exponent=65537, key_size=2048)),
+            "EdDSA": write_key(Path(tmp), "ed25519", ed25519.Ed25519PrivateKey.generate()),
+        }
+        print(f"{'backend':<8} {'algorithm':<10} {'encode ops/s':>14} {'decode ops/s':>14}")
+        for backend, codec in CODECS.items():
+            for algorithm in ("HS256", "RS256", "EdDSA"):
+                if algorithm not in codec.algorithms:
+                    continue
+                try:
+                    config = load_jwt_config({
+                        "JWT_BACKEND": backend, "JWT_ALGORITHM": algorithm, "JWT_SECRET": "x" * 64,
+                        "JWT_KEY_ID": "bench", "JWT_PRIVATE_KEY_FILE": key_files.get(algorithm, ""),
+                    })
+                except ImportError:
+                    print(f"{backend:<8} {algorithm:<10} {'not installed':>14}")
+                    continue
+                claims = {**CLAIMS, "exp": int(time.time()) + 3600}
+                token = config.codec.encode(claims, config.signing_key, algorithm, config.kid)
+                encode = timeit.timeit(lambda: config.codec.encode(claims, config.signing_key, algorithm, config.kid),
+                                       number=args.n)
+                decode = timeit.timeit(lambda: config.codec.decode(token, config.verify_keys, algorithm),
+                                       number=args.n)
+                print(f"{backend:<8} {algorithm:<10} {args.n / encode:>14,.0f} {args.n / decode:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
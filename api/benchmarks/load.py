@@ -0,0 +1,233 @@
+"""
+Latency and throughput benchmark for the API.
+
+Runs each scenario against `app.my_app` in-process (httpx ASGI transport, no network) and/or behind a real uvicorn
+server on localhost, at each concurrency level, and reports p50/p95/p99 latency and requests per second. Google is
+stubbed out, so the OAuth callback scenario measures only our side of a login. The database is a temporary SQLite
+file unless --database-url points at, for example, a local PostgreSQL.
+
+Results can be saved as JSON (--output) and compared with an earlier run (--baseline); the exit status is 1 if any
+scenario's p95 latency or throughput regressed by more than --threshold.
+
+Usage (from the api directory):
+    python -m benchmarks.load [--target inprocess|uvicorn|both] [-c 1,10,50] [-n REQUESTS]
+                              [--database-url URL] [--output FILE] [--baseline FILE] [--threshold 0.2]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import statistics
+from collections.abc import Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+import httpx
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    path: str
+    expected_status: int
+    headers: Callable[[int], dict[str, str]] = lambda i: {}
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(values) * 1000,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+async def run_load(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict[str, Any]:
+    """Send `requests` requests from `concurrency` concurrent workers and summarise their latencies."""
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await client.get(scenario.path, headers=scenario.headers(i))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != scenario.expected_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+def prepare_environment(database_url: str) -> None:
+    """Configure the app for benchmarking; must run before `app` is imported."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret-0123456789")
+    os.environ.setdefault("GOOGLE_CLIENT_ID", "benchmark-client-id")
+    os.environ.setdefault("GOOGLE_CLIENT_SECRET", "benchmark-client-secret")
+    os.environ["OIDC_PRELOAD"] = "false"
+    # All benchmark requests come from one address; keep the limiter in the measured path without throttling it
+    os.environ.setdefault("RATE_LIMIT_IP_RATE", "1000000000")
+    os.environ.setdefault("RATE_LIMIT_IP_BURST", "1000000000")
+    os.environ.setdefault("RATE_LIMIT_USER_RATE", "1000000000")
+    os.environ.setdefault("RATE_LIMIT_USER_BURST", "1000000000")
+
+def stub_google(users: int) -> None:
+    """Replace the calls to Google with instant fake logins of `users` distinct users."""
+    import app.auth as auth_mod
+    counter = iter(range(sys.maxsize))
+
+    async def authorize_access_token(request):
+        return {"id_token": "benchmark"}
+
+    async def parse_id_token(request, token):
+        i = next(counter) % users
+        return {"email": f"bench{i}@example.com", "name": f"Bench User {i}"}
+
+    auth_mod.oauth.google.authorize_access_token = authorize_access_token
+    auth_mod.oauth.google.parse_id_token = parse_id_token
+
+def scenarios() -> list[Scenario]:
+    """The benchmarked requests; creates the user whose token the /auth scenarios send."""
+    from app.auth import create_jwt
+    from app.db import get_engine, get_session
+    from app.migrations import ensure_schema
+    from app.users import find_or_create_user
+    ensure_schema(get_engine())
+    with get_session(get_engine()) as session:
+        token = create_jwt(find_or_create_user(session, "bench-auth@example.com", "Bench Auth"))
+    return [
+        Scenario("healthcheck", "/api/v1/healthcheck", 200),
+        Scenario("auth_valid", "/api/v1/auth", 200, lambda i: {"Authorization": f"Bearer {token}"}),
+        Scenario("auth_invalid", "/api/v1/auth", 401, lambda i: {"Authorization": "Bearer invalid.token.value"}),
+        Scenario("oauth_callback", "/api/v1/auth/callback/google", 307),
+    ]
+
+@asynccontextmanager
+async def inprocess_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    from app import my_app
+    async with my_app.router.lifespan_context(my_app):
+        transport = httpx.ASGITransport(app=my_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@asynccontextmanager
+async def uvicorn_client(concurrency: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Serve the app with uvicorn on localhost in a background thread."""
+    import uvicorn
+    from app import my_app
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(my_app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        await asyncio.to_thread(thread.join)
+
+TARGETS = {"inprocess": inprocess_client, "uvicorn": uvicorn_client}
+
+async def run_suite(targets: list[str], concurrency_levels: list[int], requests: int,
+                    selected: list[Scenario] | None = None) -> list[dict[str, Any]]:
+    results = []
+    for target in targets:
+        for concurrency in concurrency_levels:
+            async with TARGETS[target](concurrency) as client:
+                for scenario in selected or scenarios():
+                    # Warm up connections, caches and code paths before measuring
+                    await run_load(client, scenario, min(requests, 2 * concurrency), concurrency)
+                    summary = await run_load(client, scenario, requests, concurrency)
+                    results.append({"target": target, "scenario": scenario.name, "concurrency": concurrency,
+                                    **summary})
+    return results
+
+def compare(results: list[dict[str, Any]], baseline: list[dict[str, Any]], threshold: float) -> list[str]:
+    """Describe every result whose p95 latency or throughput is more than `threshold` worse than the baseline."""
+    previous = {(r["target"], r["scenario"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result["target"], result["scenario"], result["concurrency"]))
+        if base is None:
+            continue
+        label = f"{result['target']}/{result['scenario']}@{result['concurrency']}"
+        if result["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{label}: p95 {base['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+        if result["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{label}: throughput {base['rps']:.0f} -> {result['rps']:.0f} req/s")
+    return regressions
+
+def print_results(results: list[dict[str, Any]]) -> None:
+    print(f"{'target':<10} {'scenario':<15} {'conc':>4} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6}")
+    for r in results:
+        print(f"{r['target']:<10} {r['scenario']:<15} {r['concurrency']:>4} {r['rps']:>9.0f} {r['p50_ms']:>8.2f} "
+              f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['errors']:>6}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("inprocess", "uvicorn", "both"), default="inprocess")
+    parser.add_argument("-c", "--concurrency", default="1,10,50", help="comma-separated concurrency levels")
+    parser.add_argument("-n", "--requests", type=int, default=500, help="requests per scenario and level")
+    parser.add_argument("--users", type=int, default=100, help="distinct users logging in via the OAuth stub")
+    parser.add_argument("--database-url", help="database to use (default: a temporary SQLite file)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+    targets = ["inprocess", "uvicorn"] if args.target == "both" else [args.target]
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{tmp}/load.db"
+        prepare_environment(database_url)
+        stub_google(args.users)
+        results = asyncio.run(run_suite(targets, concurrency_levels, args.requests))
+    print_results(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": database_url.split(":", 1)[0],
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Measure the cost of one rate limit check per backend, for a hot key and for many distinct keys (with eviction).
+
+Usage (from the api directory): python -m benchmarks.ratelimit [-n ITERATIONS] [--keys KEYS]
+"""
+import argparse
+import os
+import tempfile
+import timeit
+from itertools import count
+from app.ratelimit import Limit, MemoryBackend, RateLimitBackend, SQLiteBackend
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=100000, help="iterations per case (a tenth for sqlite)")
+    parser.add_argument("--keys", type=int, default=10000, help="bucket capacity of the memory backend")
+    args = parser.parse_args()
+    limit = Limit(rate=1e9, burst=1e9)
+    with tempfile.TemporaryDirectory() as directory:
+        backends: dict[str, tuple[RateLimitBackend, int]] = {
+            "memory": (MemoryBackend(maxsize=args.keys), args.n),
+            "sqlite": (SQLiteBackend(os.path.join(directory, "ratelimit.sqlite3")), max(args.n // 10, 1)),
+        }
+        for name, (backend, n) in backends.items():
+            distinct = count()
+            cases = {
+                "hot key": lambda: backend.acquire("ip:127.0.0.1", limit),
+                "distinct keys": lambda: backend.acquire(f"ip:{next(distinct)}", limit),
+            }
+            for case, fn in cases.items():
+                seconds = timeit.timeit(fn, number=n)
+                print(f"{name + ' ' + case:<22} {n / seconds:>12,.0f} ops/s {seconds / n * 1e6:>8.2f} us/op")
+            if isinstance(backend, MemoryBackend):
+                print(f"memory buckets: {len(backend)}, evictions: {backend.evictions}")
+
+if __name__ == "__main__":
+    main()
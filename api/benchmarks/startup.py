@@ -0,0 +1,77 @@
+"""
+Worker startup cost: importing the app, creating the engine, and checking the schema version.
+
+Each run starts a fresh interpreter, so imports and connections are cold. The first schema check on a new database
+applies the migrations; later runs only compare the recorded version. The cumulative import times of the admin CLI
+and the app (`python -X importtime`) are checked against budgets; the exit status is 1 if one is exceeded.
+
+Usage (from the api directory): python -m benchmarks.startup [-n RUNS] [--database-url URL]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# Cumulative import time budgets in seconds, with plenty of headroom for slow machines
+IMPORT_BUDGETS = {"cli.admin": 1.0, "app.main": 2.0}
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+from app import my_app
+from app.db import get_engine
+from app.migrations import ensure_schema
+t1 = time.perf_counter()
+engine = get_engine()
+with engine.connect():
+    pass
+t2 = time.perf_counter()
+ensure_schema(engine)
+t3 = time.perf_counter()
+ensure_schema(engine)
+t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "engine": t2 - t1, "schema_check": t3 - t2, "schema_check_cached": t4 - t3}))
+"""
+
+def import_seconds(module: str) -> float:
+    """Cumulative time of the top-level imports reported by `python -X importtime -c 'import module'`."""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, check=True).stderr
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented further and already counted by their parent
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=10, help="number of runs")
+    parser.add_argument("--database-url", help="database to check (default: a temporary SQLite file)")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DATABASE_URL": args.database_url or f"sqlite:///{tmp}/startup.db"}
+        runs = [
+            json.loads(subprocess.run([sys.executable, "-c", CHILD], env=env, capture_output=True, text=True,
+                                      check=True).stdout)
+            for _ in range(args.n)
+        ]
+    print(f"{'phase':<22} {'first run ms':>13} {'median ms':>10} {'max ms':>8}")
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<22} {values[0]:>13.2f} {statistics.median(values):>10.2f} {max(values):>8.2f}")
+    over_budget = False
+    for module, budget in IMPORT_BUDGETS.items():
+        seconds = import_seconds(module)
+        over_budget |= seconds >= budget
+        print(f"import {module:<15} {seconds * 1000:>8.2f} ms (budget {budget * 1000:.0f} ms)")
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Compare verifying a JWT on every request with the verified-token cache.
+
+Usage (from the api directory): python -m benchmarks.token_cache [-n ITERATIONS]
+"""
+import argparse
+import os
+import time
+import timeit
+from app.tokens import configure_jwt, decode_token, encode_token, token_cache, verify_token
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20000, help="iterations per case")
+    args = parser.parse_args()
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+    configure_jwt()
+    token = encode_token({"sub": "5f1d7a8e-3b9c-4a52-9d2e-1f6a7b8c9d0e", "email": "bench@example.com",
+                          "name": "Bench User", "is_admin": False, "exp": int(time.time()) + 3600})
+    cases = {
+        "verify (no cache)": lambda: verify_token(token),
+        "decode (cached)": lambda: decode_token(token),
+    }
+    decode_token(token)
+    for name, fn in cases.items():
+        seconds = timeit.timeit(fn, number=args.n)
+        print(f"{name:<20} {args.n / seconds:>12,.0f} ops/s {seconds / args.n * 1e6:>8.2f} us/op")
+    print(f"token cache: {token_cache.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,14 @@
-import time
-import os
-from fastapi import FastAPI, APIRouter
-from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.sessions import SessionMiddleware
-from contextlib import asynccontextmanager
-from .db import Base, get_engine
-from .auth import auth_router
-from dotenv import load_dotenv
-
-load_dotenv()
-
-start_time = time.time()
-
-router = APIRouter()
-
-@router.get("/healthcheck")
-def healthcheck():
-    uptime_seconds = int(time.time() - start_time)
-    days, remainder = divmod(uptime_seconds, 86400)
-    hours, remainder = divmod(remainder, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    return {
-        "message": "TEMPLATE_PROJECT_NAME API is healthy!",
-        "uptime": {
-            "days": days,
-            "hours": hours,
-            "minutes": minutes,
-            "seconds": seconds,
-        },
-    }
-
-@asynccontextmanager
-async def lifespan(app):
-    engine = get_engine()
-    Base.metadata.create_all(engine)
-    yield
-
-my_app = FastAPI(lifespan=lifespan)
-my_app.add_middleware(SessionMiddleware, secret_key=os.environ.get("SESSION_SECRET_KEY", "dummy-session-secret"))
-allow_origins = [o.strip() for o in os.environ.get("ALLOW_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
-my_app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allow_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-my_app.include_router(router, prefix="/api/v1")
-my_app.include_router(auth_router, prefix="/api/v1")
-
+"""
+TEMPLATE_PROJECT_NAME API.
+
+The FastAPI application is defined in `app.main` and imported on first access to `app.my_app` (as `uvicorn app:my_app`
+does), so that the admin CLI and other tools can use `app.db`, `app.models` and `app.users` without loading FastAPI,
+authlib and the rest of the web stack.
+"""
+from typing import Any
+
+def __getattr__(name: str) -> Any:
+    if name == "my_app":
+        from .main import my_app
+        return my_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,123 @@
+"""
+Admin-only API routes.
+"""
+import json
+import uuid
+import base64
+import datetime
+from collections.abc import AsyncIterator, Iterator
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from .auth import current_user
+from .db import async_database_enabled
+from .models import User
+from .replicas import async_read_session, read_session
+from .users import UserSnapshot, user_page_query
+
+admin_router = APIRouter(prefix="/admin")
+
+MAX_PAGE_SIZE = 10000
+# Rows fetched from the database, and users encoded into one response chunk, at a time
+STREAM_BATCH_SIZE = 500
+
+# Dependency: authenticated user with User.is_admin set
+async def admin_user(user: UserSnapshot = Depends(current_user)) -> UserSnapshot:
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+# Helper: Opaque keyset cursor holding the (email key, id) of the last user of a page
+def encode_cursor(key: str, user_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key, str(user_id)]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, uuid.UUID]:
+    try:
+        key, user_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(key), uuid.UUID(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _naive_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    # last_login is stored as naive UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+class _PageEncoder:
+    """Encodes a page of users as `{"users": [...], "next_cursor": ...}` in chunks of STREAM_BATCH_SIZE users."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self.last: tuple[str, uuid.UUID] | None = None
+        self.has_more = False
+        self._buffer: list[str] = []
+        # Whether a chunk with users has been sent, so the next one starts with a separator
+        self._emitted = False
+
+    def _flush(self) -> bytes:
+        if not self._buffer:
+            return b""
+        chunk = ("," if self._emitted else "") + ",".join(self._buffer)
+        self._buffer.clear()
+        self._emitted = True
+        return chunk.encode()
+
+    def add(self, user: User, key: str) -> bytes | None:
+        """Add a row; returns a chunk to send once enough users are buffered."""
+        if self.count == self.limit:
+            # The query fetches one row more than the page size to tell whether there is a next page
+            self.has_more = True
+            return None
+        self._buffer.append(json.dumps({
+            "id": str(user.id),
+            "email": user.email,
+            "name": user.name,
+            "last_login": user.last_login.isoformat() if user.last_login else None,
+            "is_active": user.is_active,
+            "is_admin": user.is_admin,
+        }))
+        self.count += 1
+        self.last = (key, user.id)
+        return self._flush() if len(self._buffer) >= STREAM_BATCH_SIZE else None
+
+    def finish(self) -> bytes:
+        next_cursor = encode_cursor(*self.last) if self.has_more and self.last else None
+        return self._flush() + f'],"next_cursor":{json.dumps(next_cursor)}}}'.encode()
+
+def _stream_page(stmt: Select, limit: int) -> Iterator[bytes]:
+    encoder = _PageEncoder(limit)
+    yield b'{"users":['
+    with read_session() as session:
+        for user, key in session.execute(stmt.execution_options(yield_per=STREAM_BATCH_SIZE)):
+            chunk = encoder.add(user, key)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+async def _stream_page_async(stmt: Select, limit: int) -> AsyncIterator[bytes]:
+    encoder = _PageEncoder(limit)
+    yield b'{"users":['
+    async with async_read_session() as session:
+        result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for user, key in result:
+            chunk = encoder.add(user, key)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+# Route: List users page by page (keyset pagination), streamed so that large pages use constant memory
+@admin_router.get("/users")
+async def list_users(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    email_prefix: str | None = None,
+    last_login_from: datetime.datetime | None = None,
+    last_login_to: datetime.datetime | None = None,
+    _: UserSnapshot = Depends(admin_user),
+):
+    after = decode_cursor(cursor) if cursor else None
+    stmt = user_page_query(limit + 1, after, email_prefix, _naive_utc(last_login_from), _naive_utc(last_login_to))
+    stream = _stream_page_async(stmt, limit) if async_database_enabled() else _stream_page(stmt, limit)
+    return StreamingResponse(stream, media_type="application/json")
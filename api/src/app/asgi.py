@@ -0,0 +1,12 @@
+"""
+ASGI scope markers shared by the middleware and the code that builds requests in-process.
+"""
+from collections.abc import Mapping
+from typing import Any
+
+# ASGI scope extension marking the worker's own warm-up requests (`app.warmup`), which the metrics and the access log
+# leave out
+WARMUP_EXTENSION = "app.warmup"
+
+def is_warmup_request(scope: Mapping[str, Any]) -> bool:
+    return WARMUP_EXTENSION in scope.get("extensions", ())
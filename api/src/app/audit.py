@@ -0,0 +1,242 @@
+"""
+Structured access and audit log, written off the request path.
+
+With AUDIT_LOG_PATH set, `audit_log` records JSON lines: one `access` record per request (AUDIT_LOG_ACCESS, by
+`AccessLogMiddleware`), and audit records for logins, rejected tokens and refresh tokens (`app.auth`) and for user and
+token changes made with the admin CLI. Each line has the time (`ts`, UTC), the `event` and its fields.
+
+Recording a line only appends a dict to a bounded in-memory queue (AUDIT_LOG_QUEUE_SIZE records). A background thread
+(started in the app's `lifespan` hook) serializes the queued records and appends them to the file in batches every
+AUDIT_LOG_FLUSH_MS milliseconds, or as soon as a batch is full, and rotates the file once it reaches
+AUDIT_LOG_MAX_BYTES, keeping AUDIT_LOG_BACKUPS old files (`path.1` is the newest). When the queue is full, because
+the disk is slower than the traffic, new records are dropped and counted rather than slowing requests down. Each
+process writes its own file if the path contains `{pid}`, as it should with several workers.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, BinaryIO
+from .asgi import is_warmup_request
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    def _encode(record: dict[str, Any]) -> bytes:
+        return orjson.dumps(record, default=str, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def _encode(record: dict[str, Any]) -> bytes:
+        return (json.dumps(record, default=str, separators=(",", ":")) + "\n").encode()
+
+class AuditLog:
+    def __init__(self, path: str | None, access: bool = True, queue_size: int = 10000, batch_size: int = 512,
+                 flush_interval: float = 0.2, max_bytes: int = 100 * 1024 * 1024, backups: int = 5):
+        self.path = path or None
+        self.access = access and self.path is not None
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        # Appends and pops are atomic, so producers (the event loop and threadpool threads) never take a lock
+        self._queue: deque[dict[str, Any]] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._file: BinaryIO | None = None
+        self._file_path = ""
+        self._size = 0
+        # The formatted current second, reused by the records within it
+        self._second = -1
+        self._second_text = ""
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+        self.write_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def record(self, event: str, **fields: Any) -> None:
+        """Queue a record; never blocks. Dropped (and counted) when the queue is full."""
+        if self.path is None:
+            return
+        queue = self._queue
+        if len(queue) >= self.queue_size:
+            self.dropped += 1
+            return
+        queue.append({"ts": time.time(), "event": event, **fields})
+        self.recorded += 1
+        if len(queue) == self.batch_size:
+            self._wakeup.set()
+
+    def _open(self) -> BinaryIO:
+        assert self.path is not None
+        # Formatted when first opened, in the process that writes the file
+        if not self._file_path:
+            self._file_path = self.path.format(pid=os.getpid())
+        directory = os.path.dirname(self._file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = file = open(self._file_path, "ab")
+        self._size = file.tell()
+        return file
+
+    def _rotate(self, file: BinaryIO) -> BinaryIO:
+        file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self._file_path}.{i}"):
+                    os.replace(f"{self._file_path}.{i}", f"{self._file_path}.{i + 1}")
+            os.replace(self._file_path, f"{self._file_path}.1")
+        else:
+            os.remove(self._file_path)
+        self.rotations += 1
+        return self._open()
+
+    def _timestamp(self, seconds: float) -> str:
+        second = int(seconds)
+        if second != self._second:
+            self._second = second
+            self._second_text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self._second_text}.{int((seconds - second) * 1000):03d}Z"
+
+    def _write(self, batch: list[dict[str, Any]]) -> None:
+        for record in batch:
+            record["ts"] = self._timestamp(record["ts"])
+        data = b"".join(map(_encode, batch))
+        try:
+            file = self._file
+            if file is None:
+                file = self._open()
+            elif self._size and self._size + len(data) > self.max_bytes:
+                file = self._rotate(file)
+            file.write(data)
+            file.flush()
+        except OSError:
+            self.write_errors += 1
+            self.dropped += len(batch)
+            logger.exception("Writing %d audit log records to %s failed", len(batch), self._file_path)
+            self._close()
+            return
+        self._size += len(data)
+        self.written += len(batch)
+        self.batches += 1
+
+    def drain(self) -> None:
+        """Write all queued records (in the writer thread, or in the caller's once the writer has stopped)."""
+        queue = self._queue
+        while queue:
+            batch: list[dict[str, Any]] = []
+            while queue and len(batch) < self.batch_size:
+                batch.append(queue.popleft())
+            self._write(batch)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.drain()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        self._file_path = ""
+
+    def start(self) -> None:
+        """Start the writer thread of this process (a forked worker starts its own)."""
+        if self.path is None or self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer thread after writing the queued records."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self.drain()
+        self._close()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._queue),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+        }
+
+_settings = get_settings()
+audit_log = AuditLog(
+    _settings.audit_log_path,
+    access=_settings.audit_log_access,
+    queue_size=_settings.audit_log_queue_size,
+    flush_interval=_settings.audit_log_flush_ms / 1000,
+    max_bytes=_settings.audit_log_max_bytes,
+    backups=_settings.audit_log_backups,
+)
+
+def audit(event: str, **fields: Any) -> None:
+    """Record an audit event in `audit_log`."""
+    audit_log.record(event, **fields)
+
+def client_ip(scope) -> str | None:
+    client = scope.get("client")
+    return client[0] if client else None
+
+class AccessLogMiddleware:
+    """Pure ASGI middleware recording an `access` record per request in `audit_log`.
+
+    The record includes the id of the authenticated user, which `app.auth` leaves in the request state.
+    """
+
+    def __init__(self, app, log: AuditLog = audit_log):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.log.access or is_warmup_request(scope):
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            state = scope.get("state")
+            self.log.record(
+                "access",
+                method=scope["method"],
+                path=scope["path"],
+                status=status,
+                ms=round((time.perf_counter() - started) * 1000, 3),
+                client=client_ip(scope),
+                user_id=state.get("user_id") if state else None,
+            )
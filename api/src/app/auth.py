@@ -1,88 +1,238 @@
 """
 Authentication routes and logic for Google OAuth2 and JWT.
 """
-import os
+import time
 import datetime
+import dataclasses
 import uuid
-from fastapi import APIRouter, HTTPException, Request
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
-from jose import jwt, JWTError
-# pyright: reportMissingImports=false
-from authlib.integrations.starlette_client import OAuth, OAuthError
-from starlette.config import Config
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request as StarletteRequest
-from .db import get_engine, get_session
+from .audit import audit, client_ip
+from .db import async_database_enabled, get_async_session, get_engine, get_session
+from .last_login import last_login_writer
 from .models import User
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Environment variables
-GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
-
-# OAuth setup
-config = Config(environ={
-    "GOOGLE_CLIENT_ID": GOOGLE_CLIENT_ID or "",
-    "GOOGLE_CLIENT_SECRET": GOOGLE_CLIENT_SECRET or "",
-})
-oauth = OAuth(config)
-oauth.register(
-    name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'},
+from .oidc import OIDCMetadataCache
+from .ratelimit import rate_limit, rate_limiter
+from .refresh_tokens import (
+    InactiveUserError, RefreshTokenError, issue_refresh_token, issue_refresh_token_async, rotate_refresh_token,
+    rotate_refresh_token_async,
 )
+from .replicas import needs_primary, pin_primary, run_read, run_read_async
+from .revocation import revocations
+from .responses import DefaultJSONResponse, etag_matches, make_etag
+from .settings import get_settings
+from .tokens import ACCESS_TOKEN_LIFETIME, TokenError, decode_token, encode_token, public_jwks
+from .users import UserSnapshot, cache_user, find_or_create_user, find_or_create_user_async, user_cache
 
-auth_router = APIRouter()
+if TYPE_CHECKING:
+    # pyright: reportMissingImports=false
+    from authlib.integrations.starlette_client import OAuth
+
+settings = get_settings()
+
+_oauth: "OAuth | None" = None
+
+# Helper: The OAuth client, registered on first use so that importing this module does not load authlib
+def get_oauth() -> "OAuth":
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+        from starlette.config import Config
+        config = Config(environ={
+            "GOOGLE_CLIENT_ID": settings.google_client_id or "",
+            "GOOGLE_CLIENT_SECRET": settings.google_client_secret or "",
+        })
+        oauth = OAuth(config)
+        oauth.register(
+            name='google',
+            client_id=settings.google_client_id,
+            client_secret=settings.google_client_secret,
+            server_metadata_url=settings.google_discovery_url,
+            client_kwargs={'scope': 'openid email profile'},
+        )
+        _oauth = oauth
+        _load_metadata_from_cache(oauth.google)
+        if google_metadata.metadata is not None and google_metadata.jwks is not None:
+            _use_google_metadata(google_metadata.metadata.body, google_metadata.jwks.body)
+    return _oauth
+
+def _load_metadata_from_cache(client: Any) -> None:
+    """Make authlib load the provider metadata through `google_metadata` when it is first needed.
+
+    Without OIDC_PRELOAD nothing is loaded at startup, so the first login fills the shared cache (and the cache file)
+    instead of having authlib fetch the discovery document on its own. authlib's fetch remains the fallback.
+    """
+    fetch_metadata = client.load_server_metadata
+
+    async def load_server_metadata() -> dict[str, Any]:
+        if "_loaded_at" not in client.server_metadata:
+            await google_metadata.try_load()
+        return await fetch_metadata()
+
+    client.load_server_metadata = load_server_metadata
+
+def __getattr__(name: str) -> Any:
+    # `auth.oauth` keeps working for callers (and tests) that use the client directly
+    if name == "oauth":
+        return get_oauth()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _use_google_metadata(metadata: dict[str, Any], jwks: dict[str, Any]) -> None:
+    # "_loaded_at" tells authlib the metadata has been loaded, so it does not fetch it again
+    get_oauth().google.server_metadata.update({**metadata, "jwks": jwks, "_loaded_at": time.time()})
+
+# Google discovery metadata and signing keys, shared by all requests (and workers, with OIDC_CACHE_FILE)
+google_metadata = OIDCMetadataCache(
+    settings.google_discovery_url,
+    cache_file=settings.oidc_cache_file,
+    on_update=_use_google_metadata,
+)
+
+auth_router = APIRouter(default_response_class=DefaultJSONResponse)
+
+# The routes that start a login or exchange a credential are rate limited per client IP (and per user, see
+# `rate_limit`); `/auth`, which the frontend polls, and the public keys are not
+RATE_LIMITED = [Depends(rate_limit)]
 
 # Helper: Create JWT
-def create_jwt(user: User) -> str:
-    jwt_secret = os.environ.get("JWT_SECRET", "changeme")
-    jwt_algorithm = "HS256"
+def create_jwt(user: User | UserSnapshot) -> str:
     payload = {
         "sub": str(user.id),
         "email": user.email,
         "name": user.name,
         "is_admin": user.is_admin,
-        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=12),
+        # Token id, for revoking this token alone
+        "jti": uuid.uuid4().hex,
+        # Issue time: requests right after a login read the user from the primary database
+        "iat": int(time.time()),
+        "exp": datetime.datetime.utcnow() + ACCESS_TOKEN_LIFETIME,
     }
-    token = jwt.encode(payload, jwt_secret, algorithm=jwt_algorithm)
-    return token
+    return encode_token(payload)
 
-# Helper: Get user from JWT
-def get_current_user(request: Request) -> User:
-    jwt_secret = os.environ.get("JWT_SECRET", "changeme")
-    jwt_algorithm = "HS256"
+# Trust the claims of a valid JWT instead of loading the user from the database
+TRUST_JWT_CLAIMS = settings.auth_trust_jwt_claims
+
+# Helper: Record a rejected token in the audit log and fail the request
+def _reject_token(request: Request, reason: str, detail: str) -> HTTPException:
+    audit("token_rejected", reason=reason, path=request.scope["path"], client=client_ip(request.scope))
+    return HTTPException(status_code=401, detail=detail)
+
+# Helper: Get verified claims from the JWT in the Authorization header
+def get_token_claims(request: Request) -> Mapping[str, Any]:
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
+        raise _reject_token(request, "missing", "Missing or invalid Authorization header")
     token = auth_header.split(" ", 1)[1]
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=[jwt_algorithm])
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        # Convert user_id to UUID
-        try:
-            user_id = uuid.UUID(user_id)
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid user ID format")
-        # DB lookup
-        engine = get_engine()
-        session = get_session(engine)
-        user = session.query(User).filter_by(id=user_id).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+        claims = decode_token(token)
+    except TokenError:
+        raise _reject_token(request, "invalid", "Invalid token")
+    if revocations.is_revoked(claims):
+        raise _reject_token(request, "revoked", "Token revoked")
+    # For the access log
+    request.state.user_id = claims.get("sub")
+    return claims
+
+def token_user_id(claims: Mapping[str, Any]) -> uuid.UUID:
+    user_id = claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    try:
+        return uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid user ID format")
+
+def _known_user(claims: Mapping[str, Any]) -> UserSnapshot | None:
+    """Resolve the user without a database query, from the token or the user cache."""
+    user_id = token_user_id(claims)
+    if TRUST_JWT_CLAIMS:
+        return UserSnapshot.from_claims(user_id, claims)
+    return user_cache.get(user_id)
+
+def _found_user(user: User | None) -> UserSnapshot:
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return cache_user(user)
+
+def _load_user(user_id: uuid.UUID, use_primary: bool) -> User | None:
+    return run_read(lambda session: session.get(User, user_id), use_primary)
+
+# Dependency: authenticated user; cache misses are loaded from a read replica (if configured, and unless the user has
+# just logged in), on the async engine when DATABASE_ASYNC is enabled
+async def current_user(request: Request) -> UserSnapshot:
+    claims = get_token_claims(request)
+    user = _known_user(claims)
+    if user:
         return user
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = token_user_id(claims)
+    use_primary = needs_primary(user_id, claims)
+    if async_database_enabled():
+        return _found_user(await run_read_async(lambda session: session.get(User, user_id), use_primary))
+    return _found_user(await run_in_threadpool(_load_user, user_id, use_primary))
+
+# Helper: Whether the request carries the token of a (currently) admin user, e.g. to allow profiling it
+async def is_admin_request(request: Request) -> bool:
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        return False
+    try:
+        return (await current_user(request)).is_admin
+    except HTTPException:
+        return False
+
+def _login_user(email: str, name: str | None, touch_last_login: bool) -> UserSnapshot:
+    with get_session(get_engine()) as session:
+        return find_or_create_user(session, email, name, touch_last_login)
+
+async def login_user(email: str, name: str | None) -> UserSnapshot:
+    """Find or create the user for an OAuth login without blocking the event loop.
+
+    With write-behind enabled, the login time is buffered and written by `last_login_writer` instead.
+    """
+    touch = not last_login_writer.enabled
+    if async_database_enabled():
+        async with get_async_session() as session:
+            user = await find_or_create_user_async(session, email, name, touch)
+    else:
+        user = await run_in_threadpool(_login_user, email, name, touch)
+    pin_primary(user.id)
+    if touch:
+        return user
+    now = datetime.datetime.utcnow()
+    last_login_writer.record(user.id, now)
+    user = dataclasses.replace(user, last_login=now)
+    user_cache.set(user.id, user)
+    return user
+
+def _issue_refresh_token(user_id: uuid.UUID) -> str:
+    with get_session(get_engine()) as session:
+        return issue_refresh_token(session, user_id)
+
+async def new_refresh_token(user_id: uuid.UUID) -> str:
+    """Start a new refresh token family for a login."""
+    if async_database_enabled():
+        async with get_async_session() as session:
+            return await issue_refresh_token_async(session, user_id)
+    return await run_in_threadpool(_issue_refresh_token, user_id)
+
+def _rotate_refresh_token(token: str) -> tuple[UserSnapshot, str]:
+    with get_session(get_engine()) as session:
+        return rotate_refresh_token(session, token)
+
+async def rotate_tokens(token: str) -> tuple[UserSnapshot, str]:
+    """Exchange a refresh token for its user and a new refresh token (on the primary, since it writes)."""
+    if async_database_enabled():
+        async with get_async_session() as session:
+            return await rotate_refresh_token_async(session, token)
+    return await run_in_threadpool(_rotate_refresh_token, token)
 
 # Route: Initiate Google OAuth2
-@auth_router.get("/auth/login/google")
+@auth_router.get("/auth/login/google", dependencies=RATE_LIMITED)
 async def login_via_google(request: StarletteRequest):
+    oauth = get_oauth()
     if not hasattr(oauth, "google") or oauth.google is None:
         raise HTTPException(status_code=500, detail="Google OAuth client not configured.")
     redirect_uri = request.url_for("auth_callback_google")
@@ -90,53 +240,81 @@ async def login_via_google(request: StarletteRequest):
     return result
 
 # Route: Google OAuth2 callback
-@auth_router.get("/auth/callback/google", name="auth_callback_google")
+@auth_router.get("/auth/callback/google", name="auth_callback_google", dependencies=RATE_LIMITED)
 async def auth_callback_google(request: StarletteRequest):
+    from authlib.integrations.starlette_client import OAuthError
+    oauth = get_oauth()
     if not hasattr(oauth, "google") or oauth.google is None:
         raise HTTPException(status_code=500, detail="Google OAuth client not configured.")
     try:
         token = await oauth.google.authorize_access_token(request)
         userinfo = await oauth.google.parse_id_token(request, token)
-    except OAuthError:
+    except OAuthError as e:
+        audit("login_failed", reason="oauth_error", error=e.error, client=client_ip(request.scope))
         raise HTTPException(status_code=400, detail="OAuth authentication failed")
     except Exception:
         raise
     if not userinfo or "email" not in userinfo:
+        audit("login_failed", reason="no_email", client=client_ip(request.scope))
         raise HTTPException(status_code=400, detail="Failed to retrieve user info from Google")
+    # A login storm for one account is limited before it reaches the database
+    await rate_limiter.check("user", userinfo["email"].lower())
     # DB: Find or create user
-    engine = get_engine()
-    session = get_session(engine)
-    user = session.query(User).filter_by(email=userinfo["email"]).first()
-    if not user:
-        user = User(
-            email=userinfo["email"],
-            name=userinfo.get("name", userinfo["email"]),
-            last_login=datetime.datetime.utcnow(),
-            is_active=True,
-            is_admin=False,
-        )
-        session.add(user)
-    else:
-        user.last_login = datetime.datetime.utcnow()
-        user.name = userinfo.get("name", user.name)
-    session.commit()
-    # JWT
+    user = await login_user(userinfo["email"], userinfo.get("name"))
+    # JWT, and a refresh token for renewing it without another Google round trip
     jwt_token = create_jwt(user)
+    refresh_token = await new_refresh_token(user.id)
+    request.state.user_id = str(user.id)
+    audit("login", user_id=user.id, email=user.email, client=client_ip(request.scope))
     # Detect frontend origin
-    origin = request.headers.get("origin") or os.environ.get("FRONTEND_ORIGIN", "http://localhost:3000")
-    redirect_url = f"{origin}/auth/callback#token={jwt_token}"
+    origin = request.headers.get("origin") or settings.frontend_origin
+    redirect_url = f"{origin}/auth/callback#token={jwt_token}&refresh_token={refresh_token}"
     response = RedirectResponse(url=redirect_url)
     return response
 
-# Route: Authenticated user info
-@auth_router.get("/auth")
-def get_authenticated_user(request: Request):
-    user = get_current_user(request)
+# Route: New access token (and rotated refresh token) for a refresh token
+@auth_router.post("/auth/refresh", dependencies=RATE_LIMITED)
+async def refresh_access_token(request: Request, refresh_token: str = Body(..., embed=True)):
+    try:
+        user, new_token = await rotate_tokens(refresh_token)
+    except InactiveUserError as e:
+        audit("refresh_rejected", reason=str(e), client=client_ip(request.scope))
+        raise HTTPException(status_code=403, detail="Inactive user")
+    except RefreshTokenError as e:
+        # A reused token revoked its whole family: worth an alert
+        audit("refresh_rejected", reason=str(e), client=client_ip(request.scope))
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    user_cache.set(user.id, user)
+    request.state.user_id = str(user.id)
+    audit("token_refreshed", user_id=user.id, client=client_ip(request.scope))
     return {
+        "access_token": create_jwt(user),
+        "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_LIFETIME.total_seconds()),
+        "refresh_token": new_token,
+    }
+
+# Route: Public keys for verifying access tokens without calling this API
+@auth_router.get("/auth/jwks.json")
+def get_jwks(response: Response):
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return public_jwks()
+
+# Route: Authenticated user info; polled by the frontend, so unchanged users are answered with 304 Not Modified
+@auth_router.get("/auth")
+async def get_authenticated_user(request: Request, user: UserSnapshot = Depends(current_user)):
+    last_login = user.last_login.isoformat() if user.last_login else None
+    etag = make_etag(user.id, user.email, user.name, last_login, user.is_active, user.is_admin)
+    # Browsers revalidate on every call, and the body depends on the Authorization header
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    # Returning the response directly skips FastAPI's jsonable_encoder pass over the body
+    return DefaultJSONResponse({
         "id": str(user.id),
         "email": user.email,
         "name": user.name,
-        "last_login": user.last_login.isoformat() if user.last_login else None,
+        "last_login": last_login,
         "is_active": user.is_active,
         "is_admin": user.is_admin,
-    } 
\ No newline at end of file
+    }, headers=headers)
@@ -0,0 +1,137 @@
+"""
+Liveness and readiness probes for load balancers and orchestrators.
+
+`HealthProbeMiddleware` is the outermost layer of the app and answers the probe paths itself, before the session,
+CORS, metrics and routing layers run:
+
+- `/api/v1/health/live`: the worker is serving requests (a constant response)
+- `/api/v1/health/ready`: the worker is not draining for a shutdown (see `app.server`), the database answers and the
+  connection pool is not exhausted. The database is queried at most once per READINESS_INTERVAL_MS per worker,
+  however often the probe is polled; probes in between (and concurrent ones) share the cached result.
+
+`/api/v1/healthcheck` remains the detailed (and more expensive) status endpoint.
+"""
+import json
+import time
+import asyncio
+import logging
+from typing import Any
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+from .db import async_database_enabled, get_async_engine, get_engine, pool_stats
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+LIVE_PATH = "/api/v1/health/live"
+READY_PATH = "/api/v1/health/ready"
+
+_LIVE_BODY = b'{"status":"ok"}'
+
+def _ping() -> None:
+    with get_engine().connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+
+class ReadinessCheck:
+    def __init__(self, interval: float = 2.0, timeout: float = 1.0, max_pool_saturation: float | None = None):
+        self.interval = interval
+        self.timeout = timeout
+        # Report "not ready" when this fraction of the pool's connections is checked out (None: report only)
+        self.max_pool_saturation = max_pool_saturation
+        self.checks = 0
+        # False once the worker drains for a shutdown, so that load balancers stop sending it requests
+        self.accepting = True
+        self._database: dict[str, Any] = {}
+        self._checked_at = float("-inf")
+        self._lock: asyncio.Lock | None = None
+
+    async def _ping(self) -> None:
+        if async_database_enabled():
+            async with get_async_engine().connect() as connection:
+                await connection.exec_driver_sql("SELECT 1")
+        else:
+            await run_in_threadpool(_ping)
+
+    async def _check_database(self) -> dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._ping(), timeout=self.timeout)
+        except (SQLAlchemyError, OSError, RuntimeError, asyncio.TimeoutError) as e:
+            logger.warning("Readiness check: database unavailable: %r", e)
+            return {"ok": False, "error": type(e).__name__}
+        finally:
+            self.checks += 1
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    async def database(self) -> dict[str, Any]:
+        """The cached database check result, refreshed by one caller at a time once it is `interval` old."""
+        if time.monotonic() - self._checked_at < self.interval:
+            return self._database
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self.interval:
+                self._database = await self._check_database()
+                self._checked_at = time.monotonic()
+        return self._database
+
+    def pool(self) -> dict[str, Any]:
+        stats = pool_stats()
+        if not stats or "checked_out" not in stats:
+            return {}
+        capacity = stats["size"] + max(stats["max_overflow"], 0)
+        saturation = stats["checked_out"] / capacity if capacity else 0.0
+        return {"checked_out": stats["checked_out"], "capacity": capacity, "saturation": round(saturation, 3)}
+
+    async def status(self) -> tuple[bool, dict[str, Any]]:
+        database = await self.database()
+        pool = self.pool()
+        ready = database.get("ok", False) and self.accepting
+        if ready and self.max_pool_saturation is not None and pool.get("saturation", 0.0) >= self.max_pool_saturation:
+            ready = False
+        body: dict[str, Any] = {"status": "ok" if ready else "unavailable", "database": database, "pool": pool}
+        if not self.accepting:
+            body["accepting"] = False
+        return ready, body
+
+    def reset(self) -> None:
+        self.accepting = True
+        self._database = {}
+        self._checked_at = float("-inf")
+        self._lock = None
+
+_settings = get_settings()
+readiness = ReadinessCheck(
+    interval=_settings.readiness_interval_ms / 1000,
+    timeout=_settings.readiness_timeout_ms / 1000,
+    max_pool_saturation=_settings.readiness_max_pool_saturation,
+)
+
+class HealthProbeMiddleware:
+    def __init__(self, app, readiness: ReadinessCheck = readiness):
+        self.app = app
+        self.readiness = readiness
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            path = scope["path"]
+            if path == LIVE_PATH:
+                await self._respond(send, 200, _LIVE_BODY)
+                return
+            if path == READY_PATH:
+                ready, body = await self.readiness.status()
+                await self._respond(send, 200 if ready else 503, json.dumps(body).encode())
+                return
+        await self.app(scope, receive, send)
+
+    async def _respond(self, send, status: int, body: bytes) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
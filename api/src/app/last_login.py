@@ -0,0 +1,138 @@
+"""
+Write-behind batching of `user.last_login` updates.
+
+With LAST_LOGIN_WRITE_BEHIND enabled, logins record their time in an in-process buffer instead of writing the user's
+row before the redirect. A background task (started in the app's `lifespan` hook) writes the buffered times with one
+batched UPDATE every LAST_LOGIN_FLUSH_MS milliseconds, or as soon as LAST_LOGIN_FLUSH_MAX users are waiting, and once
+more on shutdown. Repeated logins of the same user between two flushes are coalesced into one update.
+"""
+import time
+import uuid
+import asyncio
+import logging
+import datetime
+from typing import cast
+from sqlalchemy import Table, bindparam, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from .db import async_database_enabled, get_async_engine, get_engine
+from .models import User
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+_user = cast(Table, User.__table__)
+# Never move last_login backwards, in case another worker flushed a later login first
+UPDATE_LAST_LOGIN = (
+    update(_user)
+    .where(_user.c.id == bindparam("b_id"))
+    .where(or_(_user.c.last_login.is_(None), _user.c.last_login < bindparam("b_last_login")))
+    .values(last_login=bindparam("b_last_login"))
+)
+
+class LastLoginWriter:
+    def __init__(self, enabled: bool, flush_interval: float = 0.5, max_batch: int = 500):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: dict[uuid.UUID, datetime.datetime] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def _merge(self, user_id: uuid.UUID, when: datetime.datetime) -> None:
+        previous = self._pending.get(user_id)
+        if previous is None or previous < when:
+            self._pending[user_id] = when
+
+    def record(self, user_id: uuid.UUID, when: datetime.datetime) -> None:
+        """Buffer a login time; must be called on the event loop thread."""
+        self._merge(user_id, when)
+        self.recorded += 1
+        if len(self._pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _requeue(self, batch: dict[uuid.UUID, datetime.datetime]) -> None:
+        for user_id, when in batch.items():
+            self._merge(user_id, when)
+
+    def _write(self, params: list[dict]) -> None:
+        with get_engine().begin() as connection:
+            connection.execute(UPDATE_LAST_LOGIN, params)
+
+    async def flush(self) -> None:
+        """Write all buffered login times in one batched UPDATE."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        params = [{"b_id": user_id, "b_last_login": when} for user_id, when in batch.items()]
+        started = time.perf_counter()
+        try:
+            if async_database_enabled():
+                async with get_async_engine().begin() as connection:
+                    await connection.execute(UPDATE_LAST_LOGIN, params)
+            else:
+                await asyncio.to_thread(self._write, params)
+        except asyncio.CancelledError:
+            self._requeue(batch)
+            raise
+        except SQLAlchemyError:
+            self.failed_flushes += 1
+            logger.exception("Writing %d last_login updates failed; retrying with the next flush", len(batch))
+            self._requeue(batch)
+            return
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.flushed_rows += len(params)
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+_settings = get_settings()
+last_login_writer = LastLoginWriter(
+    enabled=_settings.last_login_write_behind,
+    flush_interval=_settings.last_login_flush_ms / 1000,
+    max_batch=_settings.last_login_flush_max,
+)
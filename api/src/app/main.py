@@ -0,0 +1,142 @@
+"""
+The FastAPI application (`app.my_app`).
+"""
+import hmac
+import time
+import logging
+from fastapi import FastAPI, APIRouter, Depends, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from .db import (
+    get_engine, dispose_engines, pool_stats, async_database_enabled, configure_async_database, get_async_engine,
+    dispose_async_engines, get_async_replica_engines, get_replica_engines
+)
+from .admin import admin_router, admin_user
+from .audit import AccessLogMiddleware, audit_log
+from .auth import auth_router, current_user, google_metadata, is_admin_request
+from .health import HealthProbeMiddleware, readiness
+from .last_login import last_login_writer
+from .metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, registry
+from .migrations import ensure_schema
+from .profiling import ProfilingMiddleware, profiler
+from .ratelimit import rate_limiter
+from .replicas import replica_router
+from .revocation import revocations
+from .responses import DefaultJSONResponse
+from .sessions import ScopedSessionMiddleware, create_session_store
+from .settings import env_flag, get_settings
+from .tokens import configure_jwt, token_cache
+from .users import user_cache
+from .warmup import warm_up
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+start_time = time.time()
+
+router = APIRouter(default_response_class=DefaultJSONResponse)
+
+@router.get("/healthcheck")
+def healthcheck():
+    uptime_seconds = int(time.time() - start_time)
+    days, remainder = divmod(uptime_seconds, 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return {
+        "message": "TEMPLATE_PROJECT_NAME API is healthy!",
+        "uptime": {
+            "days": days,
+            "hours": hours,
+            "minutes": minutes,
+            "seconds": seconds,
+        },
+        "database": {"pool": pool_stats(), "replicas": replica_router.stats()},
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "oidc_metadata": google_metadata.stats(),
+        "last_login_writer": last_login_writer.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "revocations": revocations.stats(),
+        "audit_log": audit_log.stats(),
+    }
+
+# Dependency: the metrics are for the scraper (with METRICS_TOKEN as its bearer token) and admin users
+async def metrics_access(request: Request) -> None:
+    token = settings.metrics_token
+    if token and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return
+    await admin_user(await current_user(request))
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(metrics_access)])
+async def metrics():
+    body = registry.render({
+        "db_pool": pool_stats() or {},
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "oidc_metadata": google_metadata.stats(),
+        "last_login_writer": last_login_writer.stats(),
+        "profiler": profiler.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "db_replicas": replica_router.stats(),
+        "revocations": revocations.stats(),
+        "audit_log": audit_log.stats(),
+    })
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
+
+@asynccontextmanager
+async def lifespan(app):
+    audit_log.start()
+    configure_jwt()
+    configure_async_database()
+    readiness.reset()
+    ensure_schema(get_engine())
+    # Every engine a session can be routed to, so that replica reads are counted with their request
+    for engine in (get_engine(), *get_replica_engines()):
+        instrument_engine(engine)
+    if async_database_enabled():
+        for async_engine in (get_async_engine(), *get_async_replica_engines()):
+            instrument_engine(async_engine.sync_engine)
+    if env_flag("OIDC_PRELOAD", True):
+        await google_metadata.start()
+    await revocations.start()
+    await last_login_writer.start()
+    if settings.warmup:
+        started = time.perf_counter()
+        timings = await warm_up(app)
+        logger.info("Worker warmed up in %.1f ms: %s", (time.perf_counter() - started) * 1000, timings)
+    yield
+    await last_login_writer.stop()
+    await revocations.stop()
+    await google_metadata.stop()
+    dispose_engines()
+    await dispose_async_engines()
+    audit_log.stop()
+
+my_app = FastAPI(lifespan=lifespan)
+# The session only carries the OAuth state, so other requests skip it entirely
+my_app.add_middleware(
+    ScopedSessionMiddleware,
+    secret_key=settings.session_secret_key,
+    paths=settings.session_paths,
+    store=create_session_store(settings),
+    max_age=settings.session_max_age,
+)
+my_app.add_middleware(
+    CORSMiddleware,
+    allow_origins=list(settings.allow_origins),
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+my_app.add_middleware(ProfilingMiddleware, authorize=is_admin_request)
+# Outside the other middleware, so that the recorded latency covers them too
+my_app.add_middleware(MetricsMiddleware)
+my_app.add_middleware(AccessLogMiddleware)
+# Answers the load balancer's probes before any other middleware runs
+my_app.add_middleware(HealthProbeMiddleware)
+my_app.include_router(router, prefix="/api/v1")
+my_app.include_router(auth_router, prefix="/api/v1")
+my_app.include_router(admin_router, prefix="/api/v1")
+
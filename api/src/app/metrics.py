@@ -0,0 +1,236 @@
+"""
+Request and database metrics, exposed in the Prometheus text format.
+
+`MetricsMiddleware` records the latency, status code and number of in-flight requests per route, and the SQLAlchemy
+hooks installed by `instrument_engine` count the queries of each request and their duration. Requests slower than
+SLOW_REQUEST_MS are logged with a breakdown of their queries. The counters are plain dicts updated once per request on
+the event loop thread, so recording costs a few dictionary operations and no external dependency is needed.
+"""
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections.abc import Mapping
+from contextvars import ContextVar
+from typing import Any
+from sqlalchemy import Engine, event
+from .asgi import is_warmup_request
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Label for requests that did not match a route, so unknown paths cannot inflate the number of series
+UNMATCHED_ROUTE = "unmatched"
+# Label for queries that ran outside a request, such as background flushes
+BACKGROUND_ROUTE = "background"
+# Number of statements shown in the slow-request log
+SLOW_LOG_STATEMENTS = 5
+
+class RequestStats:
+    """Queries of one request, collected by the engine hooks."""
+    __slots__ = ("queries", "query_seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        # statement -> [count, seconds]; only filled when slow requests are logged
+        self.statements: dict[str, list] | None = None
+
+_current_request: ContextVar[RequestStats | None] = ContextVar("metrics_request", default=None)
+
+class Histogram:
+    """Cumulative Prometheus histogram per label set."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self, name: str, label_names: tuple[str, ...]) -> list[str]:
+        lines = []
+        for labels, series in self.series.items():
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            cumulative += series[-2]
+            lines.append(f'{name}_bucket{{{base},le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{name}_count{{{base}}} {cumulative}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+class MetricsRegistry:
+    def __init__(self, slow_request_seconds: float = 0.0):
+        # 0 disables the slow-request log
+        self.slow_request_seconds = slow_request_seconds
+        self.in_flight = 0
+        self.requests: dict[tuple[str, str, str], int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.request_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.queries: dict[str, int] = {}
+        self.query_seconds: dict[str, float] = {}
+        # Queries outside requests (and so their metrics) are recorded from other threads, such as the last_login
+        # writer: every update and the rendering take this lock
+        self._lock = threading.Lock()
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+        key = (method, route, str(status))
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe((method, route), seconds)
+            self.request_queries.observe((method, route), stats.queries)
+            if stats.queries:
+                self.queries[route] = self.queries.get(route, 0) + stats.queries
+                self.query_seconds[route] = self.query_seconds.get(route, 0.0) + stats.query_seconds
+
+    def record_background_query(self, seconds: float) -> None:
+        with self._lock:
+            self.queries[BACKGROUND_ROUTE] = self.queries.get(BACKGROUND_ROUTE, 0) + 1
+            self.query_seconds[BACKGROUND_ROUTE] = self.query_seconds.get(BACKGROUND_ROUTE, 0.0) + seconds
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.latency.series.clear()
+            self.request_queries.series.clear()
+            self.queries.clear()
+            self.query_seconds.clear()
+
+    def render(self, stats: Mapping[str, Mapping[str, Any]] = {}) -> str:
+        """All metrics in the Prometheus text format; `stats` adds numeric values of other components as gauges."""
+        with self._lock:
+            lines = self._render()
+        for prefix, values in stats.items():
+            for key, value in values.items():
+                if isinstance(value, (bool, int, float)):
+                    name = _metric_name(f"{prefix}_{key}")
+                    lines += [f"# TYPE {name} gauge", f"{name} {float(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def _render(self) -> list[str]:
+        lines = [
+            "# HELP http_requests_total HTTP requests by method, route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for labels, count in self.requests.items():
+            lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), labels)}}} {count}")
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency by method and route.",
+            "# TYPE http_request_duration_seconds histogram",
+            *self.latency.render("http_request_duration_seconds", ("method", "route")),
+            "# HELP http_requests_in_flight HTTP requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_request_db_queries Database queries per HTTP request by method and route.",
+            "# TYPE http_request_db_queries histogram",
+            *self.request_queries.render("http_request_db_queries", ("method", "route")),
+            "# HELP db_queries_total Database queries by route.",
+            "# TYPE db_queries_total counter",
+        ]
+        lines += [f'db_queries_total{{route="{_escape(r)}"}} {n}' for r, n in self.queries.items()]
+        lines += [
+            "# HELP db_query_duration_seconds_total Time spent executing database queries by route.",
+            "# TYPE db_query_duration_seconds_total counter",
+        ]
+        lines += [f'db_query_duration_seconds_total{{route="{_escape(r)}"}} {s}' for r, s in self.query_seconds.items()]
+        return lines
+
+registry = MetricsRegistry(slow_request_seconds=get_settings().slow_request_ms / 1000)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or response wrapping) recording request metrics in `registry`."""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        # Warm-up requests are not traffic
+        if scope["type"] != "http" or is_warmup_request(scope):
+            await self.app(scope, receive, send)
+            return
+        registry = self.registry
+        stats = RequestStats()
+        if registry.slow_request_seconds:
+            stats.statements = {}
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current_request.set(stats)
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            _current_request.reset(token)
+            # The router stores the matched route in the scope; use its template, not the raw path
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            registry.record_request(scope["method"], route, status, elapsed, stats)
+            if registry.slow_request_seconds and elapsed >= registry.slow_request_seconds:
+                _log_slow_request(scope["method"], route, status, elapsed, stats)
+
+def _log_slow_request(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+    statements = sorted((stats.statements or {}).items(), key=lambda item: item[1][1], reverse=True)
+    breakdown = "".join(
+        f"\n  {count}x {total * 1000:.1f} ms: {' '.join(statement.split())[:200]}"
+        for statement, (count, total) in statements[:SLOW_LOG_STATEMENTS]
+    )
+    logger.warning(
+        "Slow request: %s %s -> %d in %.1f ms, %d queries in %.1f ms%s",
+        method, route, status, seconds * 1000, stats.queries, stats.query_seconds * 1000, breakdown,
+    )
+
+# Helper: SQLAlchemy hooks timing each statement on its execution context
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current_request.get()
+    if stats is None:
+        registry.record_background_query(elapsed)
+        return
+    stats.queries += 1
+    stats.query_seconds += elapsed
+    if stats.statements is not None:
+        entry = stats.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+def instrument_engine(engine: Engine) -> None:
+    """Count and time the queries of `engine` (for an AsyncEngine, pass its `sync_engine`); idempotent."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,159 @@
+"""
+Versioned schema migrations.
+
+The database records the applied migrations in a `schema_version` table. Workers only compare the recorded version
+with `HEAD_VERSION` at startup (one query, cached per process), instead of reflecting the schema with `create_all` on
+every boot. Migrations are applied with `admin db migrate`, or at startup when SCHEMA_AUTO_MIGRATE is enabled.
+"""
+import datetime
+from collections.abc import Callable
+from dataclasses import dataclass
+from sqlalchemy import (
+    Boolean, Column, DateTime, Engine, ForeignKey, Index, Integer, MetaData, String, Table, Connection, func, insert,
+    select
+)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+from .models import email_key
+from .settings import env_flag
+
+# Kept out of Base.metadata, so that create_all in tests and tools does not create an empty version table
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Serialises concurrent `migrate` calls on PostgreSQL (pg_advisory_xact_lock key)
+MIGRATION_LOCK_ID = 0x5C4E3A
+
+class SchemaOutOfDate(RuntimeError):
+    """The database schema is older than this code and automatic migration is disabled."""
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    # Must be idempotent: databases created before versioning already contain some of the objects
+    apply: Callable[[Connection], None]
+
+# The tables as each migration created them. They are frozen: a later change to `app.models` needs a new migration
+# (and a test that the result matches the models), not an edit here.
+frozen_metadata = MetaData()
+
+user_v1 = Table(
+    "user",
+    frozen_metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True),
+    Column("email", String(255), unique=True, nullable=False),
+    Column("name", String(255), nullable=False),
+    Column("last_login", DateTime, nullable=True),
+    Column("is_active", Boolean, nullable=False),
+    Column("is_admin", Boolean, nullable=False),
+)
+
+# On a copy of the table, since indexes attach to their table and `user_v1` must create the table alone
+_user_v2 = user_v1.to_metadata(MetaData())
+user_indexes_v2 = (
+    Index("ix_user_email_key", email_key(_user_v2.c.email), _user_v2.c.id),
+    Index("ix_user_last_login", _user_v2.c.last_login),
+)
+
+token_revocation_v3 = Table(
+    "token_revocation",
+    frozen_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("jti", String(64), nullable=True),
+    Column("user_id", UUID(as_uuid=True), nullable=True),
+    Column("revoked_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Index("ix_token_revocation_revoked_at", "revoked_at"),
+)
+
+refresh_token_v4 = Table(
+    "refresh_token",
+    frozen_metadata,
+    Column("token_hash", String(64), primary_key=True),
+    Column("user_id", UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), nullable=False),
+    Column("family_id", String(32), nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Column("rotated_at", DateTime, nullable=True),
+    Index("ix_refresh_token_user_id", "user_id"),
+    Index("ix_refresh_token_family_id", "family_id"),
+)
+
+def _create_table(table: Table) -> Callable[[Connection], None]:
+    def apply(connection: Connection) -> None:
+        table.create(connection, checkfirst=True)
+    return apply
+
+def _create_user_indexes(connection: Connection) -> None:
+    # IF NOT EXISTS instead of checkfirst, which cannot reflect expression indexes on every backend
+    for index in user_indexes_v2:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "Create user table", _create_table(user_v1)),
+    Migration(2, "Index user email key and last_login", _create_user_indexes),
+    Migration(3, "Create token_revocation table", _create_table(token_revocation_v3)),
+    Migration(4, "Create refresh_token table", _create_table(refresh_token_v4)),
+]
+HEAD_VERSION = MIGRATIONS[-1].version
+
+_verified: set[str] = set()
+
+def current_version(connection: Connection) -> int:
+    """The recorded schema version, or 0 if the database is not versioned yet."""
+    try:
+        # A savepoint keeps the transaction usable on PostgreSQL if the table does not exist
+        with connection.begin_nested():
+            return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except DBAPIError:
+        return 0
+
+def pending_migrations(engine: Engine) -> list[Migration]:
+    with engine.connect() as connection:
+        version = current_version(connection)
+    return [m for m in MIGRATIONS if m.version > version]
+
+def migrate(engine: Engine) -> list[Migration]:
+    """Apply all pending migrations in one transaction; return the ones that were applied."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+        schema_version.create(connection, checkfirst=True)
+        version = current_version(connection)
+        applied = [m for m in MIGRATIONS if m.version > version]
+        for migration in applied:
+            migration.apply(connection)
+            connection.execute(insert(schema_version).values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.datetime.utcnow(),
+            ))
+    _verified.add(str(engine.url))
+    return applied
+
+def ensure_schema(engine: Engine, auto_migrate: bool | None = None) -> None:
+    """Make sure the schema is at `HEAD_VERSION`; checked once per process and engine URL.
+
+    Behind the head version, pending migrations are applied if `auto_migrate` (default: SCHEMA_AUTO_MIGRATE) is set,
+    and `SchemaOutOfDate` is raised otherwise.
+    """
+    if str(engine.url) in _verified:
+        return
+    with engine.connect() as connection:
+        version = current_version(connection)
+    if version < HEAD_VERSION:
+        if auto_migrate is None:
+            auto_migrate = env_flag("SCHEMA_AUTO_MIGRATE", True)
+        if not auto_migrate:
+            raise SchemaOutOfDate(
+                f"Database schema is at version {version}, this code needs {HEAD_VERSION}. Run 'admin db migrate'."
+            )
+        migrate(engine)
+    _verified.add(str(engine.url))
@@ -1,10 +1,30 @@
 import uuid
 import datetime
-from sqlalchemy import String, Boolean, DateTime
+from sqlalchemy import String, Boolean, DateTime, ForeignKey, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql.functions import FunctionElement
 from .db import Base
 
+class email_key(FunctionElement[str]):
+    """Case-insensitive sort and prefix-search key of an email: `lower(email)`.
+
+    On PostgreSQL it uses the "C" collation, so that ordering is by code point and a prefix search is a plain index
+    range scan whatever the database's default collation is. Queries must use the same expression as the index.
+    """
+    type = String()
+    name = "email_key"
+    inherit_cache = True
+
+@compiles(email_key)
+def _compile_email_key(element, compiler, **kw):
+    return f"lower({compiler.process(element.clauses, **kw)})"
+
+@compiles(email_key, "postgresql")
+def _compile_email_key_postgresql(element, compiler, **kw):
+    return f'lower({compiler.process(element.clauses, **kw)}) COLLATE "C"'
+
 class User(Base):
     __tablename__ = "user"
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -12,4 +32,31 @@ class User(Base):
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     last_login: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
-    is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False) 
\ No newline at end of file
+    is_admin: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False) 
+
+# Admin user listing: keyset pagination and prefix search on the email key, and last_login range filters
+user_email_key_index = Index("ix_user_email_key", email_key(User.email), User.id)
+user_last_login_index = Index("ix_user_last_login", User.last_login)
+
+class TokenRevocation(Base):
+    """A revoked token (`jti`), or all tokens of a user issued before `revoked_at` (`user_id`)."""
+    __tablename__ = "token_revocation"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    jti: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    user_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    # Workers load the revocations recorded since their last refresh
+    revoked_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
+    # All tokens the revocation applies to have expired by then, so it can be forgotten
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+
+class RefreshToken(Base):
+    """A refresh token, stored as its SHA-256 digest; rotated (used) tokens are kept to detect their reuse."""
+    __tablename__ = "refresh_token"
+    token_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    # All tokens descending from one login; reusing a rotated token revokes the whole family
+    family_id: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+    rotated_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,224 @@
+"""
+Cache for an OpenID Connect provider's discovery metadata and signing keys (JWKS).
+
+The documents are kept for as long as the provider's Cache-Control headers allow, refreshed by a background task
+before they expire, and optionally persisted to a local file so that new worker processes start with a warm cache
+instead of fetching them again during a login spike.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import dataclasses
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+import httpx
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class CachedDocument:
+    body: dict[str, Any]
+    # Wall-clock times, so they survive persisting the document to a file
+    fetched_at: float
+    expires_at: float
+
+    def refresh_at(self, margin: float) -> float:
+        """When to refresh, leaving `margin` (a fraction of the lifetime) before expiry."""
+        return self.expires_at - (self.expires_at - self.fetched_at) * margin
+
+# Discovery metadata and JWKS
+Documents = tuple[CachedDocument, CachedDocument]
+
+def cache_lifetime(headers: httpx.Headers, default_ttl: float, min_ttl: float) -> float:
+    """Seconds a response may be cached according to its Cache-Control and Age headers."""
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return min_ttl
+    try:
+        ttl = float(directives["max-age"]) - float(headers.get("age", "0"))
+    except (KeyError, ValueError):
+        ttl = default_ttl
+    return max(ttl, min_ttl)
+
+def _expires_at(documents: Documents) -> float:
+    return min(document.expires_at for document in documents)
+
+class OIDCMetadataCache:
+    """Discovery metadata and JWKS of one provider, shared by all requests in a process.
+
+    `on_update(metadata, jwks)` is called whenever new documents have been loaded.
+    """
+
+    def __init__(
+        self,
+        discovery_url: str,
+        cache_file: str | None = None,
+        on_update: Callable[[dict[str, Any], dict[str, Any]], None] | None = None,
+        default_ttl: float = 3600,
+        min_ttl: float = 60,
+        refresh_margin: float = 0.1,
+    ):
+        self.discovery_url = discovery_url
+        self.cache_file = cache_file
+        self.on_update = on_update
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        # Refresh when this fraction of a document's lifetime is left
+        self.refresh_margin = refresh_margin
+        self.metadata: CachedDocument | None = None
+        self.jwks: CachedDocument | None = None
+        self.fetches = 0
+        # Created inside the running event loop, see `_get_lock`
+        self._lock: asyncio.Lock | None = None
+        self._lock_loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def expires_at(self) -> float:
+        if self.metadata is None or self.jwks is None:
+            return 0.0
+        return _expires_at((self.metadata, self.jwks))
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str) -> CachedDocument:
+        response = await client.get(url)
+        response.raise_for_status()
+        self.fetches += 1
+        body = response.json()
+        if not isinstance(body, dict):
+            raise ValueError(f"Expected a JSON object from {url}, got {type(body).__name__}")
+        now = time.time()
+        return CachedDocument(body, now, now + cache_lifetime(response.headers, self.default_ttl, self.min_ttl))
+
+    async def refresh(self) -> None:
+        """Fetch both documents from the provider, then publish and persist them."""
+        async with httpx.AsyncClient(timeout=10) as client:
+            metadata = await self._fetch(client, self.discovery_url)
+            jwks_uri = metadata.body.get("jwks_uri")
+            if not jwks_uri:
+                raise RuntimeError(f'Missing "jwks_uri" in {self.discovery_url}')
+            jwks = await self._fetch(client, jwks_uri)
+        self._set(metadata, jwks)
+        self._save()
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    async def load(self) -> None:
+        """Make sure fresh documents are loaded: from memory, then the cache file, then the provider.
+
+        If the provider cannot be reached, stale documents from the cache file are used rather than none.
+        """
+        async with self._get_lock():
+            if self.is_fresh():
+                return
+            cached = self._read_file()
+            if cached is not None and time.time() < _expires_at(cached):
+                self._set(*cached)
+                return
+            try:
+                await self.refresh()
+            except (httpx.HTTPError, RuntimeError, ValueError):
+                self._fall_back(cached)
+                raise
+
+    def _set(self, metadata: CachedDocument, jwks: CachedDocument) -> None:
+        self.metadata, self.jwks = metadata, jwks
+        if self.on_update:
+            self.on_update(metadata.body, jwks.body)
+
+    def _fall_back(self, cached: Documents | None) -> None:
+        """Publish stale documents from the cache file if they are newer than the ones in memory."""
+        if cached is not None and _expires_at(cached) > self.expires_at:
+            self._set(*cached)
+
+    def _read_file(self) -> Documents | None:
+        """The documents in the cache file, fresh or not, without publishing them."""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            if data.get("discovery_url") != self.discovery_url:
+                return None
+            return CachedDocument(**data["metadata"]), CachedDocument(**data["jwks"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring unreadable OIDC cache file %s: %s", self.cache_file, e)
+            return None
+
+    def _save(self) -> None:
+        if not self.cache_file or self.metadata is None or self.jwks is None:
+            return
+        data = {
+            "discovery_url": self.discovery_url,
+            "metadata": dataclasses.asdict(self.metadata),
+            "jwks": dataclasses.asdict(self.jwks),
+        }
+        # Write to a temporary file and rename it, so concurrent workers never read a partial file
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning("Could not write OIDC cache file %s: %s", self.cache_file, e)
+
+    def _refresh_at(self, documents: Documents) -> float:
+        return min(document.refresh_at(self.refresh_margin) for document in documents)
+
+    def _refresh_delay(self) -> float:
+        if self.metadata is None or self.jwks is None:
+            return 0.0
+        return max(self._refresh_at((self.metadata, self.jwks)) - time.time(), 0.0)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_delay())
+            cached = self._read_file()
+            try:
+                # Another worker may already have refreshed the shared cache file
+                if cached is not None and time.time() < self._refresh_at(cached):
+                    self._set(*cached)
+                else:
+                    await self.refresh()
+            except (httpx.HTTPError, RuntimeError, ValueError) as e:
+                logger.warning("Refreshing OIDC metadata from %s failed: %s", self.discovery_url, e)
+                self._fall_back(cached)
+                await asyncio.sleep(self.min_ttl)
+
+    async def try_load(self) -> bool:
+        """`load`, logging failures instead of raising them; returns whether fresh documents are loaded."""
+        try:
+            await self.load()
+        except (httpx.HTTPError, RuntimeError, ValueError) as e:
+            logger.warning("Loading OIDC metadata from %s failed: %s", self.discovery_url, e)
+        return self.is_fresh()
+
+    async def start(self) -> None:
+        """Preload the documents (best effort) and start refreshing them in the background."""
+        await self.try_load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {"fresh": self.is_fresh(), "expires_at": self.expires_at, "fetches": self.fetches}
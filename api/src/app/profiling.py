@@ -0,0 +1,203 @@
+"""
+Opt-in sampling profiler for production requests.
+
+A fraction (PROFILE_SAMPLE_RATE) of requests, and requests from admins that send an `X-Profile: 1` header, are profiled
+by a background thread that samples the Python stacks of all busy threads every PROFILE_INTERVAL_MS milliseconds.
+Samples are aggregated per route and written to PROFILE_DIR as collapsed stacks (one `frame;frame;... count` line per
+stack), the input format of flamegraph.pl and speedscope.
+
+Only one request per worker is profiled at a time, at most PROFILE_MAX_SAMPLES samples are taken per request, and no
+new request is profiled while the time spent sampling exceeds PROFILE_MAX_OVERHEAD (a fraction of the worker's
+uptime). Async requests share the event loop thread, so samples of a profiled request can include frames of other
+requests handled concurrently; the handler frames in each stack tell them apart.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from types import FrameType
+from typing import Any
+from starlette.requests import Request
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+# `X-Profile` values asking for a profile
+PROFILE_HEADER_VALUES = frozenset({b"1", b"true", b"yes"})
+# Leaf functions of threads waiting for work (event loop selector, thread pool queues); their samples are skipped
+IDLE_FUNCTIONS = frozenset({"select", "poll", "wait", "_wait_for_tstate_lock"})
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class _Sampler(threading.Thread):
+    """Samples stacks until `stopped` is set, then hands its counts back to the profiler."""
+
+    def __init__(self, profiler: "SamplingProfiler"):
+        super().__init__(name="request-profiler", daemon=True)
+        self.profiler = profiler
+        self.stopped = threading.Event()
+        self.route = ""
+        self.samples: Counter[str] = Counter()
+        self.taken = 0
+
+    def sample(self) -> None:
+        own = threading.get_ident()
+        for ident, top in sys._current_frames().items():
+            if ident == own or top.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            stack = []
+            frame: FrameType | None = top
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[";".join(stack)] += 1
+        self.taken += 1
+
+    def run(self) -> None:
+        profiler = self.profiler
+        try:
+            while not self.stopped.wait(profiler.interval) and self.taken < profiler.max_samples:
+                started = time.perf_counter()
+                self.sample()
+                profiler.sampling_seconds += time.perf_counter() - started
+            # The request may still be running after hitting the sample limit
+            self.stopped.wait()
+            profiler.save(self.route, self.samples)
+        finally:
+            profiler.release()
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        output_dir: str = "profiles",
+        interval: float = 0.005,
+        max_samples: int = 2000,
+        max_overhead: float = 0.01,
+    ):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_samples = max_samples
+        self.max_overhead = max_overhead
+        self.started_at = time.monotonic()
+        self.routes: dict[str, Counter[str]] = {}
+        self.sampling_seconds = 0.0
+        self.profiled = 0
+        self.skipped_busy = 0
+        self.skipped_overhead = 0
+        self._slot = threading.Lock()
+        self._lock = threading.Lock()
+
+    def wants(self) -> bool:
+        """Whether to profile a request that did not ask for it."""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def overhead(self) -> float:
+        return self.sampling_seconds / max(time.monotonic() - self.started_at, 1.0)
+
+    def begin(self) -> _Sampler | None:
+        """Start sampling for one request; None if another request is being profiled or the budget is spent."""
+        if self.overhead() > self.max_overhead:
+            self.skipped_overhead += 1
+            return None
+        if not self._slot.acquire(blocking=False):
+            self.skipped_busy += 1
+            return None
+        sampler = _Sampler(self)
+        try:
+            sampler.start()
+        except RuntimeError:
+            self._slot.release()
+            raise
+        self.profiled += 1
+        return sampler
+
+    def end(self, sampler: _Sampler, route: str) -> None:
+        # The sampler thread saves the samples, so the event loop never waits for file I/O
+        sampler.route = route
+        sampler.stopped.set()
+
+    def release(self) -> None:
+        self._slot.release()
+
+    def save(self, route: str, samples: Counter[str]) -> None:
+        """Add `samples` to the route's totals and rewrite its collapsed-stack file."""
+        if not samples:
+            return
+        with self._lock:
+            totals = self.routes.setdefault(route, Counter())
+            totals.update(samples)
+            lines = [f"{route};{stack} {count}\n" for stack, count in totals.most_common()]
+        name = "".join(c if c.isalnum() or c in "-_" else "_" for c in route.strip("/")) or "root"
+        path = os.path.join(self.output_dir, f"{name}.collapsed")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", path, e)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled,
+            "skipped_busy": self.skipped_busy,
+            "skipped_overhead": self.skipped_overhead,
+            "sampling_seconds": self.sampling_seconds,
+            "overhead": self.overhead(),
+        }
+
+_settings = get_settings()
+profiler = SamplingProfiler(
+    sample_rate=_settings.profile_sample_rate,
+    output_dir=_settings.profile_dir,
+    interval=_settings.profile_interval_ms / 1000,
+    max_samples=_settings.profile_max_samples,
+    max_overhead=_settings.profile_max_overhead,
+)
+
+def profile_requested(scope) -> bool:
+    """Whether the request asks to be profiled, from its headers alone."""
+    return any(name == PROFILE_HEADER and value.lower() in PROFILE_HEADER_VALUES for name, value in scope["headers"])
+
+class ProfilingMiddleware:
+    """Profiles sampled requests, and requests with an `X-Profile: 1` header for which `authorize(request)` is true."""
+
+    def __init__(self, app, authorize: Callable[[Request], Awaitable[bool]], profiler: SamplingProfiler = profiler):
+        self.app = app
+        self.authorize = authorize
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Only requests asking for a profile pay for `authorize`, which may decode a token and load the user
+        if profile_requested(scope):
+            profile = await self.authorize(Request(scope))
+        else:
+            profile = self.profiler.wants()
+        sampler = self.profiler.begin() if profile else None
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profiled", b"1")]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            self.profiler.end(sampler, getattr(scope.get("route"), "path", "unmatched"))
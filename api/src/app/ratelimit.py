@@ -0,0 +1,180 @@
+"""
+Rate limiting for the authentication routes.
+
+Every request to the login, callback and refresh routes takes a token from its client IP's bucket, and requests that
+identify a user (a valid bearer token, or the Google callback once the email is known) also take one from that user's
+bucket. Buckets refill at RATE_LIMIT_*_RATE tokens per second up to RATE_LIMIT_*_BURST; an empty bucket answers 429
+with Retry-After.
+
+RATE_LIMIT_BACKEND selects where buckets live:
+
+- `memory`: a per-worker LRU of at most RATE_LIMIT_MAX_KEYS buckets (O(1) per request, evicting the least recently
+  used key; an evicted key starts again with a full bucket)
+- `sqlite`: a SQLite file (RATE_LIMIT_SQLITE_PATH) shared by all workers on one host, a local stand-in for a shared
+  store such as Redis behind the same `RateLimitBackend` interface
+"""
+import math
+import time
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any, Protocol
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from .settings import Settings, get_settings
+from .tokens import TokenError, decode_token
+
+@dataclass(frozen=True)
+class Limit:
+    # Tokens added per second, and bucket capacity
+    rate: float
+    burst: float
+
+class RateLimitBackend(Protocol):
+    # Whether `acquire` does I/O and must run in the thread pool
+    blocking: bool
+
+    def acquire(self, key: str, limit: Limit) -> float:
+        """Take a token from `key`'s bucket; returns 0 if one was available, else seconds until the next one."""
+        ...
+
+def _take(tokens: float, updated_at: float, now: float, limit: Limit) -> tuple[float, float]:
+    """Refill a bucket and try to take a token; returns (remaining tokens, seconds to wait or 0)."""
+    tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.rate
+
+class MemoryBackend:
+    blocking = False
+
+    def __init__(self, maxsize: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        # key -> [tokens, updated_at]
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: str, limit: Limit) -> float:
+        now = self._clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0], wait = _take(bucket[0], bucket[1], now, limit)
+            bucket[1] = now
+            return wait
+
+class SQLiteBackend:
+    blocking = True
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        # Wall-clock time, since the buckets are shared between processes
+        self._clock = clock
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, key: str, limit: Limit) -> float:
+        connection = self._connection()
+        now = self._clock()
+        # IMMEDIATE takes the write lock up front, so concurrent workers cannot both take the last token
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated_at = row or (limit.burst, now)
+            tokens, wait = _take(tokens, updated_at, now, limit)
+            connection.execute("INSERT OR REPLACE INTO bucket (key, tokens, updated_at) VALUES (?, ?, ?)",
+                               (key, tokens, now))
+            # Buckets idle for an hour are full again anyway; drop them now and then
+            if secrets.randbelow(1000) == 0:
+                connection.execute("DELETE FROM bucket WHERE updated_at < ?", (now - 3600,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, limits: Mapping[str, Limit], enabled: bool = True):
+        self.backend = backend
+        # Limit per kind of key ("ip", "user")
+        self.limits = dict(limits)
+        self.enabled = enabled
+        self.allowed = 0
+        self.limited = 0
+
+    async def check(self, kind: str, identity: str) -> None:
+        """Take a token for `identity`, or raise 429 if its bucket is empty."""
+        if not self.enabled:
+            return
+        key = f"{kind}:{identity}"
+        if self.backend.blocking:
+            wait = await run_in_threadpool(self.backend.acquire, key, self.limits[kind])
+        else:
+            wait = self.backend.acquire(key, self.limits[kind])
+        if wait:
+            self.limited += 1
+            raise HTTPException(
+                status_code=429, detail="Too many requests", headers={"Retry-After": str(math.ceil(wait))}
+            )
+        self.allowed += 1
+
+    def stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {"enabled": self.enabled, "allowed": self.allowed, "limited": self.limited}
+        if isinstance(self.backend, MemoryBackend):
+            stats.update(keys=len(self.backend), evictions=self.backend.evictions)
+        return stats
+
+def create_rate_limiter(settings: Settings) -> RateLimiter:
+    if settings.rate_limit_backend == "memory":
+        backend: RateLimitBackend = MemoryBackend(maxsize=settings.rate_limit_max_keys)
+    elif settings.rate_limit_backend == "sqlite":
+        backend = SQLiteBackend(settings.rate_limit_sqlite_path)
+    else:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND '{settings.rate_limit_backend}'; expected memory or sqlite.")
+    limits = {
+        "ip": Limit(settings.rate_limit_ip_rate, settings.rate_limit_ip_burst),
+        "user": Limit(settings.rate_limit_user_rate, settings.rate_limit_user_burst),
+    }
+    return RateLimiter(backend, limits, enabled=settings.rate_limit_enabled)
+
+rate_limiter = create_rate_limiter(get_settings())
+
+# Dependency: rate limit by client IP, and by user when the request carries a valid token
+async def rate_limit(request: Request) -> None:
+    if not rate_limiter.enabled:
+        return
+    await rate_limiter.check("ip", request.client.host if request.client else "unknown")
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        try:
+            email = decode_token(auth_header.split(" ", 1)[1]).get("email")
+        except TokenError:
+            # The route itself rejects the token
+            return
+        if email:
+            await rate_limiter.check("user", email.lower())
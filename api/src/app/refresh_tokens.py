@@ -0,0 +1,97 @@
+"""
+Rotating refresh tokens.
+
+A login (the Google callback) returns a short-lived access token (ACCESS_TOKEN_TTL) and a refresh token valid for
+REFRESH_TOKEN_TTL. `POST /auth/refresh` exchanges the refresh token for a new access token and a new refresh token,
+with one primary-key lookup of the token's digest joined to its user, instead of a new OAuth round trip through Google.
+
+Each refresh token can be used once. A token presented again within REFRESH_TOKEN_REUSE_GRACE seconds of its rotation
+is taken for a concurrent refresh (two tabs, or a client retrying after a timeout) and gets another successor in the
+same family. Presented later, it was most likely copied and replayed, so the whole family of tokens descending from
+that login is revoked and the user has to log in again.
+"""
+import uuid
+import hashlib
+import secrets
+import datetime
+from typing import TYPE_CHECKING, cast
+from sqlalchemy import CursorResult, delete, select, update
+from sqlalchemy.orm import Session
+from .models import RefreshToken, User
+from .settings import get_settings
+from .users import UserSnapshot
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+REFRESH_TOKEN_LIFETIME = datetime.timedelta(seconds=get_settings().refresh_token_ttl)
+REFRESH_TOKEN_REUSE_GRACE = datetime.timedelta(seconds=get_settings().refresh_token_reuse_grace)
+
+class RefreshTokenError(Exception):
+    """The refresh token is unknown, expired, already used, or its user is gone."""
+
+class InactiveUserError(RefreshTokenError):
+    """The refresh token is valid but its user has been deactivated."""
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_refresh_token(session: Session, user_id: uuid.UUID, family_id: str | None = None) -> str:
+    """Store a new refresh token for `user_id` (a new family for a login) and commit; returns the token."""
+    now = datetime.datetime.utcnow()
+    token = secrets.token_urlsafe(32)
+    session.add(RefreshToken(
+        token_hash=hash_token(token),
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=now + REFRESH_TOKEN_LIFETIME,
+    ))
+    # Expired tokens are useless; drop them now and then
+    if secrets.randbelow(100) == 0:
+        session.execute(delete(RefreshToken).where(RefreshToken.expires_at <= now))
+    session.commit()
+    return token
+
+def rotate_refresh_token(session: Session, token: str) -> tuple[UserSnapshot, str]:
+    """Use up `token` and issue its successor; returns the token's user and the new refresh token."""
+    now = datetime.datetime.utcnow()
+    token_hash = hash_token(token)
+    row = session.execute(
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == token_hash)
+    ).first()
+    if row is None:
+        raise RefreshTokenError("Unknown refresh token")
+    refresh_token, user = row
+    if refresh_token.expires_at <= now:
+        raise RefreshTokenError("Expired refresh token")
+    if not user.is_active:
+        raise InactiveUserError("Inactive user")
+    # The conditional UPDATE also settles two concurrent uses of the same token: only one of them rotates it
+    rotated = cast(CursorResult, session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash, RefreshToken.rotated_at.is_(None))
+        .values(rotated_at=now)
+    ))
+    if rotated.rowcount != 1:
+        # When the token was rotated, as committed by the other use (None if its family was revoked meanwhile)
+        rotated_at = session.scalar(select(RefreshToken.rotated_at).where(RefreshToken.token_hash == token_hash))
+        if rotated_at is None or now - rotated_at > REFRESH_TOKEN_REUSE_GRACE:
+            session.execute(delete(RefreshToken).where(RefreshToken.family_id == refresh_token.family_id))
+            session.commit()
+            raise RefreshTokenError("Refresh token reused")
+    snapshot = UserSnapshot.from_user(user)
+    return snapshot, issue_refresh_token(session, user.id, refresh_token.family_id)
+
+async def issue_refresh_token_async(session: "AsyncSession", user_id: uuid.UUID) -> str:
+    """Async version of `issue_refresh_token`."""
+    return await session.run_sync(issue_refresh_token, user_id)
+
+async def rotate_refresh_token_async(session: "AsyncSession", token: str) -> tuple[UserSnapshot, str]:
+    """Async version of `rotate_refresh_token`."""
+    return await session.run_sync(rotate_refresh_token, token)
+
+def revoke_refresh_tokens(session: Session, user_id: uuid.UUID) -> None:
+    """Delete all refresh tokens of a user; the caller commits."""
+    session.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
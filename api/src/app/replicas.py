@@ -0,0 +1,182 @@
+"""
+Read-replica routing for read-only queries.
+
+With DATABASE_REPLICA_URLS set, sessions from `read_session` (and `async_read_session`) send their reads to one of the
+replicas, picked per session by `replica_router`: round-robin or the replica with the fewest checked-out connections
+(DB_REPLICA_STRATEGY). A replica whose query fails with a connection error is ejected for DB_REPLICA_EJECT_SECONDS and
+the read is retried on the primary; with no healthy replica, reads go to the primary. As soon as a session writes
+(flushes or executes an INSERT/UPDATE/DELETE), it uses the primary for everything that follows.
+
+Writes such as the OAuth login upsert and the admin CLI's add/del keep using `get_session(get_engine())`, i.e. the
+primary. A user who has just logged in reads from the primary for READ_YOUR_WRITES_SECONDS (see `pin_primary` and
+`needs_primary`), so replication lag cannot hide the login from the requests that follow it.
+"""
+import time
+import threading
+from collections.abc import Awaitable, Callable, Hashable, Mapping, Sequence
+from typing import TYPE_CHECKING, Any, TypeVar, cast
+from sqlalchemy import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from .cache import TTLCache
+from .db import get_async_engine, get_async_replica_engines, get_engine, get_replica_engines
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+STRATEGIES = ("round_robin", "least_connections")
+
+def _checked_out(engine: Engine) -> int:
+    pool = engine.pool
+    return pool.checkedout() if isinstance(pool, QueuePool) else 0
+
+class ReplicaRouter:
+    """Picks a healthy replica per session, and ejects replicas whose queries fail."""
+
+    def __init__(
+        self, strategy: str = "round_robin", eject_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ):
+        if strategy not in STRATEGIES:
+            raise RuntimeError(f"Unknown DB_REPLICA_STRATEGY '{strategy}'; expected one of {', '.join(STRATEGIES)}.")
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+        # replica URL -> time until which it is not used
+        self._ejected: dict[str, float] = {}
+        self.reads: dict[str, int] = {}
+        self.primary_reads = 0
+        self.ejections = 0
+
+    def choose(self, replicas: Sequence[Engine]) -> Engine | None:
+        """A healthy replica for a new session, or None to read from the primary."""
+        with self._lock:
+            now = self._clock()
+            healthy = [e for e in replicas if self._ejected.get(str(e.url), 0.0) <= now]
+            if not healthy:
+                self.primary_reads += 1
+                return None
+            if self.strategy == "least_connections":
+                engine = min(healthy, key=_checked_out)
+            else:
+                engine = healthy[self._next % len(healthy)]
+                self._next += 1
+            key = str(engine.url)
+            self.reads[key] = self.reads.get(key, 0) + 1
+            return engine
+
+    def eject(self, engine: Engine) -> None:
+        with self._lock:
+            self._ejected[str(engine.url)] = self._clock() + self.eject_seconds
+            self.ejections += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ejected.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            now = self._clock()
+            return {
+                "strategy": self.strategy,
+                "replica_reads": sum(self.reads.values()),
+                "primary_reads": self.primary_reads,
+                "ejections": self.ejections,
+                "ejected": sum(1 for until in self._ejected.values() if until > now),
+            }
+
+_settings = get_settings()
+replica_router = ReplicaRouter(strategy=_settings.db_replica_strategy, eject_seconds=_settings.db_replica_eject_seconds)
+
+# Users who have just logged in on this worker, read from the primary until the entry expires
+_recent_writes: TTLCache[Hashable, bool] = TTLCache(maxsize=10000, ttl=_settings.read_your_writes_seconds)
+
+def pin_primary(key: Hashable) -> None:
+    """Read `key`'s data (e.g. a user id) from the primary for the next READ_YOUR_WRITES_SECONDS on this worker."""
+    _recent_writes.set(key, True)
+
+def needs_primary(key: Hashable, claims: Mapping[str, Any] | None = None) -> bool:
+    """Whether reads for `key` must see the primary: it was pinned here, or its token was issued (at login, possibly
+    by another worker) within READ_YOUR_WRITES_SECONDS."""
+    if _recent_writes.get(key):
+        return True
+    issued_at = (claims or {}).get("iat")
+    return isinstance(issued_at, (int, float)) and time.time() - issued_at < _settings.read_your_writes_seconds
+
+class RoutingSession(Session):
+    """A session that reads from a replica and writes (and then reads) on the primary."""
+
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: Sequence[Engine] = (),
+        use_primary: bool = False,
+        router: ReplicaRouter | None = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.primary = primary
+        self.replicas = replicas
+        self.use_primary = use_primary or not replicas
+        self.router = router or replica_router
+        # The replica used by this session, chosen on its first read
+        self.replica: Engine | None = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.use_primary or self._flushing or getattr(clause, "is_dml", False):
+            # Read your own writes for the rest of the session
+            self.use_primary = True
+            return self.primary
+        if self.replica is None:
+            self.replica = self.router.choose(self.replicas)
+            if self.replica is None:
+                self.use_primary = True
+                return self.primary
+        return self.replica
+
+def read_session(use_primary: bool = False) -> RoutingSession:
+    """A session for read-only queries on DATABASE_URL's replicas (the primary itself if there are none)."""
+    return RoutingSession(get_engine(), get_replica_engines(), use_primary=use_primary, autoflush=False)
+
+def async_read_session(use_primary: bool = False) -> "AsyncSession":
+    """Async version of `read_session`, for DATABASE_ASYNC."""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    replicas = [engine.sync_engine for engine in get_async_replica_engines()]
+    return AsyncSession(
+        sync_session_class=RoutingSession,
+        primary=get_async_engine().sync_engine,
+        replicas=replicas,
+        use_primary=use_primary,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+def run_read(query: Callable[[Session], T], use_primary: bool = False) -> T:
+    """Run `query` in a `read_session`; if its replica fails, eject it and run `query` again on the primary."""
+    with read_session(use_primary) as session:
+        try:
+            return query(session)
+        except OperationalError:
+            if session.replica is None:
+                raise
+            session.router.eject(session.replica)
+    with read_session(use_primary=True) as session:
+        return query(session)
+
+async def run_read_async(query: Callable[["AsyncSession"], Awaitable[T]], use_primary: bool = False) -> T:
+    """Async version of `run_read`."""
+    async with async_read_session(use_primary) as session:
+        try:
+            return await query(session)
+        except OperationalError:
+            routing = cast(RoutingSession, session.sync_session)
+            if routing.replica is None:
+                raise
+            routing.router.eject(routing.replica)
+    async with async_read_session(use_primary=True) as session:
+        return await query(session)
@@ -0,0 +1,37 @@
+"""
+JSON response class and conditional-request helpers.
+
+JSON_RESPONSE selects how `auth_router` and the healthcheck router serialize JSON: `orjson`
+(`poetry install -E orjson`), `json` (the standard library, via Starlette's `JSONResponse`) or `auto` (orjson when it
+is installed, the default). Both produce the same compact UTF-8 output, so clients and ETags do not depend on the
+choice.
+"""
+import hashlib
+from fastapi.responses import JSONResponse, ORJSONResponse
+from .settings import get_settings
+
+def json_response_class(name: str) -> type[JSONResponse]:
+    if name not in ("auto", "orjson", "json"):
+        raise RuntimeError(f"Unknown JSON_RESPONSE '{name}'; expected auto, orjson or json.")
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        if name == "orjson":
+            raise RuntimeError("JSON_RESPONSE=orjson requires the orjson package (poetry install -E orjson).")
+        return JSONResponse
+    return JSONResponse if name == "json" else ORJSONResponse
+
+DefaultJSONResponse = json_response_class(get_settings().json_response)
+
+def make_etag(*fields: object) -> str:
+    """A strong ETag for a response whose body is determined by `fields`."""
+    digest = hashlib.blake2b("\x1f".join(map(str, fields)).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header lists `etag` (weak comparison, as RFC 9110 requires for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,212 @@
+"""
+Token revocation without a database query per request.
+
+Revocations are rows in the `token_revocation` table, written by `admin revoke token|user` (and `admin user del`): a
+single token by its `jti` claim, or every token of a user issued before the revocation. Each worker keeps them in
+memory in `revocations`: a bloom filter of the revoked token ids, which answers "not revoked" for almost every
+token with a few bit tests, backed by the exact set of ids (so a bloom false positive never rejects a valid token),
+and the revocation time per user. A background task (started in the app's `lifespan` hook) loads the rows recorded
+since its last refresh every REVOCATION_REFRESH_MS milliseconds, so a revocation is enforced by all workers within
+that interval. Revocations are forgotten once every token they apply to has expired.
+"""
+import math
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import datetime
+from collections.abc import Iterable, Mapping
+from typing import Any
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from .db import get_engine, get_session
+from .models import TokenRevocation
+from .refresh_tokens import revoke_refresh_tokens
+from .settings import get_settings
+from .tokens import ACCESS_TOKEN_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+# Each refresh re-reads this much of the past, so that rows committed late (with an earlier revoked_at) are not missed
+REFRESH_OVERLAP = datetime.timedelta(seconds=60)
+# How often expired revocations are dropped and the bloom filter is rebuilt
+COMPACT_INTERVAL = 3600.0
+
+def _timestamp(value: datetime.datetime) -> float:
+    # Naive datetimes in the database are UTC
+    return value.replace(tzinfo=value.tzinfo or datetime.timezone.utc).timestamp()
+
+class BloomFilter:
+    """Set membership with false positives (at about `error_rate`) but no false negatives, in ~10 bits per item."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.error_rate = error_rate
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    def __init__(self, refresh_interval: float = 2.0, capacity: int = 1024, error_rate: float = 0.01):
+        self.refresh_interval = refresh_interval
+        self.error_rate = error_rate
+        # jti -> expiry timestamp, the exact set behind the bloom filter
+        self._tokens: dict[str, float] = {}
+        # user id (as in the "sub" claim) -> (revocation timestamp, expiry timestamp)
+        self._users: dict[str, tuple[float, float]] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._since: datetime.datetime | None = None
+        self._compacted_at = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.last_refresh_at = 0.0
+        self.bloom_positives = 0
+        self.false_positives = 0
+        self.rejected = 0
+
+    def is_revoked(self, claims: Mapping[str, Any]) -> bool:
+        """Whether the verified `claims` belong to a revoked token."""
+        revoked = False
+        jti = claims.get("jti")
+        if jti and jti in self._bloom:
+            self.bloom_positives += 1
+            revoked = jti in self._tokens
+            if not revoked:
+                self.false_positives += 1
+        if not revoked and self._users:
+            user = self._users.get(str(claims.get("sub")))
+            # Tokens without an issue time predate revocation support, and are revoked with their user
+            revoked = user is not None and claims.get("iat", 0) <= user[0]
+        if revoked:
+            self.rejected += 1
+        return revoked
+
+    def add(self, rows: Iterable[TokenRevocation]) -> None:
+        for row in rows:
+            expires_at = _timestamp(row.expires_at)
+            if row.jti is not None and row.jti not in self._tokens:
+                self._tokens[row.jti] = expires_at
+                self._bloom.add(row.jti)
+            if row.user_id is not None:
+                revoked_at = _timestamp(row.revoked_at)
+                previous = self._users.get(str(row.user_id))
+                if previous is None or previous[0] < revoked_at:
+                    self._users[str(row.user_id)] = (revoked_at, expires_at)
+        if self._bloom.count > self._bloom.capacity:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        bloom = BloomFilter(max(1024, 2 * len(self._tokens)), self.error_rate)
+        for jti in self._tokens:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def compact(self, now: float | None = None) -> None:
+        """Drop revocations whose tokens have all expired, and shrink the bloom filter accordingly."""
+        now = time.time() if now is None else now
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        self._users = {user: entry for user, entry in self._users.items() if entry[1] > now}
+        self._rebuild()
+        self._compacted_at = time.monotonic()
+
+    def _load(self, since: datetime.datetime | None) -> list[TokenRevocation]:
+        stmt = select(TokenRevocation).where(TokenRevocation.expires_at > datetime.datetime.utcnow())
+        if since is not None:
+            stmt = stmt.where(TokenRevocation.revoked_at >= since - REFRESH_OVERLAP)
+        with get_session(get_engine()) as session:
+            return list(session.scalars(stmt))
+
+    async def refresh(self) -> None:
+        """Load the revocations recorded since the last refresh (all current ones on the first call)."""
+        started = datetime.datetime.utcnow()
+        try:
+            rows = await asyncio.to_thread(self._load, self._since)
+        except SQLAlchemyError:
+            self.failed_refreshes += 1
+            logger.exception("Loading token revocations failed; retrying with the next refresh")
+            return
+        self.add(rows)
+        self._since = started
+        self.refreshes += 1
+        self.last_refresh_at = time.time()
+        if time.monotonic() - self._compacted_at >= COMPACT_INTERVAL:
+            self.compact()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Load the current revocations, then keep refreshing them in the background."""
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._users.clear()
+        self._rebuild()
+        self._since = None
+
+    def stats(self) -> dict:
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "bloom_bytes": len(self._bloom.bits),
+            "bloom_positives": self.bloom_positives,
+            "false_positives": self.false_positives,
+            "rejected": self.rejected,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "seconds_since_refresh": round(time.time() - self.last_refresh_at, 3) if self.last_refresh_at else None,
+        }
+
+revocations = RevocationList(refresh_interval=get_settings().revocation_refresh_ms / 1000)
+
+def revoke_token(session: Session, jti: str) -> TokenRevocation:
+    """Record the revocation of one token; the caller commits."""
+    now = datetime.datetime.utcnow()
+    revocation = TokenRevocation(jti=jti, revoked_at=now, expires_at=now + ACCESS_TOKEN_LIFETIME)
+    session.add(revocation)
+    return revocation
+
+def revoke_user(session: Session, user_id: uuid.UUID) -> TokenRevocation:
+    """Record the revocation of all tokens issued to a user until now, and delete their refresh tokens; the caller
+    commits."""
+    now = datetime.datetime.utcnow()
+    revoke_refresh_tokens(session, user_id)
+    # "iat" has whole seconds: round up, so that a token issued earlier within the same second is revoked too,
+    # whatever precision the database keeps
+    revoked_at = now.replace(microsecond=0) + datetime.timedelta(seconds=1)
+    revocation = TokenRevocation(user_id=user_id, revoked_at=revoked_at, expires_at=revoked_at + ACCESS_TOKEN_LIFETIME)
+    session.add(revocation)
+    return revocation
@@ -0,0 +1,209 @@
+"""
+Production server: `serve` (or `python -m app.server`), a pre-forking master running uvicorn workers.
+
+The master binds the listening socket, imports the app once (preload), brings the database schema up to date (so that
+workers do not race to migrate it) and freezes the imported objects out of the garbage collector, then forks the
+workers, which share the socket and the imported modules' memory copy-on-write. Each worker opens its own database
+connections in its `lifespan` hook, and warms up (`app.warmup`) before it accepts connections. The master replaces
+workers that exit unexpectedly, and exits if a worker fails to start.
+
+On SIGTERM (or SIGINT) the master signals the workers to drain: each one answers its readiness probe with 503 while
+still serving for DRAIN_SECONDS, so that the load balancer takes it out of rotation first, then stops accepting
+connections, lets the requests in flight finish (for up to GRACEFUL_TIMEOUT seconds) and runs its lifespan shutdown.
+Workers still running after that are killed. A second SIGINT (Ctrl+C) stops a worker without the drain delay.
+"""
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import uvicorn
+
+logger = logging.getLogger("uvicorn.error")
+
+# A worker exiting this soon after its start is failing at startup; wait before replacing it
+MIN_WORKER_UPTIME = 1.0
+# Exit status of a worker whose lifespan startup failed
+WORKER_BOOT_ERROR = 3
+# Signals the master handles by stopping the workers; blocked around fork() until the worker has replaced the handlers
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that reports "not ready" and keeps serving for `drain_seconds` before shutting down."""
+
+    def __init__(self, config: uvicorn.Config, drain_seconds: float = 0.0):
+        super().__init__(config)
+        self.drain_seconds = drain_seconds
+        self.drain_deadline: float | None = None
+
+    def handle_exit(self, sig, frame) -> None:
+        if self.drain_deadline is None and self.drain_seconds > 0:
+            from .health import readiness
+            readiness.accepting = False
+            self.drain_deadline = time.monotonic() + self.drain_seconds
+            logger.info("Draining for %.1f s before shutting down", self.drain_seconds)
+        elif self.drain_deadline is not None and sig == signal.SIGTERM:
+            # Repeated by the master (a Ctrl+C reaches the whole process group): keep draining
+            pass
+        else:
+            super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_deadline is not None and time.monotonic() >= self.drain_deadline:
+            self.should_exit = True
+        return await super().on_tick(counter)
+
+def preload() -> None:
+    """Import the app, build what does not hold connections and migrate the schema, before forking."""
+    from .main import my_app  # noqa: F401
+    from .auth import get_oauth
+    from .db import dispose_engines, get_engine
+    from .migrations import ensure_schema
+    get_oauth()
+    ensure_schema(get_engine())
+    # Connections must not be shared with the workers
+    dispose_engines()
+    # Objects that live as long as the process: keep the collector from touching (and copying) their pages
+    gc.freeze()
+
+def run_worker(config: uvicorn.Config, sock: socket.socket, drain_seconds: float) -> None:
+    """Serve on the inherited socket in a forked worker process; never returns."""
+    status = 1
+    try:
+        # The master's handlers are inherited; uvicorn installs its own for the duration of `run`, and would raise
+        # the signals it received again once it returns
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        server = DrainingServer(config, drain_seconds)
+        server.run(sockets=[sock])
+        status = 0 if server.started else WORKER_BOOT_ERROR
+    except BaseException:
+        logger.exception("Worker %d failed", os.getpid())
+    finally:
+        logging.shutdown()
+        os._exit(status)
+
+class Master:
+    def __init__(self, config: uvicorn.Config, workers: int, drain_seconds: float, graceful_timeout: float):
+        self.config = config
+        self.workers = workers
+        self.drain_seconds = drain_seconds
+        self.graceful_timeout = graceful_timeout
+        # pid -> start time
+        self.children: dict[int, float] = {}
+        self.stopping = False
+        self.failed = False
+        self.stop_deadline = 0.0
+        self.sock: socket.socket | None = None
+
+    def spawn(self) -> None:
+        assert self.sock is not None
+        # Until the worker ignores them, a SIGTERM or SIGINT would run the master's handler in the worker
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                run_worker(self.config, self.sock, self.drain_seconds)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        self.children[pid] = time.monotonic()
+        logger.info("Started worker %d", pid)
+
+    def stop(self, sig, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        # Leave the workers time to drain and finish their requests and lifespan shutdown
+        self.stop_deadline = time.monotonic() + self.drain_seconds + self.graceful_timeout + 5
+        logger.info("Stopping %d workers", len(self.children))
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> None:
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if os.waitstatus_to_exitcode(status) == WORKER_BOOT_ERROR:
+                logger.error("Worker %d failed to start, shutting down", pid)
+                self.failed = True
+                self.stop(None, None)
+                continue
+            logger.warning("Worker %d exited (%s), replacing it", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+            self.spawn()
+
+    def run(self) -> int:
+        self.sock = sock = self.config.bind_socket()
+        preload()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info("Master %d preloaded the app, starting %d workers", os.getpid(), self.workers)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children:
+            self.reap()
+            if self.stopping and time.monotonic() >= self.stop_deadline:
+                for pid in list(self.children):
+                    logger.warning("Killing worker %d", pid)
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                self.stop_deadline = float("inf")
+            time.sleep(0.1)
+        sock.close()
+        logger.info("Stopped")
+        return 1 if self.failed else 0
+
+def main(argv: list[str] | None = None) -> None:
+    env = os.environ
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=env.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(env.get("PORT", "8000")))
+    parser.add_argument(
+        "-w", "--workers", type=int, default=int(env.get("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        help="number of worker processes (default: WEB_CONCURRENCY, or the number of CPUs)",
+    )
+    parser.add_argument("--backlog", type=int, default=int(env.get("BACKLOG", "2048")),
+                        help="listen queue length")
+    parser.add_argument("--keepalive", type=float, default=float(env.get("KEEPALIVE_TIMEOUT", "5")),
+                        help="idle keep-alive connection timeout in seconds")
+    parser.add_argument("--drain-seconds", type=float, default=float(env.get("DRAIN_SECONDS", "5")),
+                        help="how long a stopping worker keeps serving while its readiness probe fails")
+    parser.add_argument("--graceful-timeout", type=float, default=float(env.get("GRACEFUL_TIMEOUT", "30")),
+                        help="how long a stopping worker waits for its requests in flight")
+    parser.add_argument("--forwarded-allow-ips", default=env.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="proxies trusted for X-Forwarded-For (the client IP used by rate limiting)")
+    parser.add_argument("--no-access-log", action="store_true", help="disable uvicorn's access log")
+    args = parser.parse_args(argv)
+    if sys.platform == "win32":
+        parser.error("serve needs fork(); use uvicorn app:my_app on Windows")
+
+    config = uvicorn.Config(
+        "app:my_app",
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keepalive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        access_log=not args.no_access_log,
+        lifespan="on",
+    )
+    sys.exit(Master(config, max(args.workers, 1), args.drain_seconds, args.graceful_timeout).run())
+
+if __name__ == "__main__":
+    main()
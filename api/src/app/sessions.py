@@ -0,0 +1,166 @@
+"""
+Sessions for the OAuth login flow only.
+
+The session holds nothing but authlib's OAuth state between `/auth/login/google` and the callback, so it is only
+loaded and saved on those paths (SESSION_PATHS); every other request skips the cookie parsing and signing entirely.
+
+SESSION_BACKEND selects where the data lives:
+
+- `cookie`: the signed cookie of Starlette's `SessionMiddleware` (no server-side state)
+- `memory`: a per-worker LRU with expiry, keyed by a short random cookie; only for single-worker deployments, since
+  the callback must reach the worker that started the login
+- `sqlite`: a SQLite file (SESSION_SQLITE_PATH) shared by all workers on one host, keyed by a short random cookie
+"""
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from collections.abc import Sequence
+from typing import Any, Protocol
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.requests import HTTPConnection
+from .cache import TTLCache
+from .settings import Settings
+
+DEFAULT_SESSION_PATHS = ("/api/v1/auth/login/", "/api/v1/auth/callback/")
+
+class SessionStore(Protocol):
+    """Server-side session data by session id."""
+    # Whether the methods do I/O and must run in the thread pool
+    blocking: bool
+
+    def load(self, session_id: str) -> dict[str, Any] | None: ...
+
+    def save(self, session_id: str, data: dict[str, Any], ttl: float) -> None: ...
+
+    def delete(self, session_id: str) -> None: ...
+
+class MemorySessionStore:
+    blocking = False
+
+    def __init__(self, maxsize: int = 10000):
+        self._sessions: TTLCache[str, str] = TTLCache(maxsize=maxsize, ttl=3600)
+
+    def load(self, session_id: str) -> dict[str, Any] | None:
+        data = self._sessions.get(session_id)
+        return None if data is None else json.loads(data)
+
+    def save(self, session_id: str, data: dict[str, Any], ttl: float) -> None:
+        # Stored serialized, so that later changes to the request's dict do not leak into the store
+        self._sessions.set(session_id, json.dumps(data), ttl=ttl)
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.invalidate(session_id)
+
+class SQLiteSessionStore:
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS session (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def load(self, session_id: str) -> dict[str, Any] | None:
+        row = self._connection().execute(
+            "SELECT data FROM session WHERE id = ? AND expires_at > ?", (session_id, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save(self, session_id: str, data: dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO session (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), now + ttl),
+        )
+        # Abandoned logins never reach the callback; drop their sessions now and then
+        if secrets.randbelow(100) == 0:
+            connection.execute("DELETE FROM session WHERE expires_at <= ?", (now,))
+
+    def delete(self, session_id: str) -> None:
+        self._connection().execute("DELETE FROM session WHERE id = ?", (session_id,))
+
+def create_session_store(settings: Settings) -> SessionStore | None:
+    """The store for SESSION_BACKEND; None for signed cookies."""
+    backend = settings.session_backend
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        return MemorySessionStore(maxsize=settings.session_memory_size)
+    if backend == "sqlite":
+        return SQLiteSessionStore(settings.session_sqlite_path)
+    raise RuntimeError(f"Unknown SESSION_BACKEND '{backend}'; expected cookie, memory or sqlite.")
+
+class ScopedSessionMiddleware:
+    """Provides `request.session` on requests below one of `paths`, and leaves all other requests untouched."""
+
+    def __init__(
+        self,
+        app,
+        secret_key: str,
+        paths: Sequence[str] = DEFAULT_SESSION_PATHS,
+        store: SessionStore | None = None,
+        session_cookie: str = "session",
+        max_age: int = 3600,
+        https_only: bool = False,
+    ):
+        self.app = app
+        self.paths = tuple(paths)
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.security_flags = "httponly; samesite=lax" + ("; secure" if https_only else "")
+        self.cookie_app = SessionMiddleware(
+            app, secret_key=secret_key, session_cookie=session_cookie, max_age=max_age, https_only=https_only
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+        elif self.store is None:
+            await self.cookie_app(scope, receive, send)
+        else:
+            await self._server_side(scope, receive, send)
+
+    async def _call_store(self, method, *args):
+        if self.store.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def _server_side(self, scope, receive, send):
+        session_id = HTTPConnection(scope).cookies.get(self.session_cookie)
+        initial = None
+        if session_id:
+            initial = await self._call_store(self.store.load, session_id)
+        scope["session"] = dict(initial or {})
+
+        async def send_with_cookie(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                cookie = None
+                if session and session != initial:
+                    session_id = session_id if initial else secrets.token_urlsafe(16)
+                    await self._call_store(self.store.save, session_id, session, self.max_age)
+                    cookie = f"{self.session_cookie}={session_id}; path=/; Max-Age={self.max_age}; "
+                elif not session and initial:
+                    await self._call_store(self.store.delete, session_id)
+                    cookie = f"{self.session_cookie}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+                if cookie:
+                    MutableHeaders(scope=message).append("Set-Cookie", cookie + self.security_flags)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
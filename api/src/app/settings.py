@@ -0,0 +1,179 @@
+"""
+Application settings.
+
+The environment (and the `.env` file, loaded once per process by `load_env`) is read into a frozen `Settings` object on
+first use. It holds the configuration of the process-wide objects that are built once: caches, background workers,
+middleware and the OAuth client. Settings that tests and tools switch per call (DATABASE_URL, DATABASE_REPLICA_URLS,
+the DB_POOL_* options, SCHEMA_AUTO_MIGRATE and OIDC_PRELOAD) are still read from the environment when they are used;
+DATABASE_ASYNC and the JWT_* signing configuration are resolved by the app's `lifespan` hook. Boolean variables are
+parsed by `env_flag`.
+"""
+import os
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+_env_loaded = False
+
+def load_env() -> None:
+    """Load the `.env` file into the environment, once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+def env_flag(name: str, default: bool, env: Mapping[str, str] = os.environ) -> bool:
+    """A boolean environment variable: "1", "true" or "yes" (in any case) switch it on."""
+    value = env.get(name)
+    return default if value is None else value.strip().lower() in ("1", "true", "yes")
+
+def _positive(name: str, value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise ValueError(f"{name} must be greater than 0, got {value!r}.")
+    return number
+
+def _at_least(name: str, value: str, minimum: float) -> float:
+    number = float(value)
+    if not number >= minimum:
+        raise ValueError(f"{name} must be at least {minimum:g}, got {value!r}.")
+    return number
+
+def _list(value: str) -> tuple[str, ...]:
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+@dataclass(frozen=True)
+class Settings:
+    # Google OAuth
+    google_client_id: str | None
+    google_client_secret: str | None
+    google_discovery_url: str
+    oidc_cache_file: str | None
+    frontend_origin: str
+    # Authentication
+    auth_trust_jwt_claims: bool
+    user_cache_size: int
+    user_cache_ttl: float
+    token_cache_size: int
+    revocation_refresh_ms: int
+    access_token_ttl: int
+    refresh_token_ttl: int
+    refresh_token_reuse_grace: float
+    # OAuth session
+    session_secret_key: str
+    session_backend: str
+    session_paths: tuple[str, ...]
+    session_max_age: int
+    session_memory_size: int
+    session_sqlite_path: str
+    # CORS
+    allow_origins: tuple[str, ...]
+    # last_login write-behind
+    last_login_write_behind: bool
+    last_login_flush_ms: int
+    last_login_flush_max: int
+    # Read replicas (DATABASE_REPLICA_URLS itself is read per call, like DATABASE_URL)
+    db_replica_strategy: str
+    db_replica_eject_seconds: float
+    read_your_writes_seconds: float
+    # JSON serialization (auto, orjson or json)
+    json_response: str
+    # Warm up each worker before it accepts requests
+    warmup: bool
+    # Observability
+    audit_log_path: str | None
+    audit_log_access: bool
+    audit_log_queue_size: int
+    audit_log_flush_ms: int
+    audit_log_max_bytes: int
+    audit_log_backups: int
+    slow_request_ms: float
+    metrics_token: str | None
+    profile_sample_rate: float
+    profile_dir: str
+    profile_interval_ms: int
+    profile_max_samples: int
+    profile_max_overhead: float
+    readiness_interval_ms: int
+    readiness_timeout_ms: int
+    readiness_max_pool_saturation: float | None
+    # Rate limiting of the auth routes
+    rate_limit_enabled: bool
+    rate_limit_backend: str
+    rate_limit_ip_rate: float
+    rate_limit_ip_burst: float
+    rate_limit_user_rate: float
+    rate_limit_user_burst: float
+    rate_limit_max_keys: int
+    rate_limit_sqlite_path: str
+
+    @classmethod
+    def from_env(cls, env: Mapping[str, str] = os.environ) -> "Settings":
+        max_saturation = env.get("READINESS_MAX_POOL_SATURATION")
+        return cls(
+            google_client_id=env.get("GOOGLE_CLIENT_ID"),
+            google_client_secret=env.get("GOOGLE_CLIENT_SECRET"),
+            google_discovery_url=env.get(
+                "GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration"
+            ),
+            oidc_cache_file=env.get("OIDC_CACHE_FILE") or None,
+            frontend_origin=env.get("FRONTEND_ORIGIN", "http://localhost:3000"),
+            auth_trust_jwt_claims=env_flag("AUTH_TRUST_JWT_CLAIMS", False, env),
+            user_cache_size=int(env.get("USER_CACHE_SIZE", "1024")),
+            user_cache_ttl=float(env.get("USER_CACHE_TTL", "30")),
+            token_cache_size=int(env.get("TOKEN_CACHE_SIZE", "4096")),
+            revocation_refresh_ms=int(env.get("REVOCATION_REFRESH_MS", "2000")),
+            access_token_ttl=int(env.get("ACCESS_TOKEN_TTL", "900")),
+            refresh_token_ttl=int(env.get("REFRESH_TOKEN_TTL", str(30 * 24 * 3600))),
+            refresh_token_reuse_grace=float(env.get("REFRESH_TOKEN_REUSE_GRACE", "5")),
+            session_secret_key=env.get("SESSION_SECRET_KEY", "dummy-session-secret"),
+            session_backend=env.get("SESSION_BACKEND", "cookie"),
+            session_paths=_list(env.get("SESSION_PATHS", "/api/v1/auth/login/,/api/v1/auth/callback/")),
+            session_max_age=int(env.get("SESSION_MAX_AGE", "3600")),
+            session_memory_size=int(env.get("SESSION_MEMORY_SIZE", "10000")),
+            session_sqlite_path=env.get("SESSION_SQLITE_PATH", "sessions.sqlite3"),
+            allow_origins=_list(env.get("ALLOW_ORIGINS", "http://localhost:3000")),
+            last_login_write_behind=env_flag("LAST_LOGIN_WRITE_BEHIND", False, env),
+            last_login_flush_ms=int(env.get("LAST_LOGIN_FLUSH_MS", "500")),
+            last_login_flush_max=int(env.get("LAST_LOGIN_FLUSH_MAX", "500")),
+            db_replica_strategy=env.get("DB_REPLICA_STRATEGY", "round_robin"),
+            db_replica_eject_seconds=float(env.get("DB_REPLICA_EJECT_SECONDS", "30")),
+            read_your_writes_seconds=float(env.get("READ_YOUR_WRITES_SECONDS", "10")),
+            json_response=env.get("JSON_RESPONSE", "auto"),
+            warmup=env_flag("WARMUP", True, env),
+            audit_log_path=env.get("AUDIT_LOG_PATH") or None,
+            audit_log_access=env_flag("AUDIT_LOG_ACCESS", True, env),
+            audit_log_queue_size=int(env.get("AUDIT_LOG_QUEUE_SIZE", "10000")),
+            audit_log_flush_ms=int(env.get("AUDIT_LOG_FLUSH_MS", "200")),
+            audit_log_max_bytes=int(env.get("AUDIT_LOG_MAX_BYTES", str(100 * 1024 * 1024))),
+            audit_log_backups=int(env.get("AUDIT_LOG_BACKUPS", "5")),
+            slow_request_ms=float(env.get("SLOW_REQUEST_MS", "1000")),
+            metrics_token=env.get("METRICS_TOKEN") or None,
+            profile_sample_rate=float(env.get("PROFILE_SAMPLE_RATE", "0")),
+            profile_dir=env.get("PROFILE_DIR", "profiles"),
+            profile_interval_ms=int(env.get("PROFILE_INTERVAL_MS", "5")),
+            profile_max_samples=int(env.get("PROFILE_MAX_SAMPLES", "2000")),
+            profile_max_overhead=float(env.get("PROFILE_MAX_OVERHEAD", "0.01")),
+            readiness_interval_ms=int(env.get("READINESS_INTERVAL_MS", "2000")),
+            readiness_timeout_ms=int(env.get("READINESS_TIMEOUT_MS", "1000")),
+            readiness_max_pool_saturation=float(max_saturation) if max_saturation else None,
+            rate_limit_enabled=env_flag("RATE_LIMIT_ENABLED", True, env),
+            rate_limit_backend=env.get("RATE_LIMIT_BACKEND", "memory"),
+            rate_limit_ip_rate=_positive("RATE_LIMIT_IP_RATE", env.get("RATE_LIMIT_IP_RATE", "5")),
+            # A request takes a whole token, so a smaller bucket rejects everything
+            rate_limit_ip_burst=_at_least("RATE_LIMIT_IP_BURST", env.get("RATE_LIMIT_IP_BURST", "60"), 1),
+            rate_limit_user_rate=_positive("RATE_LIMIT_USER_RATE", env.get("RATE_LIMIT_USER_RATE", "1")),
+            rate_limit_user_burst=_at_least("RATE_LIMIT_USER_BURST", env.get("RATE_LIMIT_USER_BURST", "20"), 1),
+            rate_limit_max_keys=int(env.get("RATE_LIMIT_MAX_KEYS", "100000")),
+            rate_limit_sqlite_path=env.get("RATE_LIMIT_SQLITE_PATH", "ratelimit.sqlite3"),
+        )
+
+_settings: Settings | None = None
+
+def get_settings() -> Settings:
+    """The process-wide settings, read from the environment on first use."""
+    global _settings
+    if _settings is None:
+        load_env()
+        _settings = Settings.from_env()
+    return _settings
@@ -0,0 +1,259 @@
+"""
+JWT encoding and verification.
+
+Tokens are encoded and verified by an interchangeable codec (python-jose, PyJWT, or a minimal HS256 codec built on the
+standard library), selected with JWT_BACKEND. Besides HS256 with a shared secret, tokens can be signed with RS256 or
+EdDSA keys; the key id ("kid" header) selects the verification key, so old keys can keep verifying tokens during a
+rotation, and the public keys are published as a JWKS for downstream services.
+
+The signing configuration and key objects are resolved once (at startup, or on first use) instead of on every
+request, and verified tokens are cached by their SHA-256 digest until shortly before they expire, so a repeated
+request skips the signature check and claim validation.
+"""
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import datetime
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Protocol
+from .cache import TTLCache
+from .settings import get_settings
+
+# Lifetime of access tokens (ACCESS_TOKEN_TTL seconds); also bounds how long a revocation must be remembered
+ACCESS_TOKEN_LIFETIME = datetime.timedelta(seconds=get_settings().access_token_ttl)
+# Cached tokens are dropped this many seconds before they expire
+EXPIRY_MARGIN = 5.0
+# Cache lifetime of tokens without an "exp" claim
+DEFAULT_TOKEN_TTL = 300.0
+
+class TokenError(Exception):
+    """The token is malformed, has an invalid signature or has expired."""
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _numeric_dates(claims: Mapping[str, Any]) -> dict[str, Any]:
+    """Convert datetime claims (such as "exp") to the NumericDate (seconds since epoch) the JWT spec requires."""
+    return {k: int(v.replace(tzinfo=v.tzinfo or datetime.timezone.utc).timestamp())
+            if isinstance(v, datetime.datetime) else v for k, v in claims.items()}
+
+def _select_key(keys: Mapping[str | None, Any], kid: str | None) -> Any:
+    key = keys.get(kid)
+    if key is None:
+        raise TokenError(f"Unknown key id: {kid}")
+    return key
+
+class TokenCodec(Protocol):
+    """Signs and verifies JWTs with pre-parsed keys.
+
+    `decode` picks the verification key by the token's "kid" header; tokens without one use the key stored under None.
+    """
+    name: str
+    algorithms: frozenset[str]
+
+    def prepare_key(self, key: Any, algorithm: str) -> Any: ...
+
+    def encode(self, claims: Mapping[str, Any], key: Any, algorithm: str, kid: str | None) -> str: ...
+
+    def decode(self, token: str, keys: Mapping[str | None, Any], algorithm: str) -> dict[str, Any]: ...
+
+class HS256Codec:
+    """Minimal HS256-only codec on top of `hmac`, without the generic machinery of the JWT libraries."""
+    name = "stdlib"
+    algorithms = frozenset({"HS256"})
+
+    def prepare_key(self, key: Any, algorithm: str) -> bytes:
+        return key.encode() if isinstance(key, str) else key
+
+    def encode(self, claims: Mapping[str, Any], key: bytes, algorithm: str, kid: str | None) -> str:
+        header: dict[str, Any] = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        signing_input = ".".join(
+            _b64encode(json.dumps(part, separators=(",", ":")).encode()) for part in (header, _numeric_dates(claims))
+        )
+        signature = hmac.new(key, signing_input.encode(), hashlib.sha256).digest()
+        return f"{signing_input}.{_b64encode(signature)}"
+
+    def decode(self, token: str, keys: Mapping[str | None, bytes], algorithm: str) -> dict[str, Any]:
+        try:
+            signing_input, signature = token.rsplit(".", 1)
+            header_segment, payload_segment = signing_input.split(".")
+            header = json.loads(_b64decode(header_segment))
+            expected = hmac.new(_select_key(keys, header.get("kid")), signing_input.encode(), hashlib.sha256).digest()
+            if header.get("alg") != algorithm or not hmac.compare_digest(expected, _b64decode(signature)):
+                raise TokenError("Signature verification failed")
+            claims = json.loads(_b64decode(payload_segment))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise TokenError("Malformed token") from e
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload")
+        now = time.time()
+        if "exp" in claims and not (isinstance(claims["exp"], (int, float)) and claims["exp"] > now):
+            raise TokenError("Signature has expired")
+        if "nbf" in claims and not (isinstance(claims["nbf"], (int, float)) and claims["nbf"] <= now):
+            raise TokenError("The token is not yet valid")
+        return claims
+
+class JoseCodec:
+    """python-jose backend (HS256, RS256)."""
+    name = "jose"
+    algorithms = frozenset({"HS256", "RS256"})
+
+    def __init__(self):
+        from jose import jwk, jwt, JWTError
+        self._jwk, self._jwt, self._error = jwk, jwt, JWTError
+
+    def prepare_key(self, key: Any, algorithm: str) -> Any:
+        return self._jwk.construct(key, algorithm)
+
+    def encode(self, claims: Mapping[str, Any], key: Any, algorithm: str, kid: str | None) -> str:
+        return self._jwt.encode(dict(claims), key, algorithm=algorithm, headers={"kid": kid} if kid else None)
+
+    def decode(self, token: str, keys: Mapping[str | None, Any], algorithm: str) -> dict[str, Any]:
+        try:
+            key = _select_key(keys, self._jwt.get_unverified_header(token).get("kid"))
+            return self._jwt.decode(token, key, algorithms=[algorithm])
+        except self._error as e:
+            raise TokenError(str(e)) from e
+
+class PyJWTCodec:
+    """PyJWT backend (HS256, RS256, EdDSA); requires the `pyjwt` extra."""
+    name = "pyjwt"
+    algorithms = frozenset({"HS256", "RS256", "EdDSA"})
+
+    def __init__(self):
+        import jwt
+        self._jwt = jwt
+
+    def prepare_key(self, key: Any, algorithm: str) -> Any:
+        return key
+
+    def encode(self, claims: Mapping[str, Any], key: Any, algorithm: str, kid: str | None) -> str:
+        return self._jwt.encode(dict(claims), key, algorithm=algorithm, headers={"kid": kid} if kid else None)
+
+    def decode(self, token: str, keys: Mapping[str | None, Any], algorithm: str) -> dict[str, Any]:
+        try:
+            key = _select_key(keys, self._jwt.get_unverified_header(token).get("kid"))
+            return self._jwt.decode(token, key, algorithms=[algorithm], options={"verify_aud": False})
+        except self._jwt.PyJWTError as e:
+            raise TokenError(str(e)) from e
+
+CODECS: dict[str, type[TokenCodec]] = {
+    "jose": JoseCodec,
+    "pyjwt": PyJWTCodec,
+    "stdlib": HS256Codec,
+}
+
+@dataclass(frozen=True)
+class JWTConfig:
+    codec: TokenCodec
+    algorithm: str
+    signing_key: Any
+    kid: str | None = None
+    verify_keys: Mapping[str | None, Any] = field(default_factory=dict)
+    # Public keys by kid, for the JWKS (empty for HS256)
+    public_keys: Mapping[str, Any] = field(default_factory=dict)
+
+def _load_pem(path: str, private: bool) -> Any:
+    from cryptography.hazmat.primitives import serialization
+    with open(path, "rb") as f:
+        data = f.read()
+    if private:
+        return serialization.load_pem_private_key(data, password=None)
+    return serialization.load_pem_public_key(data)
+
+def load_jwt_config(env: Mapping[str, str] = os.environ) -> JWTConfig:
+    """Build the signing configuration from JWT_* variables (see `.env.example`)."""
+    backend = env.get("JWT_BACKEND", "jose")
+    algorithm = env.get("JWT_ALGORITHM", "HS256")
+    if backend not in CODECS:
+        raise RuntimeError(f"Unknown JWT_BACKEND '{backend}'; expected one of {', '.join(CODECS)}.")
+    codec = CODECS[backend]()
+    if algorithm not in codec.algorithms:
+        raise RuntimeError(f"JWT_BACKEND '{backend}' does not support {algorithm}.")
+    kid = env.get("JWT_KEY_ID") or None
+    if algorithm == "HS256":
+        key = codec.prepare_key(env.get("JWT_SECRET", "changeme"), algorithm)
+        return JWTConfig(codec, algorithm, key, kid, {kid: key, None: key})
+    private_key_file = env.get("JWT_PRIVATE_KEY_FILE")
+    if not private_key_file or not kid:
+        raise RuntimeError(f"{algorithm} requires JWT_PRIVATE_KEY_FILE and JWT_KEY_ID.")
+    private_key = _load_pem(private_key_file, private=True)
+    public_keys = {kid: private_key.public_key()}
+    # Retired keys that still verify tokens: "kid=path,kid=path"
+    for entry in filter(None, (e.strip() for e in env.get("JWT_PUBLIC_KEY_FILES", "").split(","))):
+        old_kid, _, path = entry.partition("=")
+        public_keys[old_kid] = _load_pem(path, private=False)
+    verify_keys: dict[str | None, Any] = {k: codec.prepare_key(v, algorithm) for k, v in public_keys.items()}
+    verify_keys[None] = verify_keys[kid]
+    return JWTConfig(codec, algorithm, codec.prepare_key(private_key, algorithm), kid, verify_keys, public_keys)
+
+_config: JWTConfig | None = None
+
+def configure_jwt(config: JWTConfig | None = None) -> JWTConfig:
+    """Install `config` (default: load it from the environment) and clear the token cache."""
+    global _config
+    _config = config or load_jwt_config()
+    token_cache.clear()
+    return _config
+
+def jwt_config() -> JWTConfig:
+    return _config or configure_jwt()
+
+# Verified claims keyed by token digest; TOKEN_CACHE_SIZE=0 disables the cache
+token_cache: TTLCache[bytes, Mapping[str, Any]] = TTLCache(
+    maxsize=get_settings().token_cache_size,
+    ttl=DEFAULT_TOKEN_TTL,
+)
+
+def encode_token(claims: Mapping[str, Any]) -> str:
+    config = jwt_config()
+    return config.codec.encode(claims, config.signing_key, config.algorithm, config.kid)
+
+def verify_token(token: str) -> Mapping[str, Any]:
+    """Verify `token` and return its claims, without using the cache."""
+    config = jwt_config()
+    return MappingProxyType(config.codec.decode(token, config.verify_keys, config.algorithm))
+
+def decode_token(token: str) -> Mapping[str, Any]:
+    """Return the verified (read-only) claims of `token`, from the cache when it was verified recently."""
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = verify_token(token)
+        exp = claims.get("exp")
+        ttl = DEFAULT_TOKEN_TTL if exp is None else exp - time.time() - EXPIRY_MARGIN
+        if ttl > 0:
+            token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+def public_jwks(config: JWTConfig | None = None) -> dict[str, list[dict[str, str]]]:
+    """The verification keys as a JSON Web Key Set (RFC 7517)."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    config = config or jwt_config()
+    keys = []
+    for kid, key in config.public_keys.items():
+        if isinstance(key, rsa.RSAPublicKey):
+            numbers = key.public_numbers()
+            keys.append({
+                "kty": "RSA", "kid": kid, "use": "sig", "alg": "RS256",
+                "n": _b64encode(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, "big")),
+                "e": _b64encode(numbers.e.to_bytes((numbers.e.bit_length() + 7) // 8, "big")),
+            })
+        elif isinstance(key, ed25519.Ed25519PublicKey):
+            raw = key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+            keys.append({
+                "kty": "OKP", "crv": "Ed25519", "kid": kid, "use": "sig", "alg": "EdDSA",
+                "x": _b64encode(raw),
+            })
+    return {"keys": keys}
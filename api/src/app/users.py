@@ -0,0 +1,229 @@
+"""
+User persistence helpers shared by the API routes and the admin CLI.
+"""
+import uuid
+import datetime
+from dataclasses import dataclass
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from itertools import islice
+from typing import TYPE_CHECKING, Any
+from sqlalchemy import Select, literal, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Dialect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import ReturningInsert
+from .cache import TTLCache
+from .models import User, email_key
+from .settings import get_settings
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """Immutable copy of the `User` fields served by `/auth`, safe to share between requests."""
+    id: uuid.UUID
+    email: str
+    name: str
+    last_login: datetime.datetime | None
+    is_active: bool
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(user.id, user.email, user.name, user.last_login, user.is_active, user.is_admin)
+
+    @classmethod
+    def from_claims(cls, user_id: uuid.UUID, claims: Mapping[str, Any]) -> "UserSnapshot":
+        """Build a snapshot from verified JWT claims alone (the token carries no login time)."""
+        return cls(user_id, claims.get("email", ""), claims.get("name", ""), None, True, bool(claims.get("is_admin")))
+
+# Users looked up by id; USER_CACHE_SIZE=0 disables the cache
+user_cache: TTLCache[uuid.UUID, UserSnapshot] = TTLCache(
+    maxsize=get_settings().user_cache_size,
+    ttl=get_settings().user_cache_ttl,
+)
+
+def cache_user(user: User) -> UserSnapshot:
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.set(snapshot.id, snapshot)
+    return snapshot
+
+# INSERT statements with an ON CONFLICT clause
+UpsertInsert = postgresql.Insert | sqlite.Insert
+
+# Dialects supporting INSERT ... ON CONFLICT
+UPSERT_DIALECTS: dict[str, Callable[[type[User]], UpsertInsert]] = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+def _touch_login(user: User | None, email: str, name: str | None, touch: bool) -> tuple[User, bool]:
+    """Apply a login to `user` (or build a new one); return the user and whether it is new."""
+    now = datetime.datetime.utcnow()
+    if user is None:
+        user = User(email=email, name=name or email, last_login=now, is_active=True, is_admin=False)
+        return user, True
+    if touch:
+        user.last_login = now
+    user.name = name or user.name
+    return user, False
+
+def _select_and_touch(session: Session, email: str, name: str | None, touch: bool) -> User:
+    """Find-or-create in two statements, for databases without INSERT ... ON CONFLICT ... RETURNING."""
+    def touch_user() -> User:
+        existing = session.scalars(select(User).filter_by(email=email)).first()
+        user, created = _touch_login(existing, email, name, touch)
+        if created:
+            session.add(user)
+        session.flush()
+        return user
+
+    try:
+        return touch_user()
+    except IntegrityError:
+        # A concurrent login created the user first; the retry finds it
+        session.rollback()
+        return touch_user()
+
+def _login_upsert(
+    dialect: Dialect, email: str, name: str | None, touch: bool
+) -> ReturningInsert[tuple[User]] | None:
+    """The find-or-create-and-touch statement for a login, or None if the database cannot run it."""
+    if dialect.name not in UPSERT_DIALECTS or not dialect.insert_returning:
+        return None
+    stmt = UPSERT_DIALECTS[dialect.name](User).values(
+        email=email,
+        name=name or email,
+        last_login=datetime.datetime.utcnow(),
+        is_active=True,
+        is_admin=False,
+    )
+    changes: dict[str, Any] = {}
+    if touch:
+        changes["last_login"] = stmt.excluded.last_login
+    # Without a login time to record, the name is set to itself when unchanged, so that the conflict still updates the
+    # row and RETURNING yields it: the login stays one round trip
+    changes["name"] = stmt.excluded.name if name else User.name
+    return stmt.on_conflict_do_update(index_elements=[User.email], set_=changes).returning(User)
+
+def find_or_create_user(
+    session: Session, email: str, name: str | None = None, touch_last_login: bool = True
+) -> UserSnapshot:
+    """Find the user with `email` (creating it if needed), record the login and commit.
+
+    On PostgreSQL and SQLite this is a single INSERT ... ON CONFLICT (email) DO UPDATE ... RETURNING, which is also
+    safe against concurrent logins of the same user. The cached snapshot of the user is replaced by the new one.
+    Without `touch_last_login` an existing user's login time is left alone and the caller records it instead (see
+    `app.last_login`).
+    """
+    stmt = _login_upsert(session.get_bind().dialect, email, name, touch_last_login)
+    if stmt is None:
+        user = _select_and_touch(session, email, name, touch_last_login)
+    else:
+        user = session.scalars(stmt, execution_options={"populate_existing": True}).one()
+    snapshot = UserSnapshot.from_user(user)
+    session.commit()
+    user_cache.set(snapshot.id, snapshot)
+    return snapshot
+
+async def find_or_create_user_async(
+    session: "AsyncSession", email: str, name: str | None = None, touch_last_login: bool = True
+) -> UserSnapshot:
+    """Async version of `find_or_create_user`."""
+    return await session.run_sync(find_or_create_user, email, name, touch_last_login)
+
+# Columns set by a bulk import; anything else in an import row is ignored
+IMPORT_FIELDS = ("email", "name", "is_active", "is_admin")
+
+def _parse_bool(value: Any, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+def import_row(row: Mapping[str, Any]) -> dict[str, Any]:
+    """Validate and normalise one import record (CSV row or JSON object) into `user` column values."""
+    email = str(row.get("email") or "").strip()
+    if not email:
+        raise ValueError(f"Missing email in {dict(row)}")
+    return {
+        "email": email,
+        "name": str(row.get("name") or "").strip() or email,
+        "is_active": _parse_bool(row.get("is_active"), True),
+        "is_admin": _parse_bool(row.get("is_admin"), False),
+    }
+
+def _unique_emails(batch: list[Mapping[str, Any]], keep_last: bool) -> list[Mapping[str, Any]]:
+    """Drop rows repeating an email within one batch, which a single INSERT ... ON CONFLICT cannot write twice."""
+    rows: dict[str, Mapping[str, Any]] = {}
+    for row in batch:
+        if keep_last or row["email"] not in rows:
+            rows[row["email"]] = row
+    return list(rows.values())
+
+def upsert_users(session: Session, rows: Iterable[Mapping[str, Any]], batch_size: int = 1000,
+                 overwrite: bool = False) -> tuple[int, int]:
+    """Insert users in batches of `batch_size` with INSERT ... ON CONFLICT (email).
+
+    Existing users are updated when `overwrite` is set and left alone otherwise; a repeated email counts like
+    consecutive rows (the last one wins with `overwrite`, the first one otherwise). All batches run in the session's
+    current transaction; the caller commits. Returns the number of rows read and the number of users inserted or
+    updated.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        raise RuntimeError(f"Bulk import is not supported on {dialect}.")
+    stmt = UPSERT_DIALECTS[dialect](User)
+    upsert: UpsertInsert
+    if overwrite:
+        upsert = stmt.on_conflict_do_update(
+            index_elements=[User.email],
+            set_={field: stmt.excluded[field] for field in IMPORT_FIELDS if field != "email"},
+        )
+    else:
+        upsert = stmt.on_conflict_do_nothing(index_elements=[User.email])
+    # Skipped rows return nothing, so the returned ids count the users actually written
+    returning = upsert.returning(User.id)
+    submitted = written = 0
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        submitted += len(batch)
+        written += len(session.execute(returning, _unique_emails(batch, overwrite)).all())
+    return submitted, written
+
+def iter_users(session: Session, batch_size: int = 1000) -> Iterator[User]:
+    """Stream all users ordered by email, fetching `batch_size` rows at a time (server-side cursor on PostgreSQL)."""
+    stmt = select(User).order_by(User.email).execution_options(yield_per=batch_size)
+    yield from session.scalars(stmt)
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """The smallest string greater than every string starting with `prefix` (in code point order)."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def user_page_query(
+    limit: int,
+    after: tuple[str, uuid.UUID] | None = None,
+    email_prefix: str | None = None,
+    last_login_from: datetime.datetime | None = None,
+    last_login_to: datetime.datetime | None = None,
+) -> Select[tuple[User, str]]:
+    """One page of (user, email key) rows ordered by (lowercase email, id), starting after the keyset cursor `after`.
+
+    The ordering and the prefix search use `ix_user_email_key`, so every page costs the same however deep it is.
+    """
+    key = email_key(User.email)
+    # The key is selected too, so cursors hold the database's lowercase form rather than Python's
+    stmt = select(User, key).order_by(key, User.id).limit(limit)
+    if after is not None:
+        stmt = stmt.where(tuple_(key, User.id) > tuple_(literal(after[0]), literal(after[1])))
+    if email_prefix:
+        prefix = email_prefix.lower()
+        stmt = stmt.where(key >= prefix, key < _prefix_upper_bound(prefix))
+    if last_login_from is not None:
+        stmt = stmt.where(User.last_login >= last_login_from)
+    if last_login_to is not None:
+        stmt = stmt.where(User.last_login < last_login_to)
+    return stmt
@@ -0,0 +1,105 @@
+"""
+Worker warm-up, run by the app's `lifespan` hook (WARMUP, on by default). The server only starts accepting
+connections on a worker, and so only sends it probes and traffic, once its lifespan startup has completed.
+
+A fresh worker otherwise pays for its lazy initialisation on its first requests: connecting to the database, building
+the OAuth client (and importing authlib), loading the JWT backend, and the first run of every middleware and route.
+`warm_up` does that work up front:
+
+- opens the connection pool's connections (DB_POOL_SIZE, concurrently), so the first requests do not connect
+- builds the OAuth client and signs and verifies a token
+- sends in-process requests through the whole middleware stack: the healthcheck, and `/auth` with a valid token of an
+  unknown user, which exercises token verification and a database lookup
+
+These self-requests are marked with the `app.asgi.WARMUP_EXTENSION` scope extension and left out of the request metrics
+and the access log.
+"""
+import time
+import uuid
+import asyncio
+import logging
+import datetime
+from typing import Any
+from .asgi import WARMUP_EXTENSION
+from .db import async_database_enabled, get_async_engine, get_engine
+from .tokens import decode_token, encode_token
+
+logger = logging.getLogger(__name__)
+
+WARMUP_CLIENT = ("127.0.0.1", 0)
+
+def _pool_size(engine) -> int:
+    size = getattr(engine.pool, "size", None)
+    return size() if callable(size) else 1
+
+def _open_pool() -> int:
+    engine = get_engine()
+    connections = [engine.connect() for _ in range(_pool_size(engine))]
+    try:
+        for connection in connections:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+async def _open_async_pool() -> int:
+    engine = get_async_engine()
+
+    async def ping():
+        async with engine.connect() as connection:
+            await connection.exec_driver_sql("SELECT 1")
+            # Hold the connection until all are open, so that each ping opens a new one
+            await asyncio.sleep(0)
+
+    size = _pool_size(engine.sync_engine)
+    await asyncio.gather(*(ping() for _ in range(size)))
+    return size
+
+async def self_request(app, path: str, headers: tuple[tuple[bytes, bytes], ...] = ()) -> int:
+    """Send a GET request to `app` in-process; returns the response status."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"localhost"), *headers], "client": WARMUP_CLIENT, "server": ("localhost", 80),
+        "extensions": {WARMUP_EXTENSION: {}},
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+async def warm_up(app) -> dict[str, Any]:
+    """Prepare this worker for its first requests; returns the time taken per step (seconds)."""
+    from .auth import get_oauth
+    timings: dict[str, Any] = {}
+    started = time.perf_counter()
+    if async_database_enabled():
+        timings["connections"] = await _open_async_pool()
+    else:
+        timings["connections"] = await asyncio.to_thread(_open_pool)
+    timings["pool"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_oauth()
+    token = encode_token({"sub": str(uuid.uuid4()), "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=1)})
+    decode_token(token)
+    timings["clients"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    statuses = [
+        await self_request(app, "/api/v1/healthcheck"),
+        await self_request(app, "/api/v1/auth", ((b"authorization", f"Bearer {token}".encode()),)),
+    ]
+    timings["requests"] = time.perf_counter() - started
+    if statuses[0] != 200:
+        logger.warning("Warm-up: healthcheck returned %d", statuses[0])
+    return timings
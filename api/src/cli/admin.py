@@ -1,10 +1,21 @@
-from dotenv import load_dotenv
 import sys
+import csv
+import json
+import getpass
 import argparse
+from collections.abc import Iterator
+from contextlib import nullcontext
+from typing import IO, Any, ContextManager
+from app.audit import audit, audit_log
 from app.db import get_engine, get_session
+from app.migrations import HEAD_VERSION, migrate, pending_migrations
 from app.models import User
+from app.replicas import read_session
+from app.revocation import revoke_token, revoke_user
+from app.settings import load_env
+from app.users import IMPORT_FIELDS, import_row, iter_users, upsert_users
 
-load_dotenv()
+load_env()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -19,15 +30,37 @@ Flags:
 Command:
   help           Show this help and exit
   user OPTIONS   add/delete users
+  revoke OPTIONS revoke access tokens
+  db OPTIONS     show or migrate the database schema
 
 Command "user" usage: python -m cli.admin FLAGS user add|del OPTIONS EMAIL
+                      python -m cli.admin FLAGS user import|export OPTIONS [FILE]
 
 Command "user" options:
-  add            Add a user to the user database
-  del            Delete a user from the user database
+  add            Add a user to the user database (with -f, replacing a user revokes their tokens)
+  del            Delete a user from the user database (and revoke their tokens)
   list           List all users (email, name, and last login datetime)
+  import         Add users from a CSV or JSON lines FILE (default: stdin); existing users are
+                 skipped, or updated with -f
+  export         Write all users to a CSV or JSON lines FILE (default: stdout)
   -u NAME        set user's name to NAME
+  -b SIZE        import: number of users written per statement (default 1000)
+  --format FMT   import/export: csv or jsonl (default: from the FILE extension, else csv)
   EMAIL          the user's email - this is how the user authenticates.
+  FILE           import/export file, "-" for stdin/stdout. Columns: email, name, is_active, is_admin.
+
+Command "revoke" usage: python -m cli.admin FLAGS revoke token JTI
+                        python -m cli.admin FLAGS revoke user EMAIL
+
+Command "revoke" options:
+  token JTI      Revoke one access token by its "jti" claim
+  user EMAIL     Revoke all access and refresh tokens issued to the user so far (they can log in again)
+
+Command "db" usage: python -m cli.admin FLAGS db migrate|status
+
+Command "db" options:
+  migrate        Apply pending schema migrations (with -n: only list them)
+  status         Show the schema version and pending migrations
 """
     )
     parser.add_argument('-n', action='store_true', help='Dry run (do not modify the database)')
@@ -38,11 +71,25 @@ Command "user" options:
     if args.command in (None, 'help'):
         parser.print_usage()
         sys.exit(0)
-    if args.command == 'user':
-        handle_user(args)
-        sys.exit(0)
-    parser.print_usage()
-    sys.exit(1)
+    handlers = {'user': handle_user, 'revoke': handle_revoke, 'db': handle_db}
+    if args.command not in handlers:
+        parser.print_usage()
+        sys.exit(1)
+    # User and token changes are recorded in the audit log (AUDIT_LOG_PATH)
+    audit_log.start()
+    try:
+        handlers[args.command](args)
+    finally:
+        audit_log.stop()
+    sys.exit(0)
+
+# Helper: Record a change made with the CLI in the audit log, with the OS user who made it
+def audit_change(event: str, **fields: Any) -> None:
+    try:
+        actor = getpass.getuser()
+    except (KeyError, OSError):
+        actor = None
+    audit(event, actor=actor, source="cli", **fields)
 
 def handle_user(args):
     parser = argparse.ArgumentParser(prog="user", add_help=False)
@@ -53,6 +100,13 @@ def handle_user(args):
     del_parser = subparsers.add_parser("del")
     del_parser.add_argument("email", type=str)
     subparsers.add_parser("list")
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("-b", dest="batch_size", type=int, default=1000)
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("file", nargs="?", default="-")
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("file", nargs="?", default="-")
     subargs = parser.parse_args(args.subargs)
     engine = get_engine()
     session = get_session(engine)
@@ -67,12 +121,15 @@ def handle_user(args):
         if dry_run:
             print(f"[DRY RUN] Would add user: {subargs.email} (name: {name})")
             return
+        # One INSERT ... ON CONFLICT: an existing user keeps its id and login history
+        upsert_users(session, [import_row({"email": subargs.email, "name": name})], overwrite=True)
         if existing:
-            session.delete(existing)
-            session.commit()
-        user = User(email=subargs.email, name=name)
-        session.add(user)
+            # The workers serve the replaced user from their caches (or from the token's claims with
+            # AUTH_TRUST_JWT_CLAIMS), so cut off their tokens: the next login picks up the new flags
+            revoke_user(session, existing.id)
         session.commit()
+        user = session.query(User).filter_by(email=subargs.email).one()
+        audit_change("user_created", user_id=user.id, email=user.email, name=user.name, replaced=existing is not None)
         print(f"User added: {user.email} (name: {user.name})")
     elif subargs.action == 'del':
         user = session.query(User).filter_by(email=subargs.email).first()
@@ -82,19 +139,146 @@ def handle_user(args):
         if dry_run:
             print(f"[DRY RUN] Would delete user: {subargs.email}")
             return
+        user_id = user.id
         session.delete(user)
+        # With AUTH_TRUST_JWT_CLAIMS the API never looks the user up, so cut off their tokens explicitly
+        revoke_user(session, user_id)
         session.commit()
+        audit_change("user_deleted", user_id=user_id, email=subargs.email)
         print(f"User deleted: {subargs.email}")
     elif subargs.action == 'list':
-        users = session.query(User).all()
-        if not users:
+        found = False
+        # Read-only: served by a read replica when DATABASE_REPLICA_URLS is set
+        with read_session() as reader:
+            for user in iter_users(reader):
+                if not found:
+                    print(f"{'Email':<30} {'Name':<20} {'Last Login':<20}")
+                    print("-" * 70)
+                    found = True
+                last_login = user.last_login.isoformat() if user.last_login else "-"
+                print(f"{user.email:<30} {user.name:<20} {last_login:<20}")
+        if not found:
             print("No users found.")
+    elif subargs.action == 'import':
+        fmt = file_format(subargs.file, subargs.format)
+        with open_file(subargs.file, "r") as f:
+            rows = (import_row(record) for record in read_records(f, fmt))
+            try:
+                if dry_run:
+                    count = sum(1 for _ in rows)
+                    print(f"[DRY RUN] Would import {count} users")
+                    return
+                submitted, written = upsert_users(session, rows, batch_size=subargs.batch_size, overwrite=force)
+                session.commit()
+            except ValueError as e:
+                session.rollback()
+                print(f"Import failed, no users imported: {e}")
+                sys.exit(1)
+        audit_change("users_imported", count=written, rows=submitted, overwrite=force, file=subargs.file)
+        print(f"Rows read: {submitted}")
+        print(f"Users {'imported or updated' if force else 'imported'}: {written}")
+    elif subargs.action == 'export':
+        fmt = file_format(subargs.file, subargs.format)
+        with open_file(subargs.file, "w") as f, read_session() as reader:
+            write_records(f, fmt, (export_record(user) for user in iter_users(reader)))
+
+def handle_revoke(args):
+    parser = argparse.ArgumentParser(prog="revoke", add_help=False)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    token_parser = subparsers.add_parser("token")
+    token_parser.add_argument("jti", type=str)
+    user_parser = subparsers.add_parser("user")
+    user_parser.add_argument("email", type=str)
+    subargs = parser.parse_args(args.subargs)
+    session = get_session(get_engine())
+    if subargs.action == 'token':
+        if args.n:
+            print(f"[DRY RUN] Would revoke token: {subargs.jti}")
             return
-        print(f"{'Email':<30} {'Name':<20} {'Last Login':<20}")
-        print("-" * 70)
-        for user in users:
-            last_login = user.last_login.isoformat() if user.last_login else "-"
-            print(f"{user.email:<30} {user.name:<20} {last_login:<20}")
+        revoke_token(session, subargs.jti)
+        session.commit()
+        audit_change("token_revoked", jti=subargs.jti)
+        print(f"Token revoked: {subargs.jti}")
+    elif subargs.action == 'user':
+        user = session.query(User).filter_by(email=subargs.email).first()
+        if not user:
+            print(f"User with email {subargs.email} not found.")
+            sys.exit(1)
+        if args.n:
+            print(f"[DRY RUN] Would revoke all tokens of user: {subargs.email}")
+            return
+        revoke_user(session, user.id)
+        session.commit()
+        audit_change("user_tokens_revoked", user_id=user.id, email=subargs.email)
+        print(f"Tokens revoked for user: {subargs.email}")
+
+def handle_db(args):
+    parser = argparse.ArgumentParser(prog="db", add_help=False)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("migrate")
+    subparsers.add_parser("status")
+    subargs = parser.parse_args(args.subargs)
+    engine = get_engine()
+    pending = pending_migrations(engine)
+    if subargs.action == 'status':
+        print(f"Schema version: {HEAD_VERSION - len(pending)} (latest: {HEAD_VERSION})")
+        for migration in pending:
+            print(f"Pending: {migration.version} {migration.description}")
+    elif subargs.action == 'migrate':
+        if not pending:
+            print("Schema is up to date.")
+            return
+        if args.n:
+            for migration in pending:
+                print(f"[DRY RUN] Would apply migration {migration.version}: {migration.description}")
+            return
+        for migration in migrate(engine):
+            print(f"Applied migration {migration.version}: {migration.description}")
+
+FORMATS = ("csv", "jsonl")
+EXPORT_FIELDS = ("id",) + IMPORT_FIELDS + ("last_login",)
+
+def file_format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+def open_file(path: str, mode: str) -> ContextManager[IO[str]]:
+    """Open `path` for streaming, or use stdin/stdout (without closing them) for "-"."""
+    if path == "-":
+        return nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, newline="")
+
+def read_records(f: IO[str], fmt: str) -> Iterator[dict[str, Any]]:
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number} is not a JSON object: {line.strip()}")
+        yield record
+
+def write_records(f: IO[str], fmt: str, records: Iterator[dict[str, Any]]) -> None:
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+        return
+    for record in records:
+        f.write(json.dumps(record) + "\n")
+
+def export_record(user: User) -> dict[str, Any]:
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "name": user.name,
+        "is_active": user.is_active,
+        "is_admin": user.is_admin,
+        "last_login": user.last_login.isoformat() if user.last_login else None,
+    }
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,12 @@
+import os
+import pytest
+
+# The tests never talk to Google; login tests stub the OAuth client instead
+os.environ.setdefault("OIDC_PRELOAD", "false")
+
+@pytest.fixture(autouse=True)
+def reset_async_database():
+    yield
+    # DATABASE_ASYNC is resolved once per app start; re-read it once the test's environment changes are undone
+    from app.db import configure_async_database
+    configure_async_database()
@@ -0,0 +1,102 @@
+import json
+import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import my_app
+from app.auth import create_jwt
+from app.db import configure_async_database, get_engine, get_session, dispose_engines
+from app.models import User
+from app.users import UserSnapshot
+
+BASE_TIME = datetime.datetime(2025, 1, 1)
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'admin.db'}")
+    with TestClient(my_app) as c:
+        yield c
+    dispose_engines()
+
+@pytest.fixture
+def users(client) -> list[str]:
+    """25 users with mixed-case emails, logged in one day apart; returns their emails in listing order."""
+    with get_session(get_engine()) as session:
+        session.add_all(
+            User(email=f"{'User' if i % 2 else 'user'}{i:02d}@example.com", name=f"User {i}",
+                 last_login=BASE_TIME + datetime.timedelta(days=i))
+            for i in range(25)
+        )
+        session.commit()
+    return [f"{'User' if i % 2 else 'user'}{i:02d}@example.com" for i in range(25)]
+
+def auth_header(is_admin: bool) -> dict:
+    with get_session(get_engine()) as session:
+        user = User(email=f"zz-{'admin' if is_admin else 'user'}@example.org", name="Caller", is_admin=is_admin)
+        session.add(user)
+        session.commit()
+        return {"Authorization": f"Bearer {create_jwt(UserSnapshot.from_user(user))}"}
+
+def list_all(client, headers, **params) -> tuple[list[str], int]:
+    emails, pages, cursor = [], 0, None
+    while True:
+        response = client.get("/api/v1/admin/users", headers=headers, params={**params, "cursor": cursor} if cursor
+                              else params)
+        assert response.status_code == 200
+        body = response.json()
+        emails += [u["email"] for u in body["users"]]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return emails, pages
+
+def test_keyset_pagination_lists_every_user_once(client, users):
+    headers = auth_header(is_admin=True)
+    emails, pages = list_all(client, headers, limit=10, email_prefix="USER")
+    assert emails == users
+    assert pages == 3
+
+def test_filters(client, users):
+    headers = auth_header(is_admin=True)
+    assert list_all(client, headers, email_prefix="user1")[0] == users[10:20]
+    emails, _ = list_all(client, headers, last_login_from="2025-01-03T00:00:00Z", last_login_to="2025-01-06T00:00:00")
+    assert emails == users[2:5]
+
+def test_pages_use_the_email_key_index(client, users):
+    headers = auth_header(is_admin=True)
+    cursor = client.get("/api/v1/admin/users", headers=headers, params={"limit": 5}).json()["next_cursor"]
+    executed = []
+    event.listen(get_engine(), "before_cursor_execute", lambda conn, cur, stmt, params, *args: executed.append(
+        (stmt, params)))
+    client.get("/api/v1/admin/users", headers=headers, params={"limit": 5, "cursor": cursor})
+    statement, parameters = next((s, p) for s, p in executed if "ORDER BY" in s)
+    with get_engine().connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    assert any("ix_user_email_key" in row[-1] for row in plan)
+
+def test_requires_admin(client, users):
+    assert client.get("/api/v1/admin/users").status_code == 401
+    assert client.get("/api/v1/admin/users", headers=auth_header(is_admin=False)).status_code == 403
+
+def test_invalid_cursor(client, users):
+    response = client.get("/api/v1/admin/users", headers=auth_header(is_admin=True), params={"cursor": "bogus"})
+    assert response.status_code == 400
+
+def test_async_database(client, users):
+    configure_async_database(True)
+    emails, pages = list_all(client, auth_header(is_admin=True), limit=10)
+    assert emails[:25] == users
+    assert pages == 3
+
+@pytest.mark.parametrize("count,limit", [(499, 500), (500, 500), (501, 500), (1000, 2000), (1000, 1000)])
+@pytest.mark.parametrize("database_async", [False, True])
+def test_pages_at_stream_batch_boundaries_are_valid_json(client, count, limit, database_async):
+    configure_async_database(database_async)
+    with get_session(get_engine()) as session:
+        session.add_all(User(email=f"bulk{i:04d}@example.com", name=f"Bulk {i}") for i in range(count))
+        session.commit()
+    response = client.get("/api/v1/admin/users", headers=auth_header(is_admin=True),
+                          params={"limit": limit, "email_prefix": "bulk"})
+    body = json.loads(response.content)
+    assert len(body["users"]) == min(count, limit)
+    assert (body["next_cursor"] is not None) == (count > limit)
@@ -0,0 +1,72 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app import my_app
+from app.audit import AuditLog, audit_log
+from app.auth import create_jwt
+from app.db import dispose_engines, get_engine, get_session
+from app.users import find_or_create_user, user_cache
+
+def read_records(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_records_are_written_as_json_lines(tmp_path):
+    log = AuditLog(str(tmp_path / "audit-{pid}.jsonl"), flush_interval=60)
+    log.start()
+    log.record("login", user_id="42", email="a@example.com")
+    log.stop()
+    [path] = tmp_path.iterdir()
+    [record] = read_records(path)
+    assert record["event"] == "login" and record["email"] == "a@example.com"
+    assert len(record["ts"]) == 24 and record["ts"].endswith("Z")
+    assert log.stats()["written"] == 1 and log.stats()["batches"] == 1
+
+def test_full_queue_drops_records(tmp_path):
+    log = AuditLog(str(tmp_path / "audit.jsonl"), queue_size=2)
+    for i in range(5):
+        log.record("access", i=i)
+    assert log.stats()["queued"] == 2
+    assert log.stats()["dropped"] == 3
+    log.drain()
+    assert [record["i"] for record in read_records(tmp_path / "audit.jsonl")] == [0, 1]
+
+def test_files_are_rotated(tmp_path):
+    path = tmp_path / "audit.jsonl"
+    log = AuditLog(str(path), batch_size=1, max_bytes=200, backups=2)
+    for i in range(20):
+        log.record("access", i=i, path="/api/v1/auth")
+    log.drain()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["audit.jsonl", "audit.jsonl.1", "audit.jsonl.2"]
+    assert log.stats()["rotations"] > 2
+    # The newest records are in the current file
+    assert read_records(path)[-1]["i"] == 19
+
+def test_disabled_log_records_nothing():
+    log = AuditLog(None)
+    log.record("access")
+    assert log.stats()["recorded"] == 0 and not log.access
+
+@pytest.fixture
+def audited(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'audit.db'}")
+    path = tmp_path / "audit.jsonl"
+    monkeypatch.setattr(audit_log, "path", str(path))
+    monkeypatch.setattr(audit_log, "access", True)
+    yield path
+    dispose_engines()
+
+def test_requests_and_token_failures_are_logged(audited):
+    with TestClient(my_app) as client:
+        with get_session(get_engine()) as session:
+            user = find_or_create_user(session, "audit@example.com", "Audit User")
+        user_cache.clear()
+        assert client.get("/api/v1/auth", headers={"Authorization": f"Bearer {create_jwt(user)}"}).status_code == 200
+        assert client.get("/api/v1/auth", headers={"Authorization": "Bearer invalid"}).status_code == 401
+    records = read_records(audited)
+    # Warm-up requests are not logged
+    assert [(r["event"], r.get("status")) for r in records] == [
+        ("access", 200), ("token_rejected", None), ("access", 401),
+    ]
+    assert records[0]["user_id"] == str(user.id) and records[0]["path"] == "/api/v1/auth"
+    assert records[1]["reason"] == "invalid"
+    assert records[2]["user_id"] is None
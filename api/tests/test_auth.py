@@ -144,4 +144,169 @@ def test_auth_protected_route_with_valid_jwt(client):
 def test_auth_protected_route_with_invalid_jwt(client):
     resp = client.get("/api/v1/auth", headers={"Authorization": "Bearer invalidtoken"})
     assert resp.status_code == 401
-    assert "Invalid token" in resp.text 
\ No newline at end of file
+    assert "Invalid token" in resp.text 
+
+def test_auth_protected_route_uses_user_cache(client):
+    from app.users import user_cache
+    engine = get_engine()
+    session = get_session(engine)
+    user = User(email="cacheduser@example.com", name="Cached User", is_active=True, is_admin=False)
+    session.add(user)
+    session.commit()
+    token = create_jwt_for_user(user)
+    resp = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    hits = user_cache.hits
+    session.delete(user)
+    session.commit()
+    # Served from the cache although the row is gone
+    resp = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert user_cache.hits == hits + 1
+    user_cache.invalidate(user.id)
+    resp = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 401
+
+def test_auth_callback_google_refreshes_cached_user(client, mock_authorize_access_token, mock_parse_id_token):
+    from app.users import user_cache
+    client.get("/api/v1/auth/callback/google", follow_redirects=False)
+    session = get_session(get_engine())
+    user = session.query(User).filter_by(email="testuser@example.com").one()
+    token = create_jwt_for_user(user)
+    client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    cached = user_cache.get(user.id)
+    assert cached is not None
+    client.get("/api/v1/auth/callback/google", follow_redirects=False)
+    session.refresh(user)
+    refreshed = user_cache.get(user.id)
+    assert refreshed is not None
+    assert refreshed.last_login == user.last_login
+    assert refreshed.last_login > cached.last_login
+
+def test_auth_trust_jwt_claims(client, monkeypatch):
+    import uuid
+    monkeypatch.setattr(auth_mod, "TRUST_JWT_CLAIMS", True)
+    ghost = User(id=uuid.uuid4(), email="claims@example.com", name="Claims Only", is_admin=True)
+    resp = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {create_jwt_for_user(ghost)}"})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["email"] == "claims@example.com"
+    assert data["is_admin"] is True
+    assert data["last_login"] is None
+
+def test_auth_conditional_request(client):
+    from app.users import user_cache
+    session = get_session(get_engine())
+    user = User(email="etaguser@example.com", name="ETag User", is_active=True, is_admin=False)
+    session.add(user)
+    session.commit()
+    headers = {"Authorization": f"Bearer {create_jwt_for_user(user)}"}
+    resp = client.get("/api/v1/auth", headers=headers)
+    etag = resp.headers["ETag"]
+    assert resp.headers["Cache-Control"] == "private, no-cache"
+    resp = client.get("/api/v1/auth", headers={**headers, "If-None-Match": f'W/"other", {etag}'})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["ETag"] == etag
+    # A changed user gets a new ETag and the full body
+    user.name = "Renamed User"
+    session.commit()
+    user_cache.invalidate(user.id)
+    resp = client.get("/api/v1/auth", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["name"] == "Renamed User"
+    assert resp.headers["ETag"] != etag
+
+def login_tokens(client) -> dict[str, str]:
+    from urllib.parse import parse_qs, urlsplit
+    resp = client.get("/api/v1/auth/callback/google", follow_redirects=False)
+    return {k: v[0] for k, v in parse_qs(urlsplit(resp.headers["location"]).fragment).items()}
+
+def test_auth_refresh_rotates_tokens(client, mock_authorize_access_token, mock_parse_id_token):
+    tokens = login_tokens(client)
+    resp = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["token_type"] == "bearer"
+    assert data["refresh_token"] != tokens["refresh_token"]
+    resp = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {data['access_token']}"})
+    assert resp.json()["email"] == "testuser@example.com"
+    # The successor can be used in turn
+    resp = client.post("/api/v1/auth/refresh", json={"refresh_token": data["refresh_token"]})
+    assert resp.status_code == 200
+
+def test_auth_refresh_token_reuse_revokes_family(client, mock_authorize_access_token, mock_parse_id_token, monkeypatch):
+    import datetime
+    # Reused after the grace period for concurrent refreshes
+    monkeypatch.setattr("app.refresh_tokens.REFRESH_TOKEN_REUSE_GRACE", datetime.timedelta(0))
+    tokens = login_tokens(client)
+    successor = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+    # Replaying the used token fails, and also invalidates the token it was exchanged for
+    resp = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert resp.status_code == 401
+    assert resp.json()["detail"] == "Invalid refresh token"
+    assert client.post("/api/v1/auth/refresh", json={"refresh_token": successor["refresh_token"]}).status_code == 401
+    # Other logins of the same user are not affected
+    other = login_tokens(client)
+    assert client.post("/api/v1/auth/refresh", json={"refresh_token": other["refresh_token"]}).status_code == 200
+
+def test_auth_refresh_retry_within_grace_gets_another_successor(client, mock_authorize_access_token,
+                                                                mock_parse_id_token):
+    tokens = login_tokens(client)
+    first = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    retry = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert first.status_code == retry.status_code == 200
+    successors = [first.json()["refresh_token"], retry.json()["refresh_token"]]
+    assert successors[0] != successors[1]
+    for successor in successors:
+        assert client.post("/api/v1/auth/refresh", json={"refresh_token": successor}).status_code == 200
+
+def test_concurrent_rotations_of_the_same_token(client, mock_authorize_access_token, mock_parse_id_token,
+                                                monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import app.refresh_tokens as refresh_tokens_mod
+    token = login_tokens(client)["refresh_token"]
+    # Both requests have found the token unrotated before either one rotates it
+    both_selected = threading.Barrier(2, timeout=5)
+    update = refresh_tokens_mod.update
+
+    def update_after_both_selected(*args):
+        both_selected.wait()
+        return update(*args)
+
+    monkeypatch.setattr(refresh_tokens_mod, "update", update_after_both_selected)
+
+    def rotate():
+        with get_session(get_engine()) as session:
+            return refresh_tokens_mod.rotate_refresh_token(session, token)
+
+    with ThreadPoolExecutor(2) as executor:
+        results = [future.result() for future in [executor.submit(rotate), executor.submit(rotate)]]
+    monkeypatch.setattr(refresh_tokens_mod, "update", update)
+    (first_user, first_token), (second_user, second_token) = results
+    assert first_user.id == second_user.id
+    assert first_token != second_token
+    # Neither request revoked the other's successor
+    for successor in (first_token, second_token):
+        assert client.post("/api/v1/auth/refresh", json={"refresh_token": successor}).status_code == 200
+
+def test_auth_refresh_rejects_unknown_and_revoked_tokens(client, mock_authorize_access_token, mock_parse_id_token):
+    from app.revocation import revoke_user
+    assert client.post("/api/v1/auth/refresh", json={"refresh_token": "unknown"}).status_code == 401
+    tokens = login_tokens(client)
+    session = get_session(get_engine())
+    user = session.query(User).filter_by(email="testuser@example.com").one()
+    revoke_user(session, user.id)
+    session.commit()
+    assert client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_auth_refresh_rejects_inactive_user(client, mock_authorize_access_token, mock_parse_id_token):
+    tokens = login_tokens(client)
+    session = get_session(get_engine())
+    user = session.query(User).filter_by(email="testuser@example.com").one()
+    user.is_active = False
+    session.commit()
+    resp = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert resp.status_code == 403
+    assert resp.json()["detail"] == "Inactive user"
@@ -0,0 +1,67 @@
+import os
+import uuid
+import datetime
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from app import my_app
+from app.db import get_engine, get_session, Base, async_database_url
+from app.models import User
+import app.auth as auth_mod
+
+os.environ["JWT_SECRET"] = "dummy-jwt-secret"
+os.environ["DATABASE_URL"] = "sqlite:///./test.db"
+
+@pytest.fixture(scope="module", autouse=True)
+def create_all_tables():
+    Base.metadata.create_all(get_engine())
+
+@pytest.fixture
+def async_client(monkeypatch):
+    monkeypatch.setenv("DATABASE_ASYNC", "true")
+    with TestClient(my_app) as c:
+        yield c
+
+def make_token(user: User) -> str:
+    payload = {"sub": str(user.id), "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+    return jwt.encode(payload, os.environ["JWT_SECRET"], algorithm="HS256")
+
+def test_async_database_url():
+    assert async_database_url("postgresql://u:p@db:5432/app") == "postgresql+asyncpg://u:p@db:5432/app"
+    assert async_database_url("postgresql+psycopg2://u@db/app") == "postgresql+asyncpg://u@db/app"
+    assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+
+def test_async_auth_route(async_client):
+    with get_session(get_engine()) as session:
+        user = User(email="asyncuser@example.com", name="Async User", is_active=True, is_admin=False)
+        session.add(user)
+        session.commit()
+        token = make_token(user)
+    resp = async_client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert resp.json()["email"] == "asyncuser@example.com"
+
+def test_async_auth_route_unknown_user(async_client):
+    token = make_token(User(id=uuid.uuid4(), email="ghost@example.com", name="Ghost"))
+    resp = async_client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 401
+    assert "User not found" in resp.text
+
+def test_async_callback_creates_user(async_client, monkeypatch):
+    async def fake_authorize_access_token(request):
+        return {"id_token": "dummy"}
+    async def fake_parse_id_token(request, token):
+        return {"email": "asynclogin@example.com", "name": "Async Login"}
+    monkeypatch.setattr(auth_mod.oauth.google, "authorize_access_token", fake_authorize_access_token)
+    monkeypatch.setattr(auth_mod.oauth.google, "parse_id_token", fake_parse_id_token)
+    resp = async_client.get("/api/v1/auth/callback/google", follow_redirects=False)
+    assert resp.status_code in (302, 307)
+    with get_session(get_engine()) as session:
+        user = session.query(User).filter_by(email="asynclogin@example.com").one()
+        assert user.last_login is not None
+    # The callback issued a refresh token on the async engine, and it can be rotated there too
+    from urllib.parse import parse_qs, urlsplit
+    refresh_token = parse_qs(urlsplit(resp.headers["location"]).fragment)["refresh_token"][0]
+    resp = async_client.post("/api/v1/auth/refresh", json={"refresh_token": refresh_token})
+    assert resp.status_code == 200
+    assert resp.json()["refresh_token"] != refresh_token
@@ -0,0 +1,45 @@
+import pytest
+from app.db import (
+    async_database_enabled, configure_async_database, get_engine, get_session, get_sessionmaker, dispose_engines,
+    pool_stats,
+)
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    yield url
+    dispose_engines()
+
+def test_get_engine_is_cached_per_url(sqlite_url, tmp_path):
+    assert get_engine(sqlite_url) is get_engine(sqlite_url)
+    assert get_engine(f"sqlite:///{tmp_path / 'other.db'}") is not get_engine(sqlite_url)
+
+def test_sessionmaker_is_cached_per_engine(sqlite_url):
+    engine = get_engine(sqlite_url)
+    assert get_sessionmaker(engine) is get_sessionmaker(engine)
+    session = get_session(engine)
+    assert session.bind is engine
+    session.close()
+
+def test_dispose_engines_creates_fresh_engine(sqlite_url):
+    engine = get_engine(sqlite_url)
+    dispose_engines()
+    assert get_engine(sqlite_url) is not engine
+
+def test_pool_stats(sqlite_url, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", sqlite_url)
+    assert pool_stats() is None
+    engine = get_engine()
+    with engine.connect():
+        stats = pool_stats()
+    assert stats is not None
+    assert stats["class"] == "QueuePool"
+    assert stats["checked_out"] == 1
+    assert stats["max_overflow"] == 10
+
+def test_async_database_is_resolved_once(monkeypatch):
+    monkeypatch.setenv("DATABASE_ASYNC", "true")
+    assert configure_async_database()
+    monkeypatch.setenv("DATABASE_ASYNC", "false")
+    assert async_database_enabled()
+    assert not configure_async_database()
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app import my_app
+from app.db import get_engine, dispose_engines
+from app.health import ReadinessCheck, readiness
+from app.metrics import registry
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'health.db'}")
+    with TestClient(my_app) as c:
+        yield c
+    dispose_engines()
+
+def test_liveness_bypasses_the_app(client):
+    registry.reset()
+    response = client.get("/api/v1/health/live", headers={"Origin": "http://localhost:3000"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    # No CORS, session or metrics processing
+    assert "access-control-allow-origin" not in response.headers
+    assert "set-cookie" not in response.headers
+    assert registry.requests == {}
+
+def test_readiness_caches_database_check(client, monkeypatch):
+    monkeypatch.setattr(readiness, "interval", 60)
+    statements = []
+    event.listen(get_engine(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    for _ in range(3):
+        response = client.get("/api/v1/health/ready")
+        assert response.status_code == 200
+    assert statements == ["SELECT 1"]
+    assert response.json()["database"]["ok"] is True
+
+def test_readiness_reports_database_failure(client, monkeypatch):
+    async def failing_ping(self):
+        raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+    monkeypatch.setattr(ReadinessCheck, "_ping", failing_ping)
+    readiness.reset()
+    response = client.get("/api/v1/health/ready")
+    assert response.status_code == 503
+    body = response.json()
+    assert body["status"] == "unavailable"
+    assert body["database"] == {"ok": False, "error": "OperationalError"}
+
+def test_readiness_fails_when_pool_is_saturated(monkeypatch):
+    check = ReadinessCheck(max_pool_saturation=0.8)
+    async def database():
+        return {"ok": True}
+    monkeypatch.setattr(check, "database", database)
+    monkeypatch.setattr(check, "pool", lambda: {"checked_out": 9, "capacity": 10, "saturation": 0.9})
+    ready, body = asyncio.run(check.status())
+    assert not ready
+    assert body["status"] == "unavailable"
+
+def test_readiness_fails_while_draining(client, monkeypatch):
+    monkeypatch.setattr(readiness, "accepting", False)
+    response = client.get("/api/v1/health/ready")
+    assert response.status_code == 503
+    assert response.json()["accepting"] is False
+    # Still serving meanwhile
+    assert client.get("/api/v1/health/live").status_code == 200
@@ -33,4 +33,5 @@ def test_healthcheck(client):
     data = response.json()
     assert "message" in data
     assert "uptime" in data
-    assert isinstance(data["uptime"], dict) 
\ No newline at end of file
+    assert isinstance(data["uptime"], dict)
+    assert data["database"]["pool"]["status"] 
\ No newline at end of file
@@ -0,0 +1,97 @@
+import asyncio
+import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app import my_app
+from app.db import Base, get_engine, get_session, dispose_engines
+from app.last_login import LastLoginWriter
+from app.models import User
+import app.auth as auth_mod
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'last_login.db'}")
+    engine = get_engine()
+    Base.metadata.create_all(engine)
+    yield engine
+    dispose_engines()
+
+def add_users(engine, count: int) -> list[User]:
+    with get_session(engine) as session:
+        users = [User(email=f"user{i}@example.com", name=f"User {i}") for i in range(count)]
+        session.add_all(users)
+        session.commit()
+        for user in users:
+            session.refresh(user)
+        return users
+
+def last_logins(engine) -> dict:
+    with get_session(engine) as session:
+        return {u.id: u.last_login for u in session.query(User)}
+
+def test_flush_writes_one_batch_and_coalesces(engine):
+    users = add_users(engine, 3)
+    writer = LastLoginWriter(enabled=True)
+    t1 = datetime.datetime(2025, 1, 1, 9, 0)
+    t2 = datetime.datetime(2025, 1, 1, 9, 5)
+    writer.record(users[0].id, t1)
+    writer.record(users[0].id, t2)
+    writer.record(users[1].id, t1)
+    assert writer.stats()["queue_depth"] == 2
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    asyncio.run(writer.flush())
+    assert len(statements) == 1
+    assert last_logins(engine) == {users[0].id: t2, users[1].id: t1, users[2].id: None}
+    assert writer.stats()["queue_depth"] == 0
+    assert writer.stats()["flushed_rows"] == 2
+
+def test_flush_never_moves_last_login_backwards(engine):
+    user = add_users(engine, 1)[0]
+    writer = LastLoginWriter(enabled=True)
+    later = datetime.datetime(2025, 1, 2)
+    writer.record(user.id, later)
+    asyncio.run(writer.flush())
+    writer.record(user.id, datetime.datetime(2025, 1, 1))
+    asyncio.run(writer.flush())
+    assert last_logins(engine)[user.id] == later
+
+def test_background_task_flushes_on_batch_size_and_shutdown(engine):
+    users = add_users(engine, 3)
+    writer = LastLoginWriter(enabled=True, flush_interval=60, max_batch=2)
+    now = datetime.datetime(2025, 1, 1)
+
+    async def run():
+        await writer.start()
+        writer.record(users[0].id, now)
+        writer.record(users[1].id, now)
+        await asyncio.sleep(0.2)
+        assert writer.stats()["flushes"] == 1
+        writer.record(users[2].id, now)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert set(last_logins(engine).values()) == {now}
+
+def test_login_with_write_behind(engine, monkeypatch):
+    writer = LastLoginWriter(enabled=True, flush_interval=60)
+    monkeypatch.setattr(auth_mod, "last_login_writer", writer)
+    monkeypatch.setattr("app.main.last_login_writer", writer)
+    async def fake_authorize_access_token(request):
+        return {"id_token": "dummy"}
+    async def fake_parse_id_token(request, token):
+        return {"email": "behind@example.com", "name": "Write Behind"}
+    monkeypatch.setattr(auth_mod.oauth.google, "authorize_access_token", fake_authorize_access_token)
+    monkeypatch.setattr(auth_mod.oauth.google, "parse_id_token", fake_parse_id_token)
+    with TestClient(my_app) as client:
+        client.get("/api/v1/auth/callback/google", follow_redirects=False)
+        resp = client.get("/api/v1/auth/callback/google", follow_redirects=False)
+        assert resp.status_code in (302, 307)
+        assert writer.stats()["queue_depth"] == 1
+        assert client.get("/api/v1/healthcheck").json()["last_login_writer"]["recorded"] == 2
+    # Flushed on shutdown
+    assert writer.stats()["queue_depth"] == 0
+    with get_session(engine) as session:
+        user = session.query(User).filter_by(email="behind@example.com").one()
+        assert user.last_login is not None
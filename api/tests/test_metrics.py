@@ -0,0 +1,112 @@
+import logging
+import threading
+import dataclasses
+import pytest
+from fastapi.testclient import TestClient
+from app import my_app
+from app.auth import create_jwt
+from app.db import get_engine, get_session, dispose_engines
+from app.metrics import Histogram, MetricsRegistry, RequestStats, _before_cursor_execute, registry
+from app.models import User
+from app.users import find_or_create_user, user_cache
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'metrics.db'}")
+    monkeypatch.setenv("JWT_SECRET", "metrics-secret-metrics-secret-0123456789")
+    registry.reset()
+    with TestClient(my_app) as c:
+        yield c
+    dispose_engines()
+
+def auth_header(email: str = "metrics@example.com") -> dict:
+    with get_session(get_engine()) as session:
+        user = find_or_create_user(session, email, "Metrics User")
+    user_cache.clear()
+    return {"Authorization": f"Bearer {create_jwt(user)}"}
+
+@pytest.fixture
+def metrics_token(monkeypatch):
+    import app.main as main_mod
+    monkeypatch.setattr(main_mod, "settings", dataclasses.replace(main_mod.settings, metrics_token="scrape-token"))
+    return {"Authorization": "Bearer scrape-token"}
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(("GET",), value)
+    lines = histogram.render("latency", ("method",))
+    assert 'latency_bucket{method="GET",le="0.1"} 2' in lines
+    assert 'latency_bucket{method="GET",le="1.0"} 3' in lines
+    assert 'latency_bucket{method="GET",le="+Inf"} 4' in lines
+    assert 'latency_count{method="GET"} 4' in lines
+
+def test_render_while_other_threads_record():
+    metrics = MetricsRegistry()
+    stats = RequestStats()
+    stats.queries = 1
+    done = threading.Event()
+
+    def record():
+        for i in range(3000):
+            metrics.record_request("GET", f"/route/{i}", 200, 0.001, stats)
+            metrics.record_background_query(0.001)
+        done.set()
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    while not done.is_set():
+        metrics.render()
+    thread.join()
+    assert 'db_queries_total{route="/route/2999"} 1' in metrics.render()
+
+def test_metrics_endpoint_reports_requests_and_queries(client, metrics_token):
+    client.get("/api/v1/healthcheck")
+    client.get("/api/v1/auth", headers=auth_header())
+    client.get("/api/v1/does-not-exist")
+    response = client.get("/api/v1/metrics", headers=metrics_token)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/v1/healthcheck",status="200"} 1' in body
+    assert 'http_requests_total{method="GET",route="/api/v1/auth",status="200"} 1' in body
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/auth"} 1' in body
+    # The user cache was cleared, so /auth loaded the user from the database
+    assert 'db_queries_total{route="/api/v1/auth"} 1' in body
+    assert 'http_request_db_queries_bucket{method="GET",route="/api/v1/healthcheck",le="0"} 1' in body
+    assert "http_requests_in_flight 1" in body
+    assert "user_cache_misses " in body
+
+def test_slow_requests_are_logged_with_queries(client, monkeypatch, caplog):
+    monkeypatch.setattr(registry, "slow_request_seconds", 1e-9)
+    headers = auth_header()
+    with caplog.at_level(logging.WARNING, logger="app.metrics"):
+        client.get("/api/v1/auth", headers=headers)
+    message = caplog.records[-1].getMessage()
+    assert "Slow request: GET /api/v1/auth -> 200" in message
+    assert "1 queries" in message
+    assert "1x" in message and "SELECT" in message
+
+def test_metrics_endpoint_requires_token_or_admin(client, metrics_token):
+    assert client.get("/api/v1/metrics").status_code == 401
+    assert client.get("/api/v1/metrics", headers={"Authorization": "Bearer wrong-token"}).status_code == 401
+    assert client.get("/api/v1/metrics", headers=auth_header()).status_code == 403
+    with get_session(get_engine()) as session:
+        admin = find_or_create_user(session, "metrics-admin@example.com", "Metrics Admin")
+        session.query(User).filter_by(id=admin.id).update({"is_admin": True})
+        session.commit()
+    user_cache.clear()
+    headers = {"Authorization": f"Bearer {create_jwt(dataclasses.replace(admin, is_admin=True))}"}
+    assert client.get("/api/v1/metrics", headers=headers).status_code == 200
+
+def test_replica_engines_are_instrumented(tmp_path, monkeypatch):
+    from sqlalchemy import event
+    from app.db import get_replica_engines
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", f"sqlite:///{tmp_path / 'replica.db'}")
+    with TestClient(my_app):
+        replicas = get_replica_engines()
+        assert replicas
+        assert all(event.contains(engine, "before_cursor_execute", _before_cursor_execute) for engine in replicas)
+    dispose_engines()
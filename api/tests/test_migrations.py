@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import inspect
+from app import migrations
+from app.db import Base, get_engine, dispose_engines
+from app.migrations import HEAD_VERSION, SchemaOutOfDate, current_version, ensure_schema, migrate, pending_migrations
+from tests.test_user_cli import run_cli
+
+@pytest.fixture
+def db_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "_verified", set())
+    yield f"sqlite:///{tmp_path / 'schema.db'}"
+    dispose_engines()
+
+def test_migrate_empty_database(db_url):
+    engine = get_engine(db_url)
+    assert [m.version for m in pending_migrations(engine)] == [m.version for m in migrations.MIGRATIONS]
+    migrate(engine)
+    assert "user" in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert current_version(connection) == HEAD_VERSION
+    assert pending_migrations(engine) == []
+    assert migrate(engine) == []
+
+def test_migrate_database_created_before_versioning(db_url):
+    engine = get_engine(db_url)
+    Base.metadata.create_all(engine)
+    migrate(engine)
+    assert pending_migrations(engine) == []
+
+def test_ensure_schema_without_auto_migrate(db_url):
+    engine = get_engine(db_url)
+    with pytest.raises(SchemaOutOfDate):
+        ensure_schema(engine, auto_migrate=False)
+    ensure_schema(engine, auto_migrate=True)
+    assert pending_migrations(engine) == []
+
+def test_ensure_schema_checks_once_per_process(db_url, monkeypatch):
+    engine = get_engine(db_url)
+    ensure_schema(engine, auto_migrate=True)
+    def fail(connection):
+        raise AssertionError("schema version should have been cached")
+    monkeypatch.setattr(migrations, "current_version", fail)
+    ensure_schema(engine, auto_migrate=False)
+
+def test_cli_db_status_and_migrate(db_url):
+    result = run_cli(["db", "status"], db_url)
+    assert f"Schema version: 0 (latest: {HEAD_VERSION})" in result.stdout
+    result = run_cli(["-n", "db", "migrate"], db_url)
+    assert "[DRY RUN] Would apply migration 1" in result.stdout
+    result = run_cli(["db", "migrate"], db_url)
+    assert "Applied migration 1" in result.stdout
+    result = run_cli(["db", "migrate"], db_url)
+    assert "Schema is up to date" in result.stdout
+
+def schema(engine) -> dict:
+    inspector = inspect(engine)
+    with engine.connect() as connection:
+        # From sqlite_master, since reflection skips expression indexes
+        indexes = connection.exec_driver_sql("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'").all()
+    return {
+        table: (
+            {column["name"]: (str(column["type"]), column["nullable"]) for column in inspector.get_columns(table)},
+            sorted(name for tbl_name, name in indexes if tbl_name == table),
+            sorted(tuple(c["column_names"]) for c in inspector.get_unique_constraints(table)),
+            [(fk["referred_table"], fk["constrained_columns"]) for fk in inspector.get_foreign_keys(table)],
+        )
+        for table in Base.metadata.tables
+    }
+
+@pytest.mark.filterwarnings("ignore:Skipped unsupported reflection")
+def test_migrations_match_models(db_url, tmp_path):
+    migrated = get_engine(db_url)
+    migrate(migrated)
+    created = get_engine(f"sqlite:///{tmp_path / 'models.db'}")
+    Base.metadata.create_all(created)
+    assert schema(migrated) == schema(created)
+
+def test_first_migration_creates_only_its_table(db_url):
+    engine = get_engine(db_url)
+    with engine.begin() as connection:
+        migrations.MIGRATIONS[0].apply(connection)
+    assert inspect(engine).get_table_names() == ["user"]
+    assert inspect(engine).get_indexes("user") == []
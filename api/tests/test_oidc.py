@@ -0,0 +1,159 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.oidc import OIDCMetadataCache, cache_lifetime
+
+class StubOIDCServer:
+    """Local stand-in for the provider's discovery and JWKS endpoints."""
+
+    def __init__(self):
+        self.hits: dict[str, int] = {}
+        self.cache_control = {"/.well-known/openid-configuration": "public, max-age=600", "/jwks": "max-age=300"}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits[self.path] = stub.hits.get(self.path, 0) + 1
+                if self.path == "/.well-known/openid-configuration":
+                    body = {"issuer": stub.url, "jwks_uri": f"{stub.url}/jwks",
+                            "authorization_endpoint": f"{stub.url}/authorize", "token_endpoint": f"{stub.url}/token"}
+                elif self.path == "/jwks":
+                    body = {"keys": [{"kty": "RSA", "kid": "k1", "n": "AQAB", "e": "AQAB"}]}
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", stub.cache_control[self.path])
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.discovery_url = f"{self.url}/.well-known/openid-configuration"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+@pytest.fixture
+def stub_server():
+    server = StubOIDCServer()
+    yield server
+    server.server.shutdown()
+
+def test_cache_lifetime():
+    assert cache_lifetime(httpx.Headers({"cache-control": "public, max-age=600"}), 3600, 60) == 600
+    assert cache_lifetime(httpx.Headers({"cache-control": "max-age=600", "age": "100"}), 3600, 60) == 500
+    assert cache_lifetime(httpx.Headers({"cache-control": "no-store"}), 3600, 60) == 60
+    assert cache_lifetime(httpx.Headers({"cache-control": "max-age=5"}), 3600, 60) == 60
+    assert cache_lifetime(httpx.Headers(), 3600, 60) == 3600
+
+def test_load_honours_cache_control(stub_server):
+    updates = []
+    cache = OIDCMetadataCache(stub_server.discovery_url, on_update=lambda m, j: updates.append((m, j)))
+    asyncio.run(cache.load())
+    asyncio.run(cache.load())
+    assert stub_server.hits == {"/.well-known/openid-configuration": 1, "/jwks": 1}
+    assert cache.jwks is not None and cache.jwks.expires_at - time.time() == pytest.approx(300, abs=5)
+    assert updates[0][0]["jwks_uri"] == f"{stub_server.url}/jwks"
+    assert updates[0][1]["keys"][0]["kid"] == "k1"
+
+def test_cache_file_warms_new_workers(stub_server, tmp_path):
+    cache_file = str(tmp_path / "oidc.json")
+    asyncio.run(OIDCMetadataCache(stub_server.discovery_url, cache_file=cache_file).load())
+    worker = OIDCMetadataCache(stub_server.discovery_url, cache_file=cache_file)
+    asyncio.run(worker.load())
+    assert worker.is_fresh()
+    assert worker.fetches == 0
+    assert stub_server.hits["/jwks"] == 1
+
+def write_stale_cache_file(cache_file: str, discovery_url: str) -> None:
+    expired = {"body": {"issuer": "stale"}, "fetched_at": time.time() - 700, "expires_at": time.time() - 100}
+    with open(cache_file, "w") as f:
+        json.dump({"discovery_url": discovery_url, "metadata": expired, "jwks": {**expired, "body": {"keys": []}}}, f)
+
+def test_stale_cache_file_is_not_published_when_provider_answers(stub_server, tmp_path):
+    cache_file = str(tmp_path / "oidc.json")
+    write_stale_cache_file(cache_file, stub_server.discovery_url)
+    updates = []
+    cache = OIDCMetadataCache(stub_server.discovery_url, cache_file=cache_file,
+                              on_update=lambda m, j: updates.append((m, j)))
+    asyncio.run(cache.load())
+    assert [metadata["issuer"] for metadata, _ in updates] == [stub_server.url]
+    assert cache.is_fresh()
+
+def test_stale_cache_file_is_fallback_when_provider_fails(tmp_path):
+    discovery_url = "http://127.0.0.1:9/.well-known/openid-configuration"
+    cache_file = str(tmp_path / "oidc.json")
+    write_stale_cache_file(cache_file, discovery_url)
+    cache = OIDCMetadataCache(discovery_url, cache_file=cache_file)
+    assert not asyncio.run(cache.try_load())
+    assert cache.metadata is not None and cache.metadata.body == {"issuer": "stale"}
+
+def test_fetch_rejects_non_object_documents():
+    cache = OIDCMetadataCache("https://provider.test/.well-known/openid-configuration")
+
+    async def fetch():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json=["not", "an", "object"]))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await cache._fetch(client, cache.discovery_url)
+
+    with pytest.raises(ValueError, match="JSON object"):
+        asyncio.run(fetch())
+
+def test_background_refresh(stub_server):
+    stub_server.cache_control["/jwks"] = "max-age=1"
+    cache = OIDCMetadataCache(stub_server.discovery_url, min_ttl=0.2, refresh_margin=0.5)
+
+    async def run():
+        await cache.start()
+        await asyncio.sleep(1.2)
+        await cache.stop()
+
+    asyncio.run(run())
+    assert stub_server.hits["/jwks"] >= 2
+    assert cache.is_fresh()
+
+def test_start_without_provider_does_not_fail():
+    cache = OIDCMetadataCache("http://127.0.0.1:9/.well-known/openid-configuration", min_ttl=60)
+
+    async def run():
+        await cache.start()
+        await cache.stop()
+
+    asyncio.run(run())
+    assert not cache.is_fresh()
+
+def test_lifespan_preloads_authlib_client(stub_server, monkeypatch, tmp_path):
+    import app.auth as auth_mod
+    from app import my_app
+    cache = OIDCMetadataCache(stub_server.discovery_url, on_update=auth_mod._use_google_metadata)
+    monkeypatch.setattr(auth_mod, "google_metadata", cache)
+    monkeypatch.setattr("app.main.google_metadata", cache)
+    monkeypatch.setattr(auth_mod.oauth.google, "server_metadata", {})
+    monkeypatch.setenv("OIDC_PRELOAD", "true")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'oidc.db'}")
+    with TestClient(my_app):
+        assert auth_mod.oauth.google.server_metadata["jwks"]["keys"][0]["kid"] == "k1"
+        assert "_loaded_at" in auth_mod.oauth.google.server_metadata
+    assert stub_server.hits["/jwks"] == 1
+
+def test_first_login_loads_metadata_through_cache(stub_server, monkeypatch):
+    import app.auth as auth_mod
+    cache = OIDCMetadataCache(stub_server.discovery_url, on_update=auth_mod._use_google_metadata)
+    monkeypatch.setattr(auth_mod, "google_metadata", cache)
+    monkeypatch.setattr(auth_mod.oauth.google, "server_metadata", {})
+    metadata = asyncio.run(auth_mod.oauth.google.load_server_metadata())
+    assert metadata["jwks"]["keys"][0]["kid"] == "k1"
+    assert cache.is_fresh()
+    # Loaded once, through the cache; authlib does not fetch the discovery document again
+    asyncio.run(auth_mod.oauth.google.load_server_metadata())
+    assert stub_server.hits == {"/.well-known/openid-configuration": 1, "/jwks": 1}
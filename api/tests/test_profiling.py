@@ -0,0 +1,91 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import my_app
+from app.auth import create_jwt
+from app.db import get_engine, get_session, dispose_engines
+from app.models import User
+from app.profiling import SamplingProfiler, profiler
+from app.users import UserSnapshot
+
+def busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def test_profiler_writes_collapsed_stacks_per_route(tmp_path):
+    p = SamplingProfiler(output_dir=str(tmp_path), interval=0.001, max_overhead=1.0)
+    sampler = p.begin()
+    assert sampler is not None
+    busy(0.05)
+    p.end(sampler, "/api/v1/auth")
+    sampler.join()
+    lines = (tmp_path / "api_v1_auth.collapsed").read_text().splitlines()
+    assert lines
+    assert all(line.startswith("/api/v1/auth;") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("test_profiling.py:busy" in line for line in lines)
+    assert p.stats()["profiled"] == 1
+
+def test_profiler_profiles_one_request_at_a_time(tmp_path):
+    p = SamplingProfiler(output_dir=str(tmp_path), max_overhead=1.0)
+    sampler = p.begin()
+    assert p.begin() is None
+    assert p.stats()["skipped_busy"] == 1
+    p.end(sampler, "/")
+    sampler.join()
+    second = p.begin()
+    assert second is not None
+    p.end(second, "/")
+    second.join()
+
+def test_profiler_respects_overhead_cap(tmp_path):
+    p = SamplingProfiler(output_dir=str(tmp_path), max_overhead=0.01)
+    p.sampling_seconds = 1.0
+    assert p.begin() is None
+    assert p.stats()["skipped_overhead"] == 1
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'profiling.db'}")
+    monkeypatch.setattr(profiler, "output_dir", str(tmp_path / "profiles"))
+    monkeypatch.setattr(profiler, "max_overhead", 1.0)
+    with TestClient(my_app) as c:
+        yield c
+    dispose_engines()
+
+def token_for(email: str, is_admin: bool) -> str:
+    with get_session(get_engine()) as session:
+        user = User(email=email, name="Profiled", is_admin=is_admin)
+        session.add(user)
+        session.commit()
+        return create_jwt(UserSnapshot.from_user(user))
+
+def test_admin_header_profiles_request(client):
+    headers = {"Authorization": f"Bearer {token_for('admin@example.com', True)}", "X-Profile": "1"}
+    response = client.get("/api/v1/auth", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["x-profiled"] == "1"
+
+def test_profile_header_ignored_for_non_admins(client):
+    headers = {"Authorization": f"Bearer {token_for('user@example.com', False)}", "X-Profile": "1"}
+    response = client.get("/api/v1/auth", headers=headers)
+    assert response.status_code == 200
+    assert "x-profiled" not in response.headers
+    assert "x-profiled" not in client.get("/api/v1/healthcheck", headers={"X-Profile": "1"}).headers
+
+def test_authorize_runs_only_for_profile_requests():
+    import asyncio
+    from app.profiling import ProfilingMiddleware
+    authorized = []
+
+    async def authorize(request):
+        authorized.append(request.headers.get("x-profile"))
+        return False
+
+    async def app(scope, receive, send):
+        pass
+
+    middleware = ProfilingMiddleware(app, authorize=authorize, profiler=SamplingProfiler())
+    for headers in ([], [(b"x-profile", b"0")], [(b"authorization", b"Bearer token")], [(b"x-profile", b"1")]):
+        asyncio.run(middleware({"type": "http", "headers": headers}, None, None))
+    assert authorized == ["1"]
@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app import my_app
+from app.ratelimit import Limit, MemoryBackend, RateLimiter, SQLiteBackend, rate_limiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    backend = MemoryBackend(clock=clock)
+    limit = Limit(rate=2, burst=3)
+    assert [backend.acquire("k", limit) for _ in range(3)] == [0, 0, 0]
+    assert backend.acquire("k", limit) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.acquire("k", limit) == 0
+    # Idle time refills the bucket only up to the burst
+    clock.now += 60
+    assert [backend.acquire("k", limit) for _ in range(4)][-1] > 0
+
+def test_memory_backend_evicts_least_recently_used():
+    clock = FakeClock()
+    backend = MemoryBackend(maxsize=2, clock=clock)
+    limit = Limit(rate=1, burst=1)
+    backend.acquire("a", limit)
+    backend.acquire("b", limit)
+    assert backend.acquire("a", limit) > 0
+    backend.acquire("c", limit)
+    assert len(backend) == 2
+    assert backend.evictions == 1
+    # "b" was evicted and starts with a full bucket; "a" was kept
+    assert backend.acquire("b", limit) == 0
+    assert backend.acquire("c", limit) > 0
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite3")
+    limit = Limit(rate=0.001, burst=2)
+    assert SQLiteBackend(path).acquire("k", limit) == 0
+    assert SQLiteBackend(path).acquire("k", limit) == 0
+    assert SQLiteBackend(path).acquire("k", limit) > 0
+
+def test_limiter_raises_429_with_retry_after():
+    limiter = RateLimiter(MemoryBackend(), {"ip": Limit(rate=0.1, burst=1)})
+    asyncio.run(limiter.check("ip", "10.0.0.1"))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(limiter.check("ip", "10.0.0.1"))
+    assert e.value.status_code == 429
+    assert e.value.headers == {"Retry-After": "10"}
+    # Other keys have their own bucket
+    asyncio.run(limiter.check("ip", "10.0.0.2"))
+    assert limiter.stats() == {"enabled": True, "allowed": 2, "limited": 1, "keys": 2, "evictions": 0}
+
+@pytest.fixture
+def strict_limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "backend", MemoryBackend())
+    monkeypatch.setattr(rate_limiter, "limits", {"ip": Limit(rate=0.01, burst=2), "user": Limit(rate=0.01, burst=1)})
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+
+def test_credential_routes_are_limited_per_ip(strict_limits):
+    client = TestClient(my_app)
+    refresh = {"refresh_token": "unknown"}
+    assert [client.post("/api/v1/auth/refresh", json=refresh).status_code for _ in range(2)] == [401, 401]
+    response = client.get("/api/v1/auth/login/google")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    # The polled and public routes, and routes outside auth_router, are not limited
+    assert all(client.get("/api/v1/auth/jwks.json").status_code == 200 for _ in range(5))
+    assert all(client.get("/api/v1/auth").status_code == 401 for _ in range(5))
+    assert client.get("/api/v1/healthcheck").status_code == 200
+
+def test_disabled_limiter_allows_everything(strict_limits, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", False)
+    client = TestClient(my_app)
+    assert all(client.post("/api/v1/auth/refresh", json={"refresh_token": "x"}).status_code == 401 for _ in range(5))
+
+@pytest.mark.parametrize("name", ["RATE_LIMIT_IP_RATE", "RATE_LIMIT_USER_RATE"])
+def test_rates_must_be_positive(name):
+    from app.settings import Settings
+    with pytest.raises(ValueError, match=name):
+        Settings.from_env({name: "0"})
+
+@pytest.mark.parametrize("name", ["RATE_LIMIT_IP_BURST", "RATE_LIMIT_USER_BURST"])
+@pytest.mark.parametrize("value", ["0", "0.5"])
+def test_bursts_must_hold_a_token(name, value):
+    from app.settings import Settings
+    with pytest.raises(ValueError, match=f"{name} must be at least 1"):
+        Settings.from_env({name: value})
+    assert getattr(Settings.from_env({name: "1"}), name.lower()) == 1
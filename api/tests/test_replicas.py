@@ -0,0 +1,101 @@
+import time
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app import my_app
+from app.auth import create_jwt
+from app.db import Base, dispose_engines, get_engine, get_session
+from app.models import User
+from app.replicas import ReplicaRouter, RoutingSession, needs_primary, pin_primary, read_session, run_read
+from app.tokens import encode_token
+from app.users import UserSnapshot, user_cache
+
+USER_ID = uuid.UUID("2b7c0c56-0b0e-4a4e-9d51-3f0f5c1c8a11")
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    """A primary and two replica SQLite files, each holding the same user under a different name."""
+    urls = {name: f"sqlite:///{tmp_path / f'{name}.db'}" for name in ("primary", "replica1", "replica2")}
+    for name, url in urls.items():
+        engine = get_engine(url)
+        Base.metadata.create_all(engine)
+        with get_session(engine) as session:
+            session.add(User(id=USER_ID, email="replicated@example.com", name=name))
+            session.commit()
+    monkeypatch.setenv("DATABASE_URL", urls["primary"])
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", f"{urls['replica1']},{urls['replica2']}")
+    yield urls
+    dispose_engines()
+
+def read_name(session) -> str:
+    return session.get(User, USER_ID).name
+
+def test_round_robin_reads_from_replicas(databases):
+    router = ReplicaRouter()
+    engines = [get_engine(databases["replica1"]), get_engine(databases["replica2"])]
+    names = []
+    for _ in range(4):
+        with RoutingSession(get_engine(), engines, router=router) as session:
+            names.append(read_name(session))
+    assert names == ["replica1", "replica2", "replica1", "replica2"]
+    assert router.stats()["replica_reads"] == 4
+
+def test_least_connections_avoids_busy_replica(databases):
+    router = ReplicaRouter("least_connections")
+    busy, idle = get_engine(databases["replica1"]), get_engine(databases["replica2"])
+    with busy.connect():
+        with RoutingSession(get_engine(), [busy, idle], router=router) as session:
+            assert read_name(session) == "replica2"
+
+def test_writes_and_later_reads_use_the_primary(databases):
+    with read_session() as session:
+        assert read_name(session) in ("replica1", "replica2")
+        session.add(User(email="written@example.com", name="Written"))
+        session.commit()
+        assert session.use_primary
+        assert read_name(session) == "primary"
+    with get_session(get_engine()) as session:
+        assert session.scalars(select(User).filter_by(email="written@example.com")).one()
+    with get_session(get_engine(databases["replica1"])) as session:
+        assert session.scalars(select(User).filter_by(email="written@example.com")).first() is None
+
+def test_failed_replica_is_ejected(databases, tmp_path, monkeypatch):
+    # A replica whose file cannot be opened fails like an unreachable server
+    broken = f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    monkeypatch.setenv("DATABASE_REPLICA_URLS", broken)
+    router = ReplicaRouter(eject_seconds=60)
+    monkeypatch.setattr("app.replicas.replica_router", router)
+    assert run_read(read_name) == "primary"
+    assert router.stats()["ejections"] == 1
+    # Ejected: the next read goes straight to the primary
+    with read_session() as session:
+        assert read_name(session) == "primary"
+        assert session.replica is None
+    assert router.stats()["ejected"] == 1
+
+def test_use_primary_without_replicas(databases, monkeypatch):
+    monkeypatch.delenv("DATABASE_REPLICA_URLS")
+    with read_session() as session:
+        assert read_name(session) == "primary"
+
+def test_needs_primary_after_login():
+    user_id = uuid.uuid4()
+    assert not needs_primary(user_id, {"iat": int(time.time()) - 3600})
+    assert needs_primary(user_id, {"iat": int(time.time())})
+    pin_primary(user_id)
+    assert needs_primary(user_id)
+
+def test_auth_reads_your_writes_after_login(databases):
+    snapshot = UserSnapshot(USER_ID, "replicated@example.com", "primary", None, True, False)
+    token = create_jwt(snapshot)
+    client = TestClient(my_app)
+    user_cache.invalidate(USER_ID)
+    # The token was just issued, so the user is read from the primary
+    assert client.get("/api/v1/auth", headers={"Authorization": f"Bearer {token}"}).json()["name"] == "primary"
+    user_cache.invalidate(USER_ID)
+    # An older token reads from a replica
+    old_token = encode_token({"sub": str(USER_ID), "email": "replicated@example.com", "name": "primary",
+                              "iat": int(time.time()) - 3600, "exp": int(time.time()) + 3600})
+    response = client.get("/api/v1/auth", headers={"Authorization": f"Bearer {old_token}"})
+    assert response.json()["name"] in ("replica1", "replica2")
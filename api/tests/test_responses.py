@@ -0,0 +1,24 @@
+import datetime
+import json
+import pytest
+from app.responses import etag_matches, json_response_class, make_etag
+
+def test_etag_matches():
+    etag = make_etag("a", 1, None)
+    assert etag != make_etag("a", 1, "None ")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"x", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"x"', etag)
+
+def test_response_classes_render_the_same_bytes():
+    pytest.importorskip("orjson")
+    body = {"email": "ü@example.com", "last_login": datetime.datetime(2025, 1, 2).isoformat(), "n": [1, 2.5, None]}
+    rendered = json_response_class("orjson")(body).body
+    assert rendered == json_response_class("json")(body).body
+    assert json.loads(rendered) == body
+
+def test_unknown_response_class():
+    with pytest.raises(RuntimeError):
+        json_response_class("ujson")
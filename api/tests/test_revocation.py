@@ -0,0 +1,109 @@
+import asyncio
+import datetime
+import time
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app import my_app
+from app.auth import create_jwt
+from app.db import Base, dispose_engines, get_engine, get_session
+from app.models import TokenRevocation
+from app.revocation import BloomFilter, RevocationList, revocations, revoke_token, revoke_user
+from app.tokens import decode_token
+from app.users import UserSnapshot
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [uuid.uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+    # About 10 bits per item at 1%
+    assert len(bloom.bits) < 1300
+
+def test_revoked_token_and_user():
+    now = datetime.datetime.utcnow()
+    user_id = uuid.uuid4()
+    revocation_list = RevocationList()
+    revocation_list.add([
+        TokenRevocation(jti="revoked", revoked_at=now, expires_at=now + datetime.timedelta(hours=1)),
+        TokenRevocation(user_id=user_id, revoked_at=now, expires_at=now + datetime.timedelta(hours=1)),
+    ])
+    issued = int(time.time())
+    assert revocation_list.is_revoked({"jti": "revoked", "sub": str(uuid.uuid4()), "iat": issued})
+    assert not revocation_list.is_revoked({"jti": "valid", "sub": str(uuid.uuid4()), "iat": issued})
+    # Tokens issued to the user before the revocation are revoked, later ones (after a new login) are not
+    assert revocation_list.is_revoked({"jti": "old", "sub": str(user_id), "iat": issued - 60})
+    assert not revocation_list.is_revoked({"jti": "new", "sub": str(user_id), "iat": issued + 60})
+    assert revocation_list.stats()["rejected"] == 2
+
+def test_compact_drops_expired_revocations():
+    now = datetime.datetime.utcnow()
+    revocation_list = RevocationList()
+    revocation_list.add([
+        TokenRevocation(jti="expired", revoked_at=now, expires_at=now - datetime.timedelta(seconds=1)),
+        TokenRevocation(jti="current", revoked_at=now, expires_at=now + datetime.timedelta(hours=1)),
+    ])
+    revocation_list.compact()
+    assert revocation_list.stats()["tokens"] == 1
+    assert revocation_list.is_revoked({"jti": "current"})
+
+def test_bloom_filter_grows_with_revocations():
+    now = datetime.datetime.utcnow()
+    revocation_list = RevocationList(capacity=10)
+    revocation_list.add(
+        TokenRevocation(jti=str(i), revoked_at=now, expires_at=now + datetime.timedelta(hours=1)) for i in range(100)
+    )
+    assert all(revocation_list.is_revoked({"jti": str(i)}) for i in range(100))
+    assert revocation_list.stats()["bloom_bytes"] > BloomFilter(10).size // 8
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'revocation.db'}")
+    Base.metadata.create_all(get_engine())
+    yield
+    revocations.clear()
+    dispose_engines()
+
+def test_refresh_loads_new_revocations_incrementally(db):
+    revocation_list = RevocationList()
+    with get_session(get_engine()) as session:
+        revoke_token(session, "first")
+        session.commit()
+    asyncio.run(revocation_list.refresh())
+    with get_session(get_engine()) as session:
+        revoke_user(session, uuid.uuid4())
+        revoke_token(session, "second")
+        session.commit()
+    asyncio.run(revocation_list.refresh())
+    stats = revocation_list.stats()
+    assert (stats["tokens"], stats["users"], stats["refreshes"]) == (2, 1, 2)
+
+def test_user_revocation_covers_tokens_issued_in_the_same_second(db):
+    user_id = uuid.uuid4()
+    issued = int(time.time())
+    with get_session(get_engine()) as session:
+        revocation = revoke_user(session, user_id)
+        session.commit()
+        assert revocation.revoked_at.microsecond == 0
+    revocation_list = RevocationList()
+    asyncio.run(revocation_list.refresh())
+    assert revocation_list.is_revoked({"jti": "same-second", "sub": str(user_id), "iat": issued})
+
+def test_auth_rejects_revoked_token(db, monkeypatch):
+    # Served from the token's claims alone: revocation is enforced without looking the user up
+    monkeypatch.setattr("app.auth.TRUST_JWT_CLAIMS", True)
+    user = UserSnapshot(uuid.uuid4(), "revoked@example.com", "Revoked", None, True, False)
+    token = create_jwt(user)
+    with TestClient(my_app) as client:
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/api/v1/auth", headers=headers).status_code == 200
+        with get_session(get_engine()) as session:
+            revoke_token(session, decode_token(token)["jti"])
+            session.commit()
+        asyncio.run(revocations.refresh())
+        response = client.get("/api/v1/auth", headers=headers)
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Token revoked"
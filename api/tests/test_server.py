@@ -0,0 +1,106 @@
+import os
+import sys
+import signal
+import socket
+import time
+import pathlib
+import subprocess
+import http.client
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+from app import my_app
+from app.db import dispose_engines, pool_stats
+from app.health import readiness
+from app.metrics import registry
+from app.server import STOP_SIGNALS, DrainingServer, Master
+
+SRC_DIR = pathlib.Path(__file__).resolve().parent.parent / "src"
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'server.db'}")
+    yield
+    dispose_engines()
+    readiness.reset()
+
+def test_warm_up_opens_pool_without_counting_requests(database):
+    registry.reset()
+    with TestClient(my_app):
+        stats = pool_stats()
+        assert stats["checked_in"] == stats["size"]
+        assert registry.requests == {}
+
+def test_drain_delays_exit_and_fails_readiness(database):
+    server = DrainingServer(uvicorn.Config(my_app), drain_seconds=60)
+    server.handle_exit(signal.SIGTERM, None)
+    assert not readiness.accepting
+    assert not server.should_exit
+    # Repeated by the master: still draining
+    server.handle_exit(signal.SIGTERM, None)
+    assert not server.should_exit
+    assert server.drain_deadline > time.monotonic() + 59
+
+def test_second_interrupt_stops_without_drain(database):
+    server = DrainingServer(uvicorn.Config(my_app), drain_seconds=60)
+    server.handle_exit(signal.SIGINT, None)
+    server.handle_exit(signal.SIGINT, None)
+    assert server.should_exit
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def ready(port: int) -> bool:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", "/api/v1/health/ready")
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+def test_serve_starts_workers_and_stops_on_sigterm(tmp_path):
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(SRC_DIR), os.environ.get("PYTHONPATH", "")]),
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'serve.db'}",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--workers", "2", "--port", str(port), "--drain-seconds", "0.2"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while not ready(port):
+            assert process.poll() is None and time.monotonic() < deadline
+            time.sleep(0.05)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+    log = process.stderr.read()
+    assert log.count("Application startup complete") == 2
+    assert log.count("Application shutdown complete") == 2
+
+def test_spawn_blocks_stop_signals_around_fork(monkeypatch):
+    master = Master(uvicorn.Config(my_app), workers=1, drain_seconds=0, graceful_timeout=0)
+    master.sock = socket.socket()
+    blocked = []
+
+    def fork():
+        blocked.append(signal.pthread_sigmask(signal.SIG_BLOCK, []))
+        return 12345
+
+    monkeypatch.setattr(os, "fork", fork)
+    try:
+        master.spawn()
+    finally:
+        master.sock.close()
+    assert STOP_SIGNALS <= blocked[0]
+    assert not STOP_SIGNALS & signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    assert 12345 in master.children
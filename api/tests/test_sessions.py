@@ -0,0 +1,71 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from app.sessions import MemorySessionStore, SQLiteSessionStore, ScopedSessionMiddleware
+
+def test_memory_store_roundtrip_and_expiry():
+    store = MemorySessionStore()
+    store.save("a", {"state": "x"}, ttl=60)
+    store.save("b", {"state": "y"}, ttl=-1)
+    assert store.load("a") == {"state": "x"}
+    assert store.load("b") is None
+    store.delete("a")
+    assert store.load("a") is None
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    SQLiteSessionStore(path).save("a", {"state": "x"}, ttl=60)
+    other = SQLiteSessionStore(path)
+    assert other.load("a") == {"state": "x"}
+    other.save("b", {"state": "y"}, ttl=-1)
+    assert other.load("b") is None
+    other.delete("a")
+    assert SQLiteSessionStore(path).load("a") is None
+
+async def set_state(request: Request):
+    request.session["state"] = request.query_params["value"]
+    return JSONResponse({})
+
+async def pop_state(request: Request):
+    return JSONResponse({"state": request.session.pop("state", None)})
+
+async def other(request: Request):
+    return JSONResponse({"has_session": "session" in request.scope})
+
+def make_client(store) -> TestClient:
+    app = Starlette(routes=[
+        Route("/oauth/login", set_state),
+        Route("/oauth/callback", pop_state),
+        Route("/other", other),
+    ])
+    app.add_middleware(ScopedSessionMiddleware, secret_key="secret", paths=["/oauth/"], store=store)
+    return TestClient(app)
+
+@pytest.mark.parametrize("store", [None, MemorySessionStore()], ids=["cookie", "memory"])
+def test_session_survives_login_roundtrip(store):
+    client = make_client(store)
+    response = client.get("/oauth/login?value=abc")
+    if store is not None:
+        # Only a short random id is sent, not the (signed) session data
+        assert len(response.cookies["session"]) < 30
+    assert client.get("/oauth/callback").json() == {"state": "abc"}
+    # The session was emptied by the callback, so it is gone from the store
+    assert client.get("/oauth/callback").json() == {"state": None}
+
+def test_other_paths_skip_the_session():
+    client = make_client(MemorySessionStore())
+    client.get("/oauth/login?value=abc")
+    response = client.get("/other")
+    assert response.json() == {"has_session": False}
+    assert "set-cookie" not in response.headers
+
+def test_unknown_session_id_gets_a_new_id():
+    store = MemorySessionStore()
+    client = make_client(store)
+    client.cookies.set("session", "forged")
+    response = client.get("/oauth/login?value=abc")
+    assert response.cookies["session"] != "forged"
+    assert store.load("forged") is None
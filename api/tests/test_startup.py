@@ -0,0 +1,23 @@
+import os
+import sys
+import json
+import pathlib
+import subprocess
+import app
+
+SRC_DIR = pathlib.Path(app.__file__).resolve().parent.parent
+WEB_STACK = ("fastapi", "starlette", "authlib", "jose", "httpx", "uvicorn")
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(SRC_DIR), os.environ.get("PYTHONPATH", "")])}
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+def imported_packages(module: str) -> set[str]:
+    code = f"import sys, json, {module}; print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}})))"
+    return set(json.loads(run_python("-c", code).stdout))
+
+def test_cli_does_not_import_web_stack():
+    assert imported_packages("cli.admin").isdisjoint(WEB_STACK)
+
+def test_app_defers_oauth_client_and_jwt_libraries():
+    assert imported_packages("app.main").isdisjoint({"authlib", "jose"})
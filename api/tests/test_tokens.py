@@ -0,0 +1,122 @@
+import time
+import pytest
+from app import tokens
+from app.tokens import TokenError, configure_jwt, decode_token, encode_token, token_cache
+
+SECRET = "token-test-secret-of-at-least-32-bytes"
+
+@pytest.fixture(autouse=True)
+def jwt_secret(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", SECRET)
+    configure_jwt()
+    yield
+    monkeypatch.undo()
+    configure_jwt()
+
+def test_decode_caches_verified_claims(monkeypatch):
+    token = encode_token({"sub": "abc", "exp": int(time.time()) + 3600})
+    assert decode_token(token)["sub"] == "abc"
+    def fail(token):
+        raise AssertionError("token should have been served from the cache")
+    monkeypatch.setattr(tokens, "verify_token", fail)
+    assert decode_token(token)["sub"] == "abc"
+
+def test_claims_are_read_only():
+    claims = decode_token(encode_token({"sub": "abc", "exp": int(time.time()) + 3600}))
+    with pytest.raises(TypeError):
+        claims["sub"] = "other"  # type: ignore[index]
+
+def test_nearly_expired_token_is_not_cached():
+    before = len(token_cache)
+    decode_token(encode_token({"sub": "abc", "exp": int(time.time()) + 2}))
+    assert len(token_cache) == before
+
+def test_invalid_token_raises():
+    with pytest.raises(TokenError):
+        decode_token("invalidtoken")
+    with pytest.raises(TokenError):
+        decode_token(encode_token({"sub": "abc", "exp": int(time.time()) - 10}))
+
+def test_configure_jwt_clears_cache(monkeypatch):
+    token = encode_token({"sub": "abc", "exp": int(time.time()) + 3600})
+    decode_token(token)
+    monkeypatch.setenv("JWT_SECRET", "rotated-secret")
+    configure_jwt()
+    with pytest.raises(TokenError):
+        decode_token(token)
+
+def write_pem(path, key):
+    from cryptography.hazmat.primitives import serialization
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                       serialization.NoEncryption()))
+    return str(path)
+
+def write_public_pem(path, key):
+    from cryptography.hazmat.primitives import serialization
+    path.write_bytes(key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                   serialization.PublicFormat.SubjectPublicKeyInfo))
+    return str(path)
+
+@pytest.fixture
+def rsa_keys(tmp_path):
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    old, new = (rsa.generate_private_key(public_exponent=65537, key_size=2048) for _ in range(2))
+    return {"old": (old, write_pem(tmp_path / "old.pem", old)), "new": (new, write_pem(tmp_path / "new.pem", new))}
+
+@pytest.mark.parametrize("backend", ["jose", "pyjwt", "stdlib"])
+def test_hs256_backends_round_trip(backend):
+    config = tokens.load_jwt_config({"JWT_BACKEND": backend, "JWT_SECRET": SECRET})
+    token = config.codec.encode({"sub": "abc", "exp": int(time.time()) + 60}, config.signing_key, "HS256", None)
+    # Tokens are interchangeable between backends
+    for other in tokens.CODECS:
+        other_config = tokens.load_jwt_config({"JWT_BACKEND": other, "JWT_SECRET": SECRET})
+        assert other_config.codec.decode(token, other_config.verify_keys, "HS256")["sub"] == "abc"
+
+@pytest.mark.parametrize("backend", ["jose", "pyjwt", "stdlib"])
+def test_backends_reject_bad_tokens(backend):
+    config = tokens.load_jwt_config({"JWT_BACKEND": backend, "JWT_SECRET": SECRET})
+    other = tokens.load_jwt_config({"JWT_BACKEND": backend, "JWT_SECRET": "another-secret-of-at-least-32-bytes"})
+    forged = other.codec.encode({"sub": "abc"}, other.signing_key, "HS256", None)
+    expired = config.codec.encode({"sub": "abc", "exp": int(time.time()) - 10}, config.signing_key, "HS256", None)
+    for token in (forged, expired, "invalidtoken", "a.b.c"):
+        with pytest.raises(TokenError):
+            config.codec.decode(token, config.verify_keys, "HS256")
+
+@pytest.mark.parametrize("backend", ["jose", "pyjwt"])
+def test_rs256_key_rotation(backend, rsa_keys, tmp_path):
+    old_env = {"JWT_BACKEND": backend, "JWT_ALGORITHM": "RS256", "JWT_KEY_ID": "old",
+               "JWT_PRIVATE_KEY_FILE": rsa_keys["old"][1]}
+    configure_jwt(tokens.load_jwt_config(old_env))
+    old_token = encode_token({"sub": "abc"})
+    new_env = {"JWT_BACKEND": backend, "JWT_ALGORITHM": "RS256", "JWT_KEY_ID": "new",
+               "JWT_PRIVATE_KEY_FILE": rsa_keys["new"][1],
+               "JWT_PUBLIC_KEY_FILES": f"old={write_public_pem(tmp_path / 'old.pub', rsa_keys['old'][0])}"}
+    configure_jwt(tokens.load_jwt_config(new_env))
+    assert decode_token(old_token)["sub"] == "abc"
+    assert decode_token(encode_token({"sub": "def"}))["sub"] == "def"
+    configure_jwt(tokens.load_jwt_config({**new_env, "JWT_PUBLIC_KEY_FILES": ""}))
+    with pytest.raises(TokenError):
+        decode_token(old_token)
+
+def test_eddsa_and_jwks(tmp_path):
+    import jwt as pyjwt
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+    key = ed25519.Ed25519PrivateKey.generate()
+    config = configure_jwt(tokens.load_jwt_config({
+        "JWT_BACKEND": "pyjwt", "JWT_ALGORITHM": "EdDSA", "JWT_KEY_ID": "ed1",
+        "JWT_PRIVATE_KEY_FILE": write_pem(tmp_path / "ed.pem", key),
+    }))
+    token = encode_token({"sub": "abc"})
+    jwks = tokens.public_jwks(config)
+    assert jwks["keys"][0]["kid"] == "ed1"
+    # A downstream service verifies the token from the published JWKS alone
+    public_key = pyjwt.PyJWK(jwks["keys"][0]).key
+    assert pyjwt.decode(token, public_key, algorithms=["EdDSA"])["sub"] == "abc"
+
+def test_unsupported_configuration():
+    with pytest.raises(RuntimeError):
+        tokens.load_jwt_config({"JWT_BACKEND": "stdlib", "JWT_ALGORITHM": "RS256"})
+    with pytest.raises(RuntimeError):
+        tokens.load_jwt_config({"JWT_BACKEND": "nope"})
+    with pytest.raises(RuntimeError):
+        tokens.load_jwt_config({"JWT_BACKEND": "pyjwt", "JWT_ALGORITHM": "RS256"})
@@ -1,15 +1,18 @@
 import os
 import sys
+import json
 import subprocess
 import uuid
 import pytest
-from app.db import Base, get_engine
+from sqlalchemy import select
+from app.db import Base, get_engine, get_session
+from app.models import TokenRevocation
 
-def run_cli(args, db_url):
+def run_cli(args, db_url, input=None):
     env = os.environ.copy()
     env["DATABASE_URL"] = db_url
     cmd = [sys.executable, "-m", "cli.admin"] + args
-    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env, input=input)
     return result
 
 @pytest.fixture
@@ -63,4 +66,104 @@ def test_user_del_dry_run(sqlite_db_url):
     assert "[DRY RUN]" in result.stdout
     # Should not actually delete
     result = run_cli(["user", "list"], sqlite_db_url)
-    assert "dry@example.com" in result.stdout 
\ No newline at end of file
+    assert "dry@example.com" in result.stdout 
+
+def test_user_import_csv_and_export_jsonl(sqlite_db_url, tmp_path):
+    csv_file = tmp_path / "users.csv"
+    csv_file.write_text("email,name,is_admin\na@example.com,Alice,true\nb@example.com,,\n")
+    result = run_cli(["user", "import", "-b", "1", str(csv_file)], sqlite_db_url)
+    assert "Users imported: 2" in result.stdout
+    result = run_cli(["user", "export", "--format", "jsonl"], sqlite_db_url)
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [(r["email"], r["name"], r["is_admin"]) for r in records] == [
+        ("a@example.com", "Alice", True),
+        ("b@example.com", "b@example.com", False),
+    ]
+
+def test_user_import_jsonl_stdin_skips_or_overwrites_existing(sqlite_db_url):
+    run_cli(["user", "add", "-u", "Old Name", "a@example.com"], sqlite_db_url)
+    data = '{"email": "a@example.com", "name": "New Name"}\n{"email": "c@example.com"}\n'
+    result = run_cli(["user", "import", "--format", "jsonl", "-"], sqlite_db_url, input=data)
+    assert "Rows read: 2" in result.stdout
+    assert "Users imported: 1" in result.stdout
+    result = run_cli(["user", "list"], sqlite_db_url)
+    assert "Old Name" in result.stdout
+    assert "c@example.com" in result.stdout
+    result = run_cli(["-f", "user", "import", "--format", "jsonl"], sqlite_db_url, input=data)
+    assert "Users imported or updated: 2" in result.stdout
+    result = run_cli(["user", "list"], sqlite_db_url)
+    assert "New Name" in result.stdout
+
+def test_user_import_repeated_email_in_one_batch(sqlite_db_url):
+    data = '{"email": "a@example.com", "name": "First"}\n{"email": "a@example.com", "name": "Last"}\n'
+    result = run_cli(["user", "import", "--format", "jsonl"], sqlite_db_url, input=data)
+    assert "Rows read: 2" in result.stdout
+    assert "Users imported: 1" in result.stdout
+    assert "First" in run_cli(["user", "list"], sqlite_db_url).stdout
+    run_cli(["-f", "user", "import", "--format", "jsonl"], sqlite_db_url, input=data)
+    assert "Last" in run_cli(["user", "list"], sqlite_db_url).stdout
+
+def test_user_add_force_keeps_user_id(sqlite_db_url):
+    run_cli(["user", "add", "-u", "Old Name", "keep@example.com"], sqlite_db_url)
+    before = json.loads(run_cli(["user", "export", "--format", "jsonl"], sqlite_db_url).stdout)
+    run_cli(["-f", "user", "add", "-u", "New Name", "keep@example.com"], sqlite_db_url)
+    after = json.loads(run_cli(["user", "export", "--format", "jsonl"], sqlite_db_url).stdout)
+    assert after["id"] == before["id"]
+    assert after["name"] == "New Name"
+    # Replacing the user resets its flags, so the tokens issued with the old ones are revoked
+    with get_session(get_engine(sqlite_db_url)) as session:
+        revocation = session.scalars(select(TokenRevocation)).one()
+    assert str(revocation.user_id) == before["id"]
+
+def test_user_import_dry_run_and_invalid_rows(sqlite_db_url, tmp_path):
+    jsonl_file = tmp_path / "users.jsonl"
+    jsonl_file.write_text('{"email": "a@example.com"}\n')
+    result = run_cli(["-n", "user", "import", str(jsonl_file)], sqlite_db_url)
+    assert "[DRY RUN] Would import 1 users" in result.stdout
+    jsonl_file.write_text('{"email": "a@example.com"}\n{"name": "No Email"}\n')
+    result = run_cli(["user", "import", str(jsonl_file)], sqlite_db_url)
+    assert result.returncode == 1
+    assert "no users imported" in result.stdout
+    result = run_cli(["user", "list"], sqlite_db_url)
+    assert "No users found" in result.stdout
+
+@pytest.mark.parametrize("line", ["[]", '"x"', "1"])
+def test_user_import_rejects_non_object_lines(sqlite_db_url, line):
+    data = f'{{"email": "a@example.com"}}\n{line}\n'
+    result = run_cli(["user", "import", "--format", "jsonl"], sqlite_db_url, input=data)
+    assert result.returncode == 1
+    assert f"Import failed, no users imported: Line 2 is not a JSON object: {line}" in result.stdout
+    assert "Traceback" not in result.stderr
+
+def test_user_export_csv_file(sqlite_db_url, tmp_path):
+    run_cli(["user", "add", "-u", "Test User", "test@example.com"], sqlite_db_url)
+    out = tmp_path / "users.csv"
+    run_cli(["user", "export", str(out)], sqlite_db_url)
+    lines = out.read_text().splitlines()
+    assert lines[0] == "id,email,name,is_active,is_admin,last_login"
+    assert ",test@example.com,Test User,True,False," in lines[1]
+
+def test_revoke_token_and_user(sqlite_db_url):
+    from app.db import get_session
+    from app.models import TokenRevocation
+    run_cli(["user", "add", "revoked@example.com"], sqlite_db_url)
+    result = run_cli(["revoke", "token", "0123456789abcdef"], sqlite_db_url)
+    assert "Token revoked" in result.stdout
+    result = run_cli(["revoke", "user", "revoked@example.com"], sqlite_db_url)
+    assert "Tokens revoked for user" in result.stdout
+    result = run_cli(["revoke", "user", "nobody@example.com"], sqlite_db_url)
+    assert result.returncode == 1
+    with get_session(get_engine(sqlite_db_url)) as session:
+        rows = session.query(TokenRevocation).all()
+    assert [row.jti for row in rows] == ["0123456789abcdef", None]
+    assert rows[1].user_id is not None
+
+def test_user_changes_are_audited(sqlite_db_url, tmp_path, monkeypatch):
+    audit_path = tmp_path / "audit.jsonl"
+    monkeypatch.setenv("AUDIT_LOG_PATH", str(audit_path))
+    run_cli(["user", "add", "-u", "Audited", "audited@example.com"], sqlite_db_url)
+    run_cli(["user", "del", "audited@example.com"], sqlite_db_url)
+    records = [json.loads(line) for line in audit_path.read_text().splitlines()]
+    assert [record["event"] for record in records] == ["user_created", "user_deleted"]
+    assert records[0]["email"] == "audited@example.com" and records[0]["source"] == "cli"
+    assert records[0]["user_id"] == records[1]["user_id"]
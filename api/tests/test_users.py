@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy import event
+from app import users
+from app.db import Base, get_engine, get_session, dispose_engines
+from app.models import User
+from app.users import find_or_create_user, user_cache
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    dispose_engines()
+
+def capture_statements(engine) -> list[str]:
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+def test_login_is_a_single_upsert(engine):
+    statements = capture_statements(engine)
+    with get_session(engine) as session:
+        created = find_or_create_user(session, "upsert@example.com", "Upsert User")
+    with get_session(engine) as session:
+        updated = find_or_create_user(session, "upsert@example.com", None)
+    assert updated.id == created.id
+    assert updated.name == "Upsert User"
+    assert updated.last_login is not None and created.last_login is not None
+    assert updated.last_login >= created.last_login
+    assert len(statements) == 2
+    assert all(s.startswith("INSERT") and "ON CONFLICT" in s and "RETURNING" in s for s in statements)
+    assert user_cache.get(created.id) == updated
+
+def test_login_updates_name(engine):
+    with get_session(engine) as session:
+        find_or_create_user(session, "rename@example.com", "Old Name")
+    with get_session(engine) as session:
+        assert find_or_create_user(session, "rename@example.com", "New Name").name == "New Name"
+        assert session.query(User).filter_by(email="rename@example.com").one().name == "New Name"
+
+def test_login_fallback_without_upsert(engine, monkeypatch):
+    monkeypatch.setattr(users, "UPSERT_DIALECTS", {})
+    statements = capture_statements(engine)
+    with get_session(engine) as session:
+        created = find_or_create_user(session, "fallback@example.com", "Fallback User")
+    with get_session(engine) as session:
+        updated = find_or_create_user(session, "fallback@example.com", "Fallback Renamed")
+    assert updated.id == created.id
+    assert updated.name == "Fallback Renamed"
+    assert any(s.startswith("SELECT") for s in statements)
+
+def test_login_without_touching_last_login(engine):
+    with get_session(engine) as session:
+        created = find_or_create_user(session, "notouch@example.com", "No Touch")
+    statements = capture_statements(engine)
+    with get_session(engine) as session:
+        same = find_or_create_user(session, "notouch@example.com", "No Touch", touch_last_login=False)
+        unnamed = find_or_create_user(session, "notouch@example.com", None, touch_last_login=False)
+        renamed = find_or_create_user(session, "notouch@example.com", "Renamed", touch_last_login=False)
+    # Unchanged users are found by the upsert itself, without a second SELECT
+    assert len(statements) == 3
+    assert all(s.startswith("INSERT") and "RETURNING" in s for s in statements)
+    assert same.last_login == created.last_login
+    assert unnamed.name == "No Touch"
+    assert same.last_login == created.last_login
+    assert renamed.last_login == created.last_login
+    assert renamed.name == "Renamed"